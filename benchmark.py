@@ -0,0 +1,68 @@
+# -*- coding: UTF_8 -*-
+import io
+import os
+import resource
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from multiprocessing import get_context
+
+# Benchmark of the extraction on synthetic raw.udt files (see udt_extract/ubt_raw_synthetic.py)
+# usage: python benchmark.py [file size in MB]
+SIZE = float(sys.argv[1]) * 1e6 if len(sys.argv) > 1 else 20e6 # bytes
+
+# synthetic files: arguments of write_synthetic
+FILES = {
+    "apf04 avg 2 configs": {"_board": "apf04", "_n_configs": 2, "_n_cells": 150},
+    "apf06 inst 4 rx": {"_board": "apf06", "_n_channels": 4, "_n_cells": 150},
+    "apf06 iq 4 rx": {"_board": "apf06", "_n_channels": 4, "_n_cells": 50, "_profile_type": "iq", "_n_p": 16},
+}
+
+# extraction modes: arguments of raw_extract
+MODES = {
+    "legacy": {"_batch_size": None},
+    "batch": {},
+    "columnar": {"_columnar": True},
+    "2 processes": {"_processes": 2},
+}
+
+def run(path, kwargs):
+    # run in a new process, so that the peak RSS is the one of this extraction
+    from udt_extract.raw_extract import raw_extract
+    from udt_extract.ubt_raw_stats import ubt_stats
+    stats = ubt_stats()
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        result = raw_extract(path, _max_size=None, _stats=stats, **kwargs)
+    duration = time.perf_counter() - start
+    profiles = 0
+    for config in result[4].values():
+        # the channels of a configuration share the profiles
+        datatype = next(iter(next(iter(config.values())).values()))
+        profiles += len(datatype["time"])
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 # ko sous Linux
+    return duration, profiles, peak_rss, stats.report()
+
+
+if __name__ == "__main__":
+    from udt_extract.ubt_raw_synthetic import write_synthetic
+
+    directory = tempfile.mkdtemp(prefix="udt_benchmark")
+    pool = get_context("spawn").Pool(1, maxtasksperchild=1)
+    for file_name, file_kwargs in FILES.items():
+        path = os.path.join(directory, file_name.replace(" ", "_") + ".udt")
+        write_synthetic(path, _size=SIZE, **file_kwargs)
+        size = os.path.getsize(path)
+        print("=============\n%s: %.1f MB\n=============" % (file_name, size / 1e6))
+        print("%-12s %10s %12s %9s %10s" % ("mode", "time (s)", "profiles/s", "MB/s", "peak RSS"))
+        for mode, kwargs in MODES.items():
+            duration, profiles, peak_rss, report = pool.apply(run, (path, kwargs))
+            print("%-12s %10.3f %12.0f %9.1f %7.0f MB" % (mode, duration, profiles / duration, size / 1e6 / duration, peak_rss / 1e6))
+            # time spent in each decode stage (see udt_extract/ubt_raw_stats.py), in all the processes
+            for stage, measures in sorted(report["stages"].items(), key=lambda item: -item[1]["time"]):
+                print("    %-12s %8.3f s %8d calls" % (stage, measures["time"], measures["calls"]))
+        os.remove(path)
+    pool.close()
+    pool.join()
+    os.rmdir(directory)
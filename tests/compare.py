@@ -0,0 +1,47 @@
+# -*- coding: UTF_8 -*-
+
+# comparaison des résultats de raw_extract entre modes d'extraction (listes ou colonnes, lots, process)
+
+import numpy as np
+
+
+def as_array(_data):
+    # liste de profils (ou de dicts IQ) ou colonne, en un tableau (ou un dict de tableaux)
+    if isinstance(_data, dict):
+        return {key: np.asarray(value) for key, value in _data.items()}
+    if len(_data) and isinstance(_data[0], dict):
+        return {key: np.stack([value[key] for value in _data]) for key in _data[0]}
+    return np.asarray(_data)
+
+
+def assert_same_entry(_entry, _reference, _path=""):
+    data, reference = as_array(_entry["data"]), as_array(_reference["data"])
+    if isinstance(reference, dict):
+        assert isinstance(data, dict) and data.keys() == reference.keys(), _path
+        for key in reference:
+            assert np.array_equal(data[key], reference[key]), _path + "/" + key
+    else:
+        assert data.shape == reference.shape, _path
+        assert np.array_equal(data.astype(float), reference.astype(float), equal_nan=True), _path
+    assert np.array_equal(np.asarray(_entry["time"], dtype="datetime64[us]"),
+                          np.asarray(_reference["time"], dtype="datetime64[us]")), _path
+
+
+def assert_same_result(_result, _reference):
+    """Function that checks that two results of raw_extract give the same data (whatever the storage mode).
+    """
+    assert _result[0] == _reference[0]
+    assert _result[1] == _reference[1] and _result[2] == _reference[2]
+    assert _result[3] == _reference[3]
+    data_us, reference = _result[4], _reference[4]
+    assert data_us.keys() == reference.keys()
+    for config in reference:
+        assert data_us[config].keys() == reference[config].keys()
+        for channel in reference[config]:
+            assert data_us[config][channel].keys() == reference[config][channel].keys()
+            for datatype, entry in reference[config][channel].items():
+                assert_same_entry(data_us[config][channel][datatype], entry, "%d/%d/%s" % (config, channel, datatype))
+    assert _result[5].keys() == _reference[5].keys()
+    for datatype, entry in _reference[5].items():
+        assert_same_entry(_result[5][datatype], entry, datatype)
+    assert _result[6] == _reference[6]
@@ -0,0 +1,77 @@
+# -*- coding: UTF_8 -*-
+
+# décodage par lots : mêmes données que la lecture profil par profil (_batch_size=None), quels que soient les modes
+
+import os
+
+import numpy as np
+import pytest
+
+from compare import assert_same_entry, assert_same_result
+from udt_extract.raw_extract import raw_extract
+from udt_extract.ubt_raw_convert import convert_raw
+from udt_extract.ubt_raw_data import DATATYPES_AVG, DATATYPES_INST, RAW_SCALE
+from udt_extract.ubt_raw_synthetic import write_synthetic
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLES = ["raw_test.udt", "raw_test_3C.udt"]
+SYNTHETIC = {
+    "inst": dict(_board="apf06", _n_configs=2, _n_channels=3, _n_cells=30, _n_profiles=100),
+    "iq": dict(_board="apf06", _profile_type="iq", _n_channels=2, _n_cells=20, _n_p=16, _n_profiles=50),
+}
+BATCH_SIZES = [None, 7, 1000]
+
+
+@pytest.fixture(scope="module", params=SAMPLES + sorted(SYNTHETIC))
+def raw_file(request, tmp_path_factory):
+    if request.param in SAMPLES:
+        return os.path.join(ROOT, request.param)
+    path = str(tmp_path_factory.mktemp("decode") / (request.param + ".udt"))
+    write_synthetic(path, **SYNTHETIC[request.param])
+    return path
+
+
+@pytest.fixture(scope="module")
+def reference(raw_file):
+    return raw_extract(raw_file, _max_size=None, _batch_size=None)
+
+
+@pytest.mark.parametrize("batch_size", BATCH_SIZES)
+@pytest.mark.parametrize("columnar", [False, True])
+def test_batch_sizes(raw_file, reference, batch_size, columnar):
+    result = raw_extract(raw_file, _max_size=None, _batch_size=batch_size, _columnar=columnar)
+    assert_same_result(result, reference)
+
+
+@pytest.mark.parametrize("batch_size", BATCH_SIZES)
+@pytest.mark.parametrize("columnar", [False, True])
+def test_raw_dtype(raw_file, reference, batch_size, columnar):
+    raw = raw_extract(raw_file, _max_size=None, _batch_size=batch_size, _columnar=columnar, _dtype="raw")
+    profiles = set(DATATYPES_AVG) | set(DATATYPES_INST)
+    for config, channels in reference[4].items():
+        for channel, datatypes in channels.items():
+            assert RAW_SCALE in raw[4][config][channel]
+            for datatype in profiles & set(datatypes):
+                codes = np.asarray(raw[4][config][channel][datatype]["data"])
+                assert codes.dtype == (bool if datatype.startswith("saturation") else np.int16)
+            # la conversion des codes donne les profils convertis à l'extraction
+            converted = convert_raw(raw[4][config][channel], raw[3][config][channel])
+            assert converted.keys() == datatypes.keys()
+            for datatype, entry in datatypes.items():
+                assert_same_entry(converted[datatype], entry, datatype)
+
+
+@pytest.mark.parametrize("batch_size", BATCH_SIZES)
+@pytest.mark.parametrize("columnar", [False, True])
+def test_iq_complex(raw_file, reference, batch_size, columnar):
+    result = raw_extract(raw_file, _max_size=None, _batch_size=batch_size, _columnar=columnar, _iq_complex=True)
+    for config, channels in reference[4].items():
+        for channel, datatypes in channels.items():
+            if "iq" not in datatypes:
+                assert "iq" not in result[4][config][channel]
+                continue
+            samples = np.asarray(result[4][config][channel]["iq"]["data"])
+            iq = datatypes["iq"]["data"]
+            assert samples.dtype == np.complex64
+            assert np.array_equal(samples.real, np.stack([value["i"] for value in iq]))
+            assert np.array_equal(samples.imag, np.stack([value["q"] for value in iq]))
@@ -0,0 +1,55 @@
+# -*- coding: UTF_8 -*-
+
+# extraction d'un lot de fichiers : une erreur sur un fichier n'arrête pas le lot, les résultats ne s'écrasent pas
+
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from udt_extract.batch_extract import batch_extract, result_paths
+from udt_extract.raw_extract import raw_extract
+from udt_extract.ubt_raw_synthetic import write_synthetic
+
+
+@pytest.fixture
+def raw_files(tmp_path):
+    # même nom de fichier dans deux répertoires (un répertoire par site), et un fichier illisible
+    files = []
+    for seed, site in enumerate(("siteA", "siteB")):
+        os.makedirs(tmp_path / site)
+        files.append(str(tmp_path / site / "raw.udt"))
+        write_synthetic(files[-1], _board="apf06", _n_channels=2, _n_cells=20, _n_profiles=20 + 10 * seed, _seed=seed)
+    files.append(str(tmp_path / "broken.udt"))
+    (tmp_path / "broken.udt").write_bytes(b"not a raw.udt file")
+    return files
+
+
+def test_errors_are_isolated(raw_files):
+    results = {raw_file: (result, error) for raw_file, result, error in batch_extract(raw_files, _processes=2)}
+    assert results.keys() == set(raw_files)
+    result, error = results[raw_files[2]]
+    assert result is None and error
+    for raw_file in raw_files[:2]:
+        result, error = results[raw_file]
+        assert error is None
+        assert np.array_equal(np.asarray(result[4][1][1]["echo_profile"]["data"]),
+                              np.asarray(raw_extract(raw_file)[4][1][1]["echo_profile"]["data"]))
+
+
+def test_output_dir(raw_files, tmp_path):
+    output_dir = str(tmp_path / "results")
+    results = {raw_file: (result, error) for raw_file, result, error in batch_extract(raw_files[:2], _processes=2, _output_dir=output_dir)}
+    paths = [results[raw_file][0] for raw_file in raw_files[:2]]
+    assert paths == result_paths(raw_files[:2], output_dir)
+    assert len(set(paths)) == 2
+    for raw_file, path in zip(raw_files[:2], paths):
+        with open(path, "rb") as fd:
+            result = pickle.load(fd)
+        assert len(result[4][1][1]["echo_profile"]["data"]) == len(raw_extract(raw_file)[4][1][1]["echo_profile"]["data"])
+
+
+def test_duplicate_files(raw_files, tmp_path):
+    with pytest.raises(Exception):
+        result_paths([raw_files[0], raw_files[0]], str(tmp_path / "results"))
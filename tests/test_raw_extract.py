@@ -0,0 +1,72 @@
+# -*- coding: UTF_8 -*-
+
+# extraction de fichiers dont les settings ou la const changent en cours de fichier :
+# les modes par lot doivent donner le même résultat que la lecture profil par profil (_batch_size=None)
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from udt_extract.raw_extract import iter_profiles, raw_extract
+from udt_extract.ubt_raw_file import CHUNK_HEAD, HEADER_SIZE
+from udt_extract.ubt_raw_flag import CONST_TAG
+from udt_extract.ubt_raw_synthetic import write_synthetic
+
+MODES = [{}, {"_columnar": True}, {"_batch_size": 100000}]
+
+
+def two_runs(_tmp_path, _keep_const):
+    # deux enregistrements à la suite, le second commençant par sa const (ou directement par ses settings)
+    first, second, raw_file = _tmp_path / "first.udt", _tmp_path / "second.udt", _tmp_path / "raw.udt"
+    write_synthetic(str(first), _board="apf06", _n_channels=2, _n_cells=20, _n_profiles=30)
+    write_synthetic(str(second), _board="apf06", _n_channels=2, _n_cells=20, _n_profiles=20,
+                    _start=datetime(2024, 1, 2), _seed=1)
+    chunks = second.read_bytes()[HEADER_SIZE:]
+    if not _keep_const:
+        flag, size = CHUNK_HEAD.unpack_from(chunks)
+        assert flag == CONST_TAG
+        chunks = chunks[CHUNK_HEAD.size + size:]
+    raw_file.write_bytes(first.read_bytes() + chunks)
+    return str(raw_file)
+
+
+def assert_same_data(_result, _reference):
+    assert _result[1] == _reference[1] and _result[2] == _reference[2]
+    data_us, reference = _result[4], _reference[4]
+    assert data_us.keys() == reference.keys()
+    for config in reference:
+        assert data_us[config].keys() == reference[config].keys()
+        for channel in reference[config]:
+            assert data_us[config][channel].keys() == reference[config][channel].keys()
+            for datatype, entry in reference[config][channel].items():
+                assert len(data_us[config][channel][datatype]["data"]) == len(entry["data"])
+                assert np.array_equal(np.asarray(data_us[config][channel][datatype]["data"], dtype=float),
+                                      np.asarray(entry["data"], dtype=float), equal_nan=True), datatype
+                assert np.array_equal(np.asarray(data_us[config][channel][datatype]["time"], dtype="datetime64[us]"),
+                                      np.asarray(entry["time"], dtype="datetime64[us]")), datatype
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_settings_in_the_middle(tmp_path, mode):
+    raw_file = two_runs(tmp_path, False)
+    reference = raw_extract(raw_file, _batch_size=None)
+    # les profils lus avant les nouveaux settings sont remplacés
+    assert len(reference[4][1][1]["echo_profile"]["data"]) == 20
+    assert_same_data(raw_extract(raw_file, **mode), reference)
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_const_repeated(tmp_path, mode):
+    raw_file = two_runs(tmp_path, True)
+    reference = raw_extract(raw_file, _batch_size=None)
+    assert_same_data(raw_extract(raw_file, **mode), reference)
+
+
+@pytest.mark.parametrize("keep_const", [False, True])
+def test_iter_profiles_across_settings(tmp_path, keep_const):
+    raw_file = two_runs(tmp_path, keep_const)
+    # tous les profils sont donnés, chacun avec les paramètres de ses settings
+    records = [record for record in iter_profiles(raw_file, _batch_size=100000) if record["channel"] == 1]
+    assert [len(record["time"]) for record in records] == [30, 20]
+    assert all(record["param_us"]["n_cell"] == record["vectors"]["echo_profile"].shape[1] for record in records)
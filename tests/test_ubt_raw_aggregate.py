@@ -0,0 +1,61 @@
+# -*- coding: UTF_8 -*-
+
+# statistiques par bin fusionnées au fil des lots : mêmes valeurs que numpy sur toutes les valeurs du bin
+
+import numpy as np
+import pytest
+
+from udt_extract.raw_extract import raw_extract
+from udt_extract.ubt_raw_aggregate import aggregate_profiles, ubt_aggregate
+from udt_extract.ubt_raw_synthetic import write_synthetic
+
+
+def numpy_statistics(_times, _values, _bin_size, _valid=None):
+    # statistiques de référence, bin par bin
+    bins = _times.astype("datetime64[us]").astype(np.int64) // int(_bin_size * 1e6)
+    valid = np.ones(_values.shape, dtype=bool) if _valid is None else _valid
+    statistics = {}
+    for bin_id in np.unique(bins):
+        values = np.where(valid[bins == bin_id], _values[bins == bin_id], np.nan)
+        statistics[bin_id] = (np.sum(~np.isnan(values), axis=0), np.nanmean(values, axis=0), np.nanvar(values, axis=0))
+    return statistics
+
+
+def assert_statistics(_result, _reference, _bin_size):
+    assert len(_result["time"]) == len(_reference)
+    for rank, bin_id in enumerate(sorted(_reference)):
+        count, mean, var = _reference[bin_id]
+        assert _result["time"][rank].astype(np.int64) == bin_id * int(_bin_size * 1e6)
+        assert np.array_equal(_result["count"][rank], count)
+        assert np.allclose(_result["mean"][rank], mean, equal_nan=True)
+        assert np.allclose(_result["var"][rank], var, equal_nan=True)
+
+
+@pytest.mark.parametrize("batch", [1, 7, 64, 1000])
+def test_merge_across_batches(batch):
+    rng = np.random.default_rng(batch)
+    times = np.datetime64("2024-01-01T00:00:00", "us") + np.cumsum(rng.integers(50000, 150000, 300)).astype("timedelta64[us]")
+    values = rng.normal(100., 20., (300, 5))
+    sat = rng.random((300, 5)) < 0.2
+    aggregate = ubt_aggregate(2., _mask_saturation=True)
+    # les lots coupent les bins
+    for start in range(0, len(times), batch):
+        part = slice(start, start + batch)
+        aggregate.update({"config": 1, "channel": 1, "time": times[part],
+                          "vectors": {"echo_profile": values[part], "saturation_profile": sat[part]},
+                          "scalars": {"temperature": values[part, 0]}})
+    result = aggregate.result()[1][1]
+    assert_statistics(result["echo_profile"], numpy_statistics(times, values, 2., ~sat), 2.)
+    assert_statistics(result["temperature"], numpy_statistics(times, values[:, 0], 2.), 2.)
+
+
+def test_aggregate_file(tmp_path):
+    raw_file = str(tmp_path / "raw.udt")
+    write_synthetic(raw_file, _board="apf06", _n_configs=2, _n_channels=2, _n_cells=20, _n_profiles=200)
+    extracted = raw_extract(raw_file, _columnar=True)
+    statistics = aggregate_profiles(raw_file, 1.5, _batch_size=7)
+    for config, channels in extracted[4].items():
+        for channel, datatypes in channels.items():
+            entry = datatypes["velocity_profile"]
+            assert_statistics(statistics[config][channel]["velocity_profile"],
+                              numpy_statistics(entry["time"], entry["data"], 1.5), 1.5)
@@ -0,0 +1,77 @@
+# -*- coding: UTF_8 -*-
+
+# décodage d'un flux UDT005 reçu par socket (serveur local) : mêmes profils que la lecture du fichier
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from udt_extract.raw_extract import iter_profiles
+from udt_extract.ubt_raw_async import iter_stream
+from udt_extract.ubt_raw_synthetic import write_synthetic
+
+N_CHANNELS = 2
+
+
+@pytest.fixture
+def raw_file(tmp_path):
+    path = str(tmp_path / "raw.udt")
+    write_synthetic(path, _board="apf06", _n_configs=2, _n_channels=N_CHANNELS, _n_cells=20, _n_profiles=60)
+    return path
+
+
+def serve_and_read(_source, _clients, _batch_size=None):
+    # le serveur envoie le flux en écritures de tailles irrégulières, à plusieurs clients en même temps
+    async def handle(reader, writer):
+        rng = np.random.default_rng(len(_source))
+        position = 0
+        while position < len(_source):
+            size = int(rng.integers(1, 3000))
+            writer.write(_source[position:position + size])
+            await writer.drain()
+            position += size
+        writer.close()
+
+    async def client(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        records = [record async for record in iter_stream(reader, _batch_size)]
+        writer.close()
+        return records
+
+    async def main():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await asyncio.gather(*[client(port) for _ in range(_clients)])
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    return asyncio.run(main())
+
+
+def assert_same_records(_records, _reference):
+    assert len(_records) == len(_reference)
+    for record, reference in zip(_records, _reference):
+        assert (record["config"], record["channel"], record["time"]) == (reference["config"], reference["channel"], reference["time"])
+        assert record["vectors"].keys() == reference["vectors"].keys()
+        for datatype, vector in reference["vectors"].items():
+            assert np.array_equal(record["vectors"][datatype], vector)
+
+
+def test_stream_equals_file(raw_file):
+    with open(raw_file, "rb") as fd:
+        source = fd.read()
+    reference = list(iter_profiles(raw_file, _batch_size=None))
+    for records in serve_and_read(source, 3):
+        assert_same_records(records, reference)
+
+
+def test_stream_cut_in_a_chunk(raw_file):
+    with open(raw_file, "rb") as fd:
+        source = fd.read()
+    reference = list(iter_profiles(raw_file, _batch_size=None))
+    # flux coupé au milieu du dernier profil : les profils complets sont donnés, la fin est propre
+    for records in serve_and_read(source[:-30], 2):
+        assert_same_records(records, reference[:-N_CHANNELS])
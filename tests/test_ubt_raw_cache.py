@@ -0,0 +1,48 @@
+# -*- coding: UTF_8 -*-
+
+# clés du cache disque : les arguments qui ne changent pas les données extraites ne créent pas de nouvelle entrée
+
+import numpy as np
+
+from udt_extract.ubt_raw_cache import cache_key, cached_extract
+from udt_extract.ubt_raw_stats import ubt_stats
+from udt_extract.ubt_raw_synthetic import write_synthetic
+
+
+def test_stats_hits_cache(tmp_path, capsys):
+    raw_file, cache_dir = str(tmp_path / "raw.udt"), str(tmp_path / "cache")
+    write_synthetic(raw_file, _board="apf06", _n_channels=2, _n_cells=20, _n_profiles=30)
+    extracted = cached_extract(raw_file, _cache_dir=cache_dir)
+    capsys.readouterr()
+
+    stats = ubt_stats()
+    cached = cached_extract(raw_file, _cache_dir=cache_dir, _stats=stats, _processes=2)
+    assert "read from cache" in capsys.readouterr().out
+    assert np.array_equal(cached[4][1][1]["echo_profile"]["data"], extracted[4][1][1]["echo_profile"]["data"])
+
+
+def test_semantic_kwargs_in_key(tmp_path):
+    raw_file = str(tmp_path / "raw.udt")
+    write_synthetic(raw_file, _board="apf06", _n_channels=2, _n_cells=20, _n_profiles=30)
+    assert cache_key(raw_file, {"_stats": ubt_stats(), "_batch_size": 10}) == cache_key(raw_file, {})
+    assert cache_key(raw_file, {"_channels": [1]}) != cache_key(raw_file, {})
+
+
+def test_iq_lazy_with_max_size(tmp_path, capsys):
+    raw_file, cache_dir = str(tmp_path / "iq.udt"), str(tmp_path / "cache")
+    write_synthetic(raw_file, _board="apf06", _profile_type="iq", _n_configs=2, _n_channels=2, _n_cells=20, _n_p=16, _n_profiles=300)
+    # les échantillons IQ différés ne comptent pas dans la taille lue : plus de profils sont extraits
+    assert cache_key(raw_file, {"_max_size": 200000, "_iq_lazy": True}) != cache_key(raw_file, {"_max_size": 200000})
+    assert cache_key(raw_file, {"_max_size": None, "_iq_lazy": True}) == cache_key(raw_file, {"_max_size": None})
+    eager = cached_extract(raw_file, _cache_dir=cache_dir, _max_size=200000)
+    lazy = cached_extract(raw_file, _cache_dir=cache_dir, _max_size=200000, _iq_lazy=True)
+    assert "read from cache" not in capsys.readouterr().out
+    assert len(lazy[4][1][1]["echo_profile"]["data"]) > len(eager[4][1][1]["echo_profile"]["data"])
+
+
+def test_max_memory_is_columnar(tmp_path):
+    raw_file = str(tmp_path / "raw.udt")
+    write_synthetic(raw_file, _board="apf06", _n_channels=2, _n_cells=20, _n_profiles=30)
+    # avec un budget mémoire, raw_extract donne des colonnes : pas la même entrée que les listes
+    assert cache_key(raw_file, {"_max_memory": 1000}) != cache_key(raw_file, {"_max_size": None})
+    assert cache_key(raw_file, {"_max_memory": 1000}) == cache_key(raw_file, {"_max_size": None, "_columnar": True})
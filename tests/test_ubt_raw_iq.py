@@ -0,0 +1,73 @@
+# -*- coding: UTF_8 -*-
+
+# échantillons IQ différés (_iq_lazy) : mêmes échantillons que l'extraction complète
+
+import pickle
+
+import numpy as np
+import pytest
+
+from udt_extract.raw_extract import raw_extract
+from udt_extract.ubt_raw_iq import ubt_iq
+from udt_extract.ubt_raw_synthetic import write_synthetic
+
+
+@pytest.fixture(scope="module")
+def raw_file(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("iq") / "raw.udt")
+    write_synthetic(path, _board="apf06", _profile_type="iq", _n_channels=2, _n_cells=20, _n_p=16, _n_profiles=30)
+    return path
+
+
+@pytest.fixture(scope="module", params=[False, True], ids=["list", "columnar"])
+def handles(request, raw_file):
+    # handle IQ et échantillons décodés (n_profiles, n_p, n_vol) de chaque channel
+    lazy = raw_extract(raw_file, _iq_lazy=True, _columnar=request.param)
+    eager = raw_extract(raw_file, _columnar=True)
+    return [(lazy[4][1][channel]["iq"]["data"], eager[4][1][channel]["iq"]["data"]) for channel in eager[4][1]]
+
+
+def test_array(handles):
+    for handle, samples in handles:
+        assert isinstance(handle, ubt_iq)
+        assert len(handle) == len(samples["i"])
+        array = handle.array()
+        assert np.array_equal(array["i"], samples["i"]) and np.array_equal(array["q"], samples["q"])
+
+
+def test_profile_access(handles):
+    for handle, samples in handles:
+        for rank in (0, 7, len(handle) - 1):
+            profile = handle[rank]
+            assert np.array_equal(profile["i"], samples["i"][rank]) and np.array_equal(profile["q"], samples["q"][rank])
+
+
+def test_slice_and_cells(handles):
+    for handle, samples in handles:
+        selection = handle[3:11].select_cells(5, 15)
+        assert len(selection) == 8
+        assert np.array_equal(selection.array()["i"], samples["i"][3:11, :, 5:15])
+        # sélection dans une sélection
+        assert np.array_equal(selection.select_cells(2, 4)[1]["q"], samples["q"][4, :, 7:9])
+
+
+def test_pickle_and_close(handles):
+    for handle, samples in handles:
+        copy = pickle.loads(pickle.dumps(handle[::2]))
+        assert copy.mapping is None
+        assert np.array_equal(copy.array()["q"], samples["q"][::2])
+        with copy:
+            assert np.array_equal(copy[1]["i"], samples["i"][2])
+        assert copy.mapping is None
+        # le fichier est de nouveau ouvert à l'accès suivant
+        assert np.array_equal(copy[0]["i"], samples["i"][0])
+        copy.close()
+
+
+def test_extend(raw_file):
+    handle = ubt_iq(raw_file, (16, 20, 2), 0)
+    lazy = raw_extract(raw_file, _iq_lazy=True)[4][1][1]["iq"]["data"]
+    for rank in range(len(lazy)):
+        handle.append(lazy[rank:rank + 1])
+    assert len(handle) == len(lazy)
+    assert np.array_equal(handle.offsets, lazy.offsets)
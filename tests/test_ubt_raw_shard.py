@@ -0,0 +1,27 @@
+# -*- coding: UTF_8 -*-
+
+# décodage en parallèle par morceaux du fichier (_processes) : même résultat que le décodage en séquence
+
+import pytest
+
+from compare import assert_same_result
+from udt_extract.raw_extract import raw_extract
+from udt_extract.ubt_raw_synthetic import write_synthetic
+
+
+@pytest.fixture(scope="module")
+def raw_file(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("shard") / "raw.udt")
+    write_synthetic(path, _board="apf06", _n_configs=3, _n_channels=2, _n_cells=20, _n_profiles=400)
+    return path
+
+
+@pytest.mark.parametrize("max_size", [None, 60000])
+@pytest.mark.parametrize("columnar", [False, True])
+def test_processes_equal_sequence(raw_file, max_size, columnar):
+    reference = raw_extract(raw_file, _max_size=max_size, _columnar=columnar)
+    result = raw_extract(raw_file, _max_size=max_size, _columnar=columnar, _processes=3)
+    assert_same_result(result, reference)
+    if max_size is not None:
+        # fichier tronqué par la taille lue : toutes les configurations n'ont pas tous leurs profils
+        assert sum(len(result[4][config][1]["echo_profile"]["data"]) for config in result[4]) < 400
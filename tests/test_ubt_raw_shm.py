@@ -0,0 +1,56 @@
+# -*- coding: UTF_8 -*-
+
+# résultat extrait dans un process (spawn) et lu par mémoire partagée dans le process appelant
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import pytest
+
+from compare import assert_same_result
+from udt_extract.raw_extract import raw_extract
+from udt_extract.ubt_raw_shm import attach_result, extract_shared, share_result
+from udt_extract.ubt_raw_synthetic import write_synthetic
+
+
+@pytest.fixture(scope="module")
+def raw_file(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("shm") / "raw.udt")
+    write_synthetic(path, _board="apf06", _profile_type="iq", _n_configs=2, _n_channels=2, _n_cells=20, _n_p=16, _n_profiles=40)
+    return path
+
+
+def test_extract_in_spawned_process(raw_file):
+    with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as executor:
+        descriptor = executor.submit(extract_shared, raw_file, _max_size=None).result()
+
+    shared = attach_result(descriptor)
+    try:
+        result = shared.result
+        assert_same_result(result, raw_extract(raw_file, _max_size=None, _columnar=True))
+        echo = result[4][1][1]["echo_profile"]["data"]
+        assert not echo.flags.writeable
+        with pytest.raises(ValueError):
+            echo[0, 0] = 0
+        # les vues sont encore utilisées : le segment ne peut pas être fermé
+        with pytest.raises(Exception):
+            shared.close()
+        del result, echo
+        shared.close()
+    finally:
+        shared.unlink()
+    with pytest.raises(FileNotFoundError):
+        attach_result(descriptor)
+
+
+def test_attach_in_owner_process(raw_file):
+    shared = share_result(raw_extract(raw_file, _max_size=None, _columnar=True))
+    # l'ouverture dans le process qui a créé le segment ne lui en retire pas la charge
+    attached = attach_result(shared.descriptor)
+    assert np.array_equal(attached.result[4][2][1]["velocity_profile"]["data"], shared.result[4][2][1]["velocity_profile"]["data"])
+    attached.close()
+    shared.close()
+    shared.unlink()
+    with pytest.raises(FileNotFoundError):
+        attach_result(shared.descriptor)
@@ -0,0 +1,38 @@
+# -*- coding: UTF_8 -*-
+
+# lecture d'un fichier en cours d'écriture : les chunks incomplets sont lus au poll suivant
+
+import numpy as np
+
+from udt_extract.raw_extract import iter_profiles
+from udt_extract.ubt_raw_file import HEADER_SIZE
+from udt_extract.ubt_raw_synthetic import write_synthetic
+from udt_extract.ubt_raw_tail import ubt_raw_tail
+
+
+def test_partial_chunks(tmp_path):
+    source_file, raw_file = str(tmp_path / "source.udt"), str(tmp_path / "raw.udt")
+    write_synthetic(source_file, _board="apf06", _n_configs=2, _n_channels=2, _n_cells=20, _n_profiles=80)
+    with open(source_file, "rb") as fd:
+        source = fd.read()
+    reference = list(iter_profiles(source_file, _batch_size=None))
+
+    tail = ubt_raw_tail(raw_file)
+    assert tail.poll() == []
+    records = []
+    rng = np.random.default_rng(0)
+    # écritures coupées n'importe où : dans l'en-tête, dans l'en-tête d'un chunk ou dans ses données
+    cuts = [HEADER_SIZE // 2] + sorted(rng.integers(HEADER_SIZE, len(source), 40).tolist()) + [len(source)]
+    written = 0
+    for cut in cuts:
+        with open(raw_file, "ab") as fd:
+            fd.write(source[written:cut])
+        written = cut
+        records += tail.poll()
+    assert tail.poll() == []
+
+    assert len(records) == len(reference)
+    for record, expected in zip(records, reference):
+        assert (record["config"], record["channel"], record["time"]) == (expected["config"], expected["channel"], expected["time"])
+        for datatype, vector in expected["vectors"].items():
+            assert np.array_equal(record["vectors"][datatype], vector)
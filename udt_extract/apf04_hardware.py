@@ -1,17 +1,57 @@
 from array import array
+from functools import lru_cache
 import numpy as np
 
 from peacock_uvp.apf04_gain import calc_gain, convert_code2dB_m, convert_code2dB, _convert_code2dB_trunc
 
+from .ubt_raw_gain import gain_table
+from .ubt_raw_stats import NULL_STATS
+
+@lru_cache(maxsize=None)
+def _noise_gain(code):
+    """Function that gives the linear gain applied for a (constant) gain code, as used for the noise values.
+
+    Args:
+        code (int): gain code
+
+    Returns:
+        gain (float)
+    """
+    return pow(10, ((_convert_code2dB_trunc(code)) / 20.))
+
+def _convert_codes(_convert, _codes, *args):
+    """Function that applies a gain code conversion to a code or to an array of codes.
+    For an array, the conversion is done once for each distinct code.
+
+    Args:
+        _convert (function): conversion of one code (from peacock_uvp.apf04_gain)
+        _codes (int or array of int): gain codes
+        args: other arguments of the conversion
+
+    Returns:
+        converted value(s), with the shape of _codes
+    """
+    if np.ndim(_codes) == 0:
+        return _convert(_codes, *args)
+    codes, inverse = np.unique(_codes, return_inverse=True)
+    return np.array([_convert(int(code), *args) for code in codes])[inverse.reshape(-1)].reshape(np.shape(_codes))
+
+
 class apf04_hardware ():
-    def conversion_profile(self, vectors_dict, sound_speed, n_vol, n_avg, c_prf, gain_ca0, gain_ca1, blind_ca0, blind_ca1):
+    # time spent in the gain computation (see ubt_raw_stats), set by ubt_raw_data
+    stats = NULL_STATS
+
+    def conversion_profile(self, vectors_dict, sound_speed, n_vol, n_avg, c_prf, gain_ca0, gain_ca1, blind_ca0, blind_ca1, dtype=np.float64):
         """Function that converts the US profiles values from raw coded values to human readable and SI units.
 
         Args:
-            vectors_dict (dict): dict of unique vectors keyed by datatype
+            vectors_dict (dict): dict of unique vectors keyed by datatype, only the vectors given are converted
             sound_speed (float): sound speed used for this measurement
             n_vol, n_avg, c_prf, gain_ca0, gain_ca1 (floats): parameters for the ongoing param_us (one config, one channel): number of cells, of measures per block, coded PRF, gain intercept and gain slope.
+                For a batch of profiles, the vectors are 2D arrays (one line per profile) and sound_speed, gain_ca0 and gain_ca1 are arrays (one value per profile).
+                The vectors may have a leading receiver axis, (n_rx, n_vol) or (n_rx, n_profiles, n_vol) for a batch, to convert all the receivers of a configuration at once.
             blind_ca0, blind_ca1 (floats): intercept and slope of limitation of gain in blind zone
+            dtype (numpy dtype): precision of the converted vectors (float64 or float32)
 
         Returns:
             None
@@ -21,50 +61,73 @@ class apf04_hardware ():
         self.ny_jump = array('f')
 
         v_ref = 1.25
-        fact_code2velocity = sound_speed / (c_prf * 65535.)
+        fact_code2velocity = np.expand_dims(sound_speed / (c_prf * 65535.), -1).astype(dtype, copy=False)
         # print("factor code to velocity %f"%fact_code2velocity)
-        tab_gain = calc_gain(n_vol, gain_ca0, gain_ca1, blind_ca0, blind_ca1)
 
-        # Nypquist jump when raw velocity standard deviation <0
-        self.ny_jump = vectors_dict['std'] < 0
+        # seuls les vecteurs présents (sélection) sont convertis
+        if 'std' in vectors_dict:
+            # Nypquist jump when raw velocity standard deviation <0
+            self.ny_jump = vectors_dict['std'] < 0
 
-        # conversion raw velocity standard deviation and raw velocity
-        vectors_dict['std'] = (np.absolute(vectors_dict['std'])-1)*fact_code2velocity
+            # conversion raw velocity standard deviation and raw velocity
+            vectors_dict['std'] = (np.absolute(vectors_dict['std'], dtype=dtype)-1)*fact_code2velocity
 
-        vectors_dict['velocity'] = vectors_dict['velocity']*fact_code2velocity
+        if 'velocity' in vectors_dict:
+            vectors_dict['velocity'] = vectors_dict['velocity']*fact_code2velocity
 
-        # Saturation when raw echo amplitude <0
-        vectors_dict['sat'] = vectors_dict['amplitude'] < 0
+        if 'amplitude' in vectors_dict:
+            with self.stats.stage("gain"):
+                tab_gain = self.gain_table(n_vol, gain_ca0, gain_ca1, blind_ca0, blind_ca1)
 
-        # conversion of raw echo amplitude and gain taken into account
-        vectors_dict['amplitude'] = np.absolute(vectors_dict['amplitude']) * ((v_ref*2)/4096) / np.sqrt(n_avg) / tab_gain
+            # Saturation when raw echo amplitude <0
+            vectors_dict['sat'] = vectors_dict['amplitude'] < 0
 
-        # conversion raw snr
-        vectors_dict['snr'] = vectors_dict['snr'] / 10.
+            # conversion of raw echo amplitude and gain taken into account
+            vectors_dict['amplitude'] = np.absolute(vectors_dict['amplitude'], dtype=dtype) * ((v_ref*2)/4096) / np.sqrt(n_avg, dtype=dtype) / tab_gain.astype(dtype, copy=False)
+
+        if 'snr' in vectors_dict:
+            # conversion raw snr
+            vectors_dict['snr'] = np.divide(vectors_dict['snr'], 10., dtype=dtype)
 
     
+    def gain_table(self, n_vol, gain_ca0, gain_ca1, blind_ca0, blind_ca1):
+        """Function that gives the gain applied in each cell, for one profile or for a batch of profiles.
+        For a batch, the table is computed once for each distinct couple of gain codes.
+
+        Args:
+            n_vol (int): number of cells
+            gain_ca0, gain_ca1 (int or arrays of int): gain intercept and slope codes (one value per profile for a batch)
+            blind_ca0, blind_ca1 (int): intercept and slope of limitation of gain in blind zone
+
+        Returns:
+            array of gains, shape (n_vol) or (n_profiles, n_vol)
+        """
+        return gain_table(calc_gain, n_vol, gain_ca0, gain_ca1, blind_ca0, blind_ca1)
+
+
     def conversion_us_scalar(self, scalars_dict, n_avg, r_dvol, r_vol1):
         """Function that converts the scalar US values from raw coded values to human readable and SI units.
 
         Args:
             scalars_dict (dict): dict of scalars US keyed by datatype
             n_avg, r_dvol, r_vol1 (floats): parameters for the ongoing param_us (one config, one channel): number of measurements per block, intercell distance and first cell position.
+                The scalars can also be arrays (one value per profile).
 
         Returns:
             None
         """
         # convert coded gain to dB and dB/m
-        scalars_dict["a1"] = convert_code2dB_m(scalars_dict["gain_ca1"], r_dvol)
+        scalars_dict["a1"] = _convert_codes(convert_code2dB_m, scalars_dict["gain_ca1"], r_dvol)
         del scalars_dict["gain_ca1"]
-        scalars_dict["a0"] = convert_code2dB(scalars_dict["gain_ca0"])-scalars_dict["a1"]*r_vol1
+        scalars_dict["a0"] = _convert_codes(convert_code2dB, scalars_dict["gain_ca0"])-scalars_dict["a1"]*r_vol1
         del scalars_dict["gain_ca0"]
 
         # convert coded noise values to V
         v_ref = 1.25
-        gain = pow(10, ((_convert_code2dB_trunc(1241)) / 20.)) # gain max
+        gain = _noise_gain(1241) # gain max
         scalars_dict["noise_g_high"] = scalars_dict["noise_g_max"] * ((v_ref*2)/4096) / np.sqrt(n_avg) / gain
         del scalars_dict["noise_g_max"]
 
-        gain = pow(10, ((_convert_code2dB_trunc(993)) / 20.)) # gain max - 10dB
+        gain = _noise_gain(993) # gain max - 10dB
         scalars_dict["noise_g_low"] = scalars_dict["noise_g_mid"] * ((v_ref*2)/4096) / np.sqrt(n_avg) / gain
         del scalars_dict["noise_g_mid"]
\ No newline at end of file
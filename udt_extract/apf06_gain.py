@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: UTF_8 -*-
 
-from math import pow
+import numpy as np
 
 APF06_RECEPTION_CHAIN_CONSTANT_GAIN = 14.6 # dB
 APF06_GAIN_CODE_RATIO = 1.5e-3  # dB/quantum 
@@ -88,6 +88,7 @@ def _convert_code2dB_trunc(_code):
 def calc_gain(_n_vol, _gain_ca0, _gain_ca1, _gain_max_ca0, _gain_max_ca1):
     """Compute the table of the gains in dB applied to each cell of the profile
      (difference with APF04 : 4 bits shift is not used)
+     The codes can be arrays (e.g. distinct codes of a batch of profiles), one table is then given for each code.
 
     Args:
         _n_vol(int): number of cells in the profile
@@ -97,20 +98,16 @@ def calc_gain(_n_vol, _gain_ca0, _gain_ca1, _gain_max_ca0, _gain_max_ca1):
         _gain_max_ca1(int): code of the blind zone gain limit slope
 
     Returns:
-        list of gains in dB to apply to each cell of the profile
+        array of gains to apply to each cell of the profile, shape (_n_vol) or (number of codes, _n_vol)
     
     """
-    tab_gain = []
-    i = 0
-    while i <= (_n_vol - 1):
-        G = _convert_code2dB_trunc(_gain_ca0 + i * _gain_ca1)
-        G_max = _convert_code2dB_trunc(_gain_max_ca0 + i * _gain_max_ca1)
-        if (G >= G_max):
-            tab_gain.append(pow(10, G_max / 20.))
-        else:
-            tab_gain.append(pow(10, G / 20.))
-        i = i + 1
-    return tab_gain
+    i = np.arange(_n_vol)
+    code = np.expand_dims(_gain_ca0, -1) + i * np.expand_dims(_gain_ca1, -1)
+    code_max = np.expand_dims(_gain_max_ca0, -1) + i * np.expand_dims(_gain_max_ca1, -1)
+    G = convert_code2dB(np.clip(code, APF06_CODE_MIN_APPLIED, APF06_CODE_MAX_APPLIED))
+    G_max = convert_code2dB(np.clip(code_max, APF06_CODE_MIN_APPLIED, APF06_CODE_MAX_APPLIED))
+    # gain limited by the blind zone gain limit
+    return np.power(10, np.minimum(G, G_max) / 20.)
 
 
 def _truncate(value, limit_max, limit_min):
@@ -2,16 +2,24 @@ from array import array
 import numpy as np
 
 from .apf06_gain import calc_gain, convert_code2dB_m, convert_code2dB, APF06_CODE_MAX_APPLIED
+from .ubt_raw_gain import gain_table
+from .ubt_raw_stats import NULL_STATS
 
 class apf06_hardware ():
-    def conversion_profile(self, vectors_dict, sound_speed, n_vol, n_avg, c_prf, gain_ca0, gain_ca1, blind_ca0, blind_ca1):
+    # time spent in the gain computation (see ubt_raw_stats), set by ubt_raw_data
+    stats = NULL_STATS
+
+    def conversion_profile(self, vectors_dict, sound_speed, n_vol, n_avg, c_prf, gain_ca0, gain_ca1, blind_ca0, blind_ca1, dtype=np.float64):
         """Function that converts the US profiles values from raw coded values to human readable and SI units.
 
         Args:
-            vectors_dict (dict): dict of unique vectors keyed by datatype
+            vectors_dict (dict): dict of unique vectors keyed by datatype, only the vectors given are converted
             sound_speed (float): sound speed used for this measurement
             n_vol, n_avg, c_prf, gain_ca0, gain_ca1 (floats): parameters for the ongoing param_us (one config, one channel): number of cells, of measures per block, coded PRF, gain intercept and gain slope.
+                For a batch of profiles, the vectors are 2D arrays (one line per profile) and sound_speed, gain_ca0 and gain_ca1 are arrays (one value per profile).
+                The vectors may have a leading receiver axis, (n_rx, n_vol) or (n_rx, n_profiles, n_vol) for a batch, to convert all the receivers of a configuration at once.
             not used yet : blind_ca0, blind_ca1 (floats): intercept and slope of limitation of gain in blind zone
+            dtype (numpy dtype): precision of the converted vectors (float64 or float32)
 
         Returns:
             None
@@ -21,29 +29,49 @@ class apf06_hardware ():
         self.ny_jump = array('f')
 
         # En bistatique, on a un facteur 2 par rapport au facteur en monostatique.
-        fact_code2velocity = 2. * sound_speed / (c_prf * 65535.)
+        fact_code2velocity = np.expand_dims(2. * sound_speed / (c_prf * 65535.), -1).astype(dtype, copy=False)
         # print("factor code to velocity %f"%fact_code2velocity)
 
-        tab_gain = calc_gain(n_vol, gain_ca0, gain_ca1, gain_ca0, gain_ca1) #blind_ca0, blind_ca1)
+        # seuls les vecteurs présents (sélection) sont convertis
+        if 'velocity' in vectors_dict:
+            vectors_dict['velocity'] = vectors_dict['velocity']*fact_code2velocity
 
-        vectors_dict['velocity'] = vectors_dict['velocity']*fact_code2velocity
+        if 'amplitude' in vectors_dict:
+            with self.stats.stage("gain"):
+                tab_gain = self.gain_table(n_vol, gain_ca0, gain_ca1) #blind_ca0, blind_ca1)
 
-        # Saturation when raw echo amplitude <0
-        vectors_dict['sat'] = vectors_dict['amplitude'] < 0
+            # Saturation when raw echo amplitude <0
+            vectors_dict['sat'] = vectors_dict['amplitude'] < 0
 
-        # conversion of raw echo amplitude and gain taken into account
-        vectors_dict['amplitude'] = np.absolute(vectors_dict['amplitude']) * (2./4096) / tab_gain
+            # conversion of raw echo amplitude and gain taken into account
+            vectors_dict['amplitude'] = np.absolute(vectors_dict['amplitude'], dtype=dtype) * (2./4096) / tab_gain.astype(dtype, copy=False)
 
-        # conversion raw snr
-        vectors_dict['snr'] = vectors_dict['snr'] / 10.
+        if 'snr' in vectors_dict:
+            # conversion raw snr
+            vectors_dict['snr'] = np.divide(vectors_dict['snr'], 10., dtype=dtype)
 
     
+    def gain_table(self, n_vol, gain_ca0, gain_ca1):
+        """Function that gives the gain applied in each cell, for one profile or for a batch of profiles.
+        The gain is limited with its own codes (the blind zone limitation is not used on APF06).
+
+        Args:
+            n_vol (int): number of cells
+            gain_ca0, gain_ca1 (int or arrays of int): gain intercept and slope codes (one value per profile for a batch)
+
+        Returns:
+            array of gains, shape (n_vol) or (n_profiles, n_vol)
+        """
+        return gain_table(calc_gain, n_vol, gain_ca0, gain_ca1)
+
+
     def conversion_us_scalar(self, scalars_dict, n_avg, r_dvol, r_vol1):
         """Function that converts the scalar US values from raw coded values to human readable and SI units.
 
         Args:
             scalars_dict (dict): dict of scalars US keyed by datatype
             n_avg, r_dvol, r_vol1 (floats): parameters for the ongoing param_us (one config, one channel): number of measurements per block, intercell distance and first cell position.
+                The scalars can also be arrays (one value per profile).
 
         Returns:
             None
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: UTF_8 -*-
+
+# @copyright  this code is the property of Ubertone.
+# You may use this code for your personal, informational, non-commercial purpose.
+# You may not distribute, transmit, display, reproduce, publish, license, create derivative works from, transfer or sell any information, software, products or services based on this code.
+
+# extraction d'un lot de fichiers raw.udt en parallèle (un fichier par process)
+
+import glob
+import os
+import pickle
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .raw_extract import raw_extract
+from .ubt_raw_shard import init_worker
+
+# extension of the result files written in the output directory
+RESULT_EXTENSION = ".pkl"
+
+
+def result_paths(_raw_files, _output_dir):
+    """Function that gives the path of the result file of each raw.udt file in the output directory:
+    the path of the file relative to the common directory of the files, so that files with the same name
+    in different directories (e.g. siteA/raw.udt and siteB/raw.udt) have different results.
+
+    Args:
+        _raw_files (list of string): paths to .udt files
+        _output_dir (string): directory where the results are written
+
+    Returns:
+        list of the paths of the result files
+    """
+    if not _raw_files:
+        return []
+    absolute = [os.path.abspath(raw_file) for raw_file in _raw_files]
+    if len(set(absolute)) != len(absolute):
+        raise Exception('batch', "a file is given several times, its result would be overwritten")
+    common = os.path.commonpath([os.path.dirname(path) for path in absolute])
+    return [os.path.join(_output_dir, os.path.relpath(path, common) + RESULT_EXTENSION) for path in absolute]
+
+
+def _extract_file(_raw_file, _result_path, _kwargs):
+    """Function that extracts one file in a worker process.
+
+    Args:
+        _raw_file (string): file path of raw.udt file
+        _result_path (string): path of the file where the result is written, None to send the result back
+        _kwargs (dict): arguments of raw_extract
+
+    Returns:
+        (result, error): the tuple given by raw_extract (or the path of the result file) and None,
+        or None and the traceback of the error
+    """
+    try:
+        result = raw_extract(_raw_file, **_kwargs)
+        if _result_path is not None:
+            os.makedirs(os.path.dirname(_result_path), exist_ok=True)
+            with open(_result_path, "wb") as fd:
+                pickle.dump(result, fd, protocol=pickle.HIGHEST_PROTOCOL)
+            result = _result_path
+        return result, None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+def batch_extract(_raw_files, _processes=None, _output_dir=None, _verbose=False, **_kwargs):
+    """
+        Generator which extracts a list of raw.udt files with a pool of processes (one file per process at a time).
+        An error on a file is reported and does not stop the extraction of the other files.
+
+        Parameters
+        ----------
+        _raw_files : list of string or string
+                paths to .udt files, or a glob pattern (e.g. "data/*.udt")
+        _processes : int
+                number of worker processes, None for the number of CPUs
+        _output_dir : string
+                directory where the result of each file is pickled (<file path>.pkl, the path being relative
+                to the common directory of the files, see result_paths), None to send the results back to the calling process
+        _verbose : bool
+                keep the messages printed by raw_extract in the workers
+        _kwargs :
+                arguments given to raw_extract for each file (e.g. _max_size, _columnar, _datatypes)
+
+        Yields
+        ------
+    (raw_file, result, error) : tuple, in the order of completion
+        result is the tuple given by raw_extract (or the path of the result file with _output_dir) and error is None,
+        or result is None and error is the traceback of the error
+    """
+    if isinstance(_raw_files, str):
+        raw_files = sorted(glob.glob(_raw_files))
+    else:
+        raw_files = list(_raw_files)
+    if _output_dir is None:
+        paths = [None] * len(raw_files)
+    else:
+        paths = result_paths(raw_files, _output_dir)
+        os.makedirs(_output_dir, exist_ok=True)
+
+    executor = ProcessPoolExecutor(_processes, initializer=init_worker, initargs=(_verbose,))
+    try:
+        futures = {executor.submit(_extract_file, raw_file, path, _kwargs): raw_file for raw_file, path in zip(raw_files, paths)}
+        for count, future in enumerate(as_completed(futures), 1):
+            # le résultat n'est plus gardé une fois donné
+            raw_file = futures.pop(future)
+            try:
+                result, error = future.result()
+            except Exception:
+                # e.g. worker process killed
+                result, error = None, traceback.format_exc()
+            if error is None:
+                print("[%d/%d] %s extracted" % (count, len(raw_files), raw_file))
+            else:
+                print("[%d/%d] %s failed: %s" % (count, len(raw_files), raw_file, error.strip().splitlines()[-1]))
+            yield raw_file, result, error
+    finally:
+        # pending files are cancelled if the iteration is stopped
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -15,6 +15,38 @@ def warning_style(message, category, filename, lineno, file=None, line=None):
 
 warnings.formatwarning = warning_style
 
+# translation index built from translation.json at its first use (see get_translation_index)
+_translation_index = None
+
+def get_translation_index():
+	"""
+	Load the translation json file once and build, for each type of translation,
+	a dict which gives the translated key of every valid key and of every alter ego.
+
+	Returns
+	-------
+	translation_index: dict
+		dict keyed by type ("data", "param_const", "param_var") of dicts {raw_key: translated_key}
+	"""
+	global _translation_index
+	if _translation_index is None:
+		_transation_path =  os.path.dirname(os.path.realpath(__file__))+'/translation.json'
+		with open(_transation_path) as f:
+			translation = json.loads(f.read())
+
+		translation_index = {}
+		for _type, translation_dict in translation.items():
+			aliases = {}
+			# as for a linear search, the first matching key wins
+			for key, value in translation_dict.items():
+				aliases.setdefault(key, key)
+				if value["alter_ego"] is not None:
+					for alter_ego in value["alter_ego"]:
+						aliases.setdefault(alter_ego, key)
+			translation_index[_type] = aliases
+		_translation_index = translation_index
+	return _translation_index
+
 def clean_type(measure_type_string):
 	"""
 	This function allows us to clean the data type that we want to search.
@@ -60,23 +92,9 @@ def translate_key(raw_key, _type="data"):
 	translated_key: string or None
 	"""
 
-	translated_key = None
-
-	# use of a json file for the translation in valid data type names for the DB
-	_transation_path =  os.path.dirname(os.path.realpath(__file__))+'/translation.json'
-	f = open(_transation_path)
-	translation_dict = json.loads(f.read())[_type]
-
-	for key, value in translation_dict.items():
-		# leave unchanged the already valid data type names
-		# translate those which are translatable
-		if (raw_key == key):
-			translated_key = key
-			break
-		elif value["alter_ego"] is not None:
-			if raw_key in value["alter_ego"]:
-				translated_key = key
-				break
+	# leave unchanged the already valid data type names
+	# translate those which are translatable
+	translated_key = get_translation_index()[_type].get(raw_key)
 
 	#if translated_key == None:
 	#	print("delete %s"%raw_key)
@@ -94,12 +112,14 @@ def translate_paramdict(param_dict):
 	-------
 	param_dict: dict
 	"""
+	translation_index = get_translation_index()
 	translated_param_dict = {}
 	for key,elem in param_dict.items():
-		if translate_key(clean_type(key),_type="param_var") is not None:
-			translated_param_dict[translate_key(clean_type(key),_type="param_var")] = elem
-		elif translate_key(clean_type(key),_type="param_const") is not None:
-			translated_param_dict[translate_key(clean_type(key), _type="param_const")] = elem
+		cleaned_key = clean_type(key)
+		if cleaned_key in translation_index["param_var"]:
+			translated_param_dict[translation_index["param_var"][cleaned_key]] = elem
+		elif cleaned_key in translation_index["param_const"]:
+			translated_param_dict[translation_index["param_const"][cleaned_key]] = elem
 	return translated_param_dict
 
 def translate_datadictslist(data_dicts):
@@ -115,6 +135,7 @@ def translate_datadictslist(data_dicts):
 	-------
 	importable_data_dicts: list(dict)
 	"""
+	data_translation = get_translation_index()["data"]
 	importable_data_dicts = []
 	i=0
 	for data_dict in data_dicts:
@@ -123,7 +144,7 @@ def translate_datadictslist(data_dicts):
 		importable_data_dicts[i]['name'] = clean_type(data_dict['name'])
 
 		# traduire les noms qui ont une traduction (cf switcher dans convert_type.py)
-		importable_data_dicts[i]['name'] = translate_key(importable_data_dicts[i]['name'], _type="data")
+		importable_data_dicts[i]['name'] = data_translation.get(importable_data_dicts[i]['name'])
 		if importable_data_dicts[i]['name'] is None:
 		# supprimer les lignes sont le type n'existe pas la la liste de données importables
 			del importable_data_dicts[i]
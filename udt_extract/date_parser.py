@@ -1,6 +1,15 @@
 #!/usr/bin/env python3
 # -*- coding: UTF_8 -*-
+from datetime import timedelta
+
 from dateutil.parser import parse
+import numpy as np
+
+from peacock_uvp.apf_timestamp import decode_timestamp
+
+# origin of the packed timestamps (datetime64), see timestamp_epoch
+_timestamp_epoch = None
+_timestamp_epoch_datetime = None
 
 
 def date_parse(date_str):
@@ -10,3 +19,55 @@ def date_parse(date_str):
 	else:
 		# Ex : 09-12-2019
 		return parse(date_str, dayfirst=True, yearfirst=False)
+
+
+def timestamp_epoch():
+	"""Function that gives the origin of the packed timestamps of the profiles.
+	It is the date given by peacock_uvp for a null timestamp, so that decode_timestamps gives the same dates.
+
+	Returns:
+		origin (numpy datetime64[us])
+	"""
+	global _timestamp_epoch
+	if _timestamp_epoch is None:
+		dt_epoch, _ = decode_timestamp(bytes(6))
+		_timestamp_epoch = np.datetime64(dt_epoch.replace(tzinfo=None), "us")
+	return _timestamp_epoch
+
+
+def decode_timestamps(_packed):
+	"""Function that decodes packed timestamps (6 bytes of the profile header), all at once.
+	A packed timestamp is 3 int16: high and low words of the number of seconds, and the milliseconds.
+
+	Args:
+		_packed (array of int16): packed timestamps, shape (..., 3)
+
+	Returns:
+		timestamps (numpy datetime64[us] array), shape (...)
+		use .tolist() (or .item() for one timestamp) to get datetime objects
+	"""
+	packed = np.asarray(_packed).astype(np.int64) & 0xFFFF
+	seconds = (packed[..., 0] << 16) | packed[..., 1]
+	return timestamp_epoch() + (seconds * 1000000 + packed[..., 2] * 1000).astype("timedelta64[us]")
+
+
+def decode_timestamp_values(_high, _low, _msec):
+	"""Function that decodes one packed timestamp from its 3 int16, without numpy (faster for a single profile).
+	Gives the same date as decode_timestamps.
+
+	Args:
+		_high, _low (int): high and low words of the number of seconds
+		_msec (int): milliseconds
+
+	Returns:
+		timestamp (datetime)
+	"""
+	seconds = ((_high & 0xFFFF) << 16) | (_low & 0xFFFF)
+	return _epoch_datetime() + timedelta(seconds=seconds, milliseconds=_msec & 0xFFFF)
+
+
+def _epoch_datetime():
+	global _timestamp_epoch_datetime
+	if _timestamp_epoch_datetime is None:
+		_timestamp_epoch_datetime = timestamp_epoch().item()
+	return _timestamp_epoch_datetime
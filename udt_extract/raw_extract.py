@@ -5,17 +5,22 @@
 # You may not distribute, transmit, display, reproduce, publish, license, create derivative works from, transfer or sell any information, software, products or services based on this code.
 # @author Stéphane Fischer
 
-import json
 from datetime import datetime  # pour time count
 
+import numpy as np
+
 from .ubt_raw_file import ubt_raw_file
-from .ubt_raw_data import ubt_raw_data
+from .ubt_raw_decoder import ubt_raw_decoder, DEFAULT_BATCH_SIZE
+from .ubt_raw_index import get_index, select_chunks
+from .ubt_raw_shard import decode_shards
+from .ubt_raw_stats import get_stats
 from .ubt_raw_flag import *
 
 DEFAULT_MAX_SIZE= 50000000 # 50 MB
 
 
-def raw_extract(_raw_file, _max_size=DEFAULT_MAX_SIZE):
+def raw_extract(_raw_file, _max_size=DEFAULT_MAX_SIZE, _time_begin=None, _time_end=None, _profiles=None, _index=False, _batch_size=DEFAULT_BATCH_SIZE, _columnar=False,
+                _configs=None, _channels=None, _datatypes=None, _iq=True, _processes=None, _iq_complex=False, _iq_lazy=False, _max_memory=None, _stats=None, _dtype=np.float64):
     """
         This method will extract data from the raw.udt file and convert it to dicts which are easy to go through and to import in the DB.
 
@@ -23,6 +28,49 @@ def raw_extract(_raw_file, _max_size=DEFAULT_MAX_SIZE):
         ----------
         _raw_file : string
                 path to .udt file
+        _max_size : int
+                maximum amount of data (in bytes) read in the file, None for no limit (see also iter_profiles)
+        _time_begin, _time_end : datetime
+                limits of the time range to extract (None for no limit)
+        _profiles : slice or list of int
+                numbers of the profiles to extract (in the file order, starting at 0), None for all profiles
+        _index : bool
+                use (and save) the chunk index sidecar file (.idx.npy), see ubt_raw_index
+                the index is always used when a time range or profiles are given
+        _batch_size : int
+                number of profiles decoded at once (see ubt_raw_data.read_profiles), None to decode the profiles one by one
+        _columnar : bool
+                give each datatype as one contiguous array (one line per profile) with a datetime64[us] time vector,
+                instead of lists of arrays and datetimes (the arrays are sized from the chunk index when it is used)
+        _configs : list of int
+                configuration numbers to extract, None for all configurations
+                (the profiles of the other configurations are skipped before decoding)
+        _channels : list of int
+                receiving channels to extract, None for all channels
+        _datatypes : list of string
+                datatypes to extract (e.g. ["velocity_avg_profile", "temperature"], "iq" for the IQ samples), None for all datatypes
+                (the other datatypes are neither converted nor stored)
+        _iq : bool
+                extract the IQ samples of the PROFILE_INST_IQ_TAG profiles
+        _iq_complex : bool
+                give the IQ samples as complex64 arrays (I + jQ) of shape (n_p, n_vol) instead of dicts of "i" and "q" arrays
+                (with _columnar, one (n_profiles, n_p, n_vol) array per channel)
+        _iq_lazy : bool
+                give the IQ samples of each channel as a lazy handle (see ubt_raw_iq) which keeps only the positions of the IQ blocks
+                and reads them from the file when accessed (the IQ samples do not count in _max_size)
+        _processes : int
+                number of processes decoding the profiles in parallel (see ubt_raw_shard), None to decode them in this process
+                (the chunk index is then always used)
+        _max_memory : int
+                memory budget (in bytes) of the extracted arrays: beyond, the arrays are allocated in memory-mapped temporary files
+                (see ubt_memory_budget), so that the whole file is extracted; implies _columnar=True and no _max_size limit
+        _stats : ubt_stats or function
+                measure the time spent in each stage of the extraction, the calls, the bytes and the chunks by flag (see ubt_raw_stats):
+                a ubt_stats object filled during the extraction, or a function called with the report at the end, None to disable the measures
+        _dtype : numpy dtype or string
+                precision of the converted profiles: np.float64 (default) or np.float32 (half the memory),
+                or "raw" to keep the int16 codes of the profiles, with the codes needed to convert them in the "raw_scale" datatype
+                of each channel (see ubt_raw_convert, the saturation is still given as booleans)
 
         Returns
         -------
@@ -37,67 +85,92 @@ def raw_extract(_raw_file, _max_size=DEFAULT_MAX_SIZE):
         data not us related, with no param_us associated
     """
 
+    if _max_memory is not None:
+        # toutes les données sont extraites, au besoin sur disque
+        _columnar = True
+        _max_size = None
+
+    stats = get_stats(_stats)
     fileraw = ubt_raw_file(_raw_file)
 
+    # with the chunk index, only the selected profiles are read
+    chunk_offsets = None
+    profile_counts = {}
+    if _index or _processes or _time_begin is not None or _time_end is not None or _profiles is not None:
+        chunks = select_chunks(get_index(_raw_file, _sidecar=_index), _time_begin, _time_end, _profiles, _configs)
+        chunk_offsets = iter(chunks["offset"].tolist())
+        configs, counts = np.unique(chunks["config"][chunks["config"] > 0], return_counts=True)
+        profile_counts = dict(zip(configs.tolist(), counts.tolist()))
+
+    decoder = ubt_raw_decoder(_batch_size or 1, _columnar, profile_counts,
+                              _time_begin, _time_end, _configs, _channels, _datatypes, _iq, _iq_complex,
+                              _raw_file if _iq_lazy else None, _max_memory, stats, _dtype)
+
     total_size = 0
     profile_id = 0
-    try:
-        while 1:
-            flag, size, data = fileraw.read_chunk()
+    time_begin = None
+    timestamp = None
 
-            total_size += size
-            if total_size > _max_size:
+    def store_profiles(records):
+        # rangement des profils décodés par lot
+        nonlocal time_begin, timestamp
+        if records:
+            timestamps = decoder.ubt_data.store_profiles(records)
+            if time_begin is None:
+                time_begin = timestamps[0].item()
+            timestamp = timestamps[-1].item()
+
+    try:
+        if _processes:
+            # les profils sont décodés en parallèle par morceaux contigus du fichier (voir ubt_raw_shard)
+            if _max_size is not None and np.sum(chunks["size"], dtype=np.int64) > _max_size:
                 print ("           -----------          ")
                 print ("WARNING, file size is too big, process interupted. All data are not extracted")
                 print ("  (size threshold can be modified by setting _max_size argument)")
                 print ("           -----------          ")
-                break
-
-            # Pour raw UDT005 (ie. UB-Lab P, UB-SediFlow, UB-Lab 3C) on peut 
-            # rencontrer 4 flags: const, settings json, configs (HW), profils
-            if flag == CONST_TAG:
-                try:
-                    const_dict = json.loads(data.decode("utf-8"))
-                except:
-                    const_dict = json.loads(
-                        data.decode("utf-8")
-                        .replace("'", '"')
-                        .replace("True", "true")
-                        .replace("False", "false")
-                    )
-                print("const: %s" % const_dict)
-
-                ubt_data = ubt_raw_data( const_dict )
-
-
-            if flag == SETTINGS_JSON_TAG:
-                try:
-                    settings_dict = json.loads(data.decode("utf-8"))
-                except:
-                    settings_dict = json.loads(
-                        data.decode("utf-8")
-                        .replace("'", '"')
-                        .replace("True", "true")
-                        .replace("False", "false")
-                    )
-                print("settings: %s" % settings_dict)
-
-                ubt_data.set_config(settings_dict)
-
-
-            if flag == CONFIG_TAG:
-                # what is needed from here and which is not in param_us_dict is only blind_ca0 and blind_ca1
-                # note: this is not useful on APF06, but could be used for double check
-                ubt_data.set_confighw(size, data)
+                chunks = chunks[np.cumsum(chunks["size"], dtype=np.int64) <= _max_size]
+            for records in decode_shards(_raw_file, chunks, decoder, _processes, _batch_size or DEFAULT_BATCH_SIZE):
+                store_profiles(records)
+            print("End of file")
+        else:
+            while 1:
+                with stats.stage("read"):
+                    if chunk_offsets is None:
+                        flag, size, data = fileraw.read_chunk()
+                    else:
+                        offset = next(chunk_offsets, None)
+                        if offset is None:
+                            raise EOFError
+                        flag, size, data = fileraw.read_chunk_at(offset)
+                stats.count_chunk(flag, size)
 
+                # avec les IQ différés, seule la partie lue des chunks compte
+                total_size += decoder.ubt_data.loaded_size(flag, size, data) if flag in PROFILE_FLAGS else size
+                if _max_size is not None and total_size > _max_size:
+                    print ("           -----------          ")
+                    print ("WARNING, file size is too big, process interupted. All data are not extracted")
+                    print ("  (size threshold can be modified by setting _max_size argument)")
+                    print ("           -----------          ")
+                    break
 
-            if flag == PROFILE_TAG or flag == PROFILE_INST_TAG or flag == PROFILE_INST_IQ_TAG:
-                timestamp = ubt_data.read_line(size, data, (flag==PROFILE_INST_TAG or flag == PROFILE_INST_IQ_TAG), flag == PROFILE_INST_IQ_TAG)
-                profile_id += 1
+                if flag in PROFILE_FLAGS:
+                    # profils hors sélection (config, période) écartés sans décodage
+                    if not decoder.accept(data):
+                        continue
+                    profile_id += 1
+                    if not _batch_size:
+                        timestamp = decoder.ubt_data.read_line(size, data, (flag==PROFILE_INST_TAG or flag == PROFILE_INST_IQ_TAG), flag == PROFILE_INST_IQ_TAG, fileraw.position-size)
 
-                # get the first timestamp of udt file for time_begin definition of the run:
-                if profile_id == 1:
-                    time_begin = timestamp
+                        # get the first timestamp of udt file for time_begin definition of the run:
+                        if profile_id == 1:
+                            time_begin = timestamp
+                        continue
+                    # les profils sont décodés par lot (profil déjà accepté)
+                    store_profiles(decoder.queue_profile(flag, size, data, fileraw.position-size))
+                else:
+                    # les profils en attente sont rangés avant que const, settings json et configs (HW) ne mettent à jour ubt_data
+                    store_profiles(decoder.flush())
+                    store_profiles(decoder.read_chunk(flag, size, data, fileraw.position-size))
 
 
     except KeyboardInterrupt:
@@ -108,17 +181,77 @@ def raw_extract(_raw_file, _max_size=DEFAULT_MAX_SIZE):
         print("Error")
         raise
 
+    store_profiles(decoder.flush())
+    fileraw.close()
+    decoder.ubt_data.finalize()
+    stats.end()
+
     #print("%d profiles read" % profile_id)
     # last timestamp of udt file for time_end definition of run:
     # based on the last profile processed 
     time_end = timestamp
 
     return (
-        const_dict["product_id"],
+        decoder.const_dict["product_id"],
         time_begin,
         time_end,
-        ubt_data.param_us_dicts,
-        ubt_data.data_us_dicts,
-        ubt_data.data_dicts,
-        settings_dict,
-    )
\ No newline at end of file
+        decoder.ubt_data.param_us_dicts,
+        decoder.ubt_data.data_us_dicts,
+        decoder.ubt_data.data_dicts,
+        decoder.settings_dict,
+    )
+
+
+def iter_profiles(_raw_file, _batch_size=None, _time_begin=None, _time_end=None,
+                  _configs=None, _channels=None, _datatypes=None, _iq=True, _iq_complex=False, _iq_lazy=False, _stats=None, _dtype=np.float64):
+    """
+        Generator which decodes the profiles of the raw.udt file and yields them without accumulating them:
+        the memory used does not depend on the size of the file (there is no _max_size limit).
+
+        Parameters
+        ----------
+        _raw_file : string
+                path to .udt file
+        _batch_size : int
+                None to yield one record per profile and receiving channel,
+                or number of profiles decoded at once to yield one record per batch, configuration and receiving channel
+                (within a batch, the records are grouped by configuration)
+        _time_begin, _time_end, _configs, _channels, _datatypes, _iq, _iq_complex, _iq_lazy :
+                selection of the profiles and of the data (see raw_extract)
+        _dtype : numpy dtype or string
+                precision of the converted profiles, or "raw" (see raw_extract): the records then have a "raw_scale" key,
+                and the profiles can be converted on the fly with convert_raw_vectors (see ubt_raw_convert)
+        _stats : ubt_stats or function
+                measures of the decode stages (see raw_extract), ended when the generator is closed
+
+        Yields
+        ------
+    record : dict
+        with keys "config", "channel", "flag", "param_us", "time", "vectors" (by datatype), "scalars" (by datatype)
+        and "iq" for IQ profiles, see ubt_raw_decoder.split_records
+    """
+    stats = get_stats(_stats)
+    fileraw = ubt_raw_file(_raw_file)
+    decoder = ubt_raw_decoder(_batch_size or DEFAULT_BATCH_SIZE, _time_begin=_time_begin, _time_end=_time_end,
+                              _configs=_configs, _channels=_channels, _datatypes=_datatypes, _iq=_iq, _iq_complex=_iq_complex,
+                              _iq_source=_raw_file if _iq_lazy else None, _stats=stats, _dtype=_dtype)
+    try:
+        while 1:
+            try:
+                with stats.stage("read"):
+                    flag, size, data = fileraw.read_chunk()
+            except EOFError:
+                break
+            stats.count_chunk(flag, size)
+            if flag not in PROFILE_FLAGS:
+                # profils en attente donnés avec les settings et configs en cours
+                yield from decoder.split_records(decoder.flush(), _batch_size is None)
+            records = decoder.read_chunk(flag, size, data, fileraw.position-size)
+            if records:
+                # the decoded chunks are not needed any more
+                fileraw.release()
+                yield from decoder.split_records(records, _batch_size is None)
+        yield from decoder.split_records(decoder.flush(), _batch_size is None)
+    finally:
+        fileraw.close()
+        stats.end()
\ No newline at end of file
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: UTF_8 -*-
+
+# @copyright  this code is the property of Ubertone.
+# You may use this code for your personal, informational, non-commercial purpose.
+# You may not distribute, transmit, display, reproduce, publish, license, create derivative works from, transfer or sell any information, software, products or services based on this code.
+
+# moyennes par intervalles de temps (bins) calculées au fil du décodage, sans garder les profils
+
+from datetime import timedelta
+
+import numpy as np
+
+from .raw_extract import iter_profiles
+from .ubt_raw_decoder import DEFAULT_BATCH_SIZE
+
+
+def bin_statistics(_values, _bins, _valid=None):
+    """Function that computes the statistics of the values of each bin.
+
+    Args:
+        _values (array): values, one line per profile (1D for scalars, 2D for profiles)
+        _bins (array of int): bin number of each line
+        _valid (array of bool): values taken into account (same shape as _values), None for all the values
+
+    Returns:
+        bins (array of int): sorted bin numbers
+        and the arrays (one line per bin) count, mean, m2 (sum of the squared deviations from the mean), min, max
+    """
+    values = np.asarray(_values, dtype=np.float64)
+    valid = np.ones(values.shape, dtype=bool) if _valid is None else _valid
+    # les lignes de chaque bin sont regroupées (les profils sont en général déjà dans l'ordre)
+    order = np.argsort(_bins, kind="stable")
+    bins = _bins[order]
+    values = values[order]
+    valid = valid[order]
+    starts = np.flatnonzero(np.concatenate(([True], bins[1:] != bins[:-1])))
+
+    count = np.add.reduceat(valid, starts, axis=0).astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.add.reduceat(np.where(valid, values, 0.), starts, axis=0) / count
+    deviation = np.where(valid, values - np.repeat(mean, np.diff(np.append(starts, len(bins))), axis=0), 0.)
+    m2 = np.add.reduceat(deviation**2, starts, axis=0)
+    minimum = np.minimum.reduceat(np.where(valid, values, np.inf), starts, axis=0)
+    maximum = np.maximum.reduceat(np.where(valid, values, -np.inf), starts, axis=0)
+    return bins[starts], count, mean, m2, minimum, maximum
+
+
+def merge_statistics(_a, _b):
+    """Function that merges the statistics of two sets of values (Chan et al. parallel algorithm).
+
+    Args:
+        _a, _b (list): count, mean, m2, min, max
+
+    Returns:
+        list count, mean, m2, min, max of the union
+    """
+    count_a, mean_a, m2_a, min_a, max_a = _a
+    count_b, mean_b, m2_b, min_b, max_b = _b
+    count = count_a + count_b
+    with np.errstate(invalid="ignore", divide="ignore"):
+        delta = np.nan_to_num(mean_b) - np.nan_to_num(mean_a)
+        mean = np.where(count > 0, np.nan_to_num(mean_a) + delta * count_b / count, np.nan)
+        m2 = m2_a + m2_b + np.where(count > 0, delta**2 * count_a * count_b / count, 0.)
+    return [count, mean, m2, np.minimum(min_a, min_b), np.maximum(max_a, max_b)]
+
+
+class ubt_aggregate:
+    def __init__(self, _bin_size, _mask_saturation=False):
+        """Function that initiates a ubt_aggregate object which keeps the statistics of each datatype by time bin,
+        updated with the batches of profiles given by iter_profiles (or ubt_raw_decoder.split_records).
+
+        Args:
+            _bin_size (timedelta or float): duration of the bins (in s for a float), the bins are aligned on 1970-01-01
+            _mask_saturation (bool): leave out the saturated cells (saturation profile) of the other profiles
+
+        Returns:
+            None
+        """
+        if not isinstance(_bin_size, timedelta):
+            _bin_size = timedelta(seconds=_bin_size)
+        self.bin_size = np.timedelta64(_bin_size, "us").astype(np.int64)
+        self.mask_saturation = _mask_saturation
+        # statistiques par (config, channel, datatype) puis par numéro de bin
+        self.statistics = {}
+
+    def __update__(self, _key, _values, _bins, _valid=None):
+        statistics = self.statistics.setdefault(_key, {})
+        bins, *batch = bin_statistics(_values, _bins, _valid)
+        for rank, bin_id in enumerate(bins.tolist()):
+            line = [value[rank] for value in batch]
+            if bin_id in statistics:
+                line = merge_statistics(statistics[bin_id], line)
+            statistics[bin_id] = line
+
+    def update(self, _record):
+        """Function that adds a batch of profiles of one configuration and channel.
+
+        Args:
+            _record (dict): record given by iter_profiles (see ubt_raw_decoder.split_records)
+
+        Returns:
+            None
+        """
+        times = np.atleast_1d(np.asarray(_record["time"], dtype="datetime64[us]"))
+        bins = times.astype(np.int64) // self.bin_size
+
+        valid = None
+        if self.mask_saturation:
+            for datatype, vector in _record["vectors"].items():
+                if datatype.startswith("saturation"):
+                    valid = ~np.atleast_2d(vector)
+
+        for datatype, vector in _record["vectors"].items():
+            vector = np.atleast_2d(vector)
+            self.__update__((_record["config"], _record["channel"], datatype), vector, bins,
+                            None if datatype.startswith("saturation") else valid)
+        for datatype, value in _record["scalars"].items():
+            self.__update__((_record["config"], _record["channel"], datatype), np.atleast_1d(value), bins)
+
+    def result(self):
+        """Function that gives the binned statistics.
+
+        Returns:
+            dict by config, by channel and by datatype of dicts with keys
+                "time": datetime64[us] array of the beginnings of the bins,
+                "count": number of values (by cell for the profiles),
+                "mean", "var" (population variance), "min", "max": arrays with one line per bin (NaN where count is 0)
+        """
+        result = {}
+        for (config, channel, datatype), statistics in self.statistics.items():
+            bins = sorted(statistics)
+            count, mean, m2, minimum, maximum = [np.stack([statistics[bin_id][rank] for bin_id in bins]) for rank in range(5)]
+            empty = count == 0
+            with np.errstate(invalid="ignore", divide="ignore"):
+                var = np.where(empty, np.nan, m2 / count)
+            result.setdefault(config, {}).setdefault(channel, {})[datatype] = {
+                "time": (np.array(bins, dtype=np.int64) * self.bin_size).astype("datetime64[us]"),
+                "count": count.astype(np.int64),
+                "mean": np.where(empty, np.nan, mean),
+                "var": var,
+                "min": np.where(empty, np.nan, minimum),
+                "max": np.where(empty, np.nan, maximum),
+            }
+        return result
+
+
+def aggregate_profiles(_raw_file, _bin_size, _mask_saturation=False, _batch_size=DEFAULT_BATCH_SIZE, **_kwargs):
+    """
+        This method computes the statistics by time bin of the data of the raw.udt file, while the file is decoded:
+        only the binned arrays are kept in memory.
+
+        Parameters
+        ----------
+        _raw_file : string
+                path to .udt file
+        _bin_size : timedelta or float
+                duration of the bins (in s for a float)
+        _mask_saturation : bool
+                leave out the saturated cells of the profiles
+        _batch_size : int
+                number of profiles decoded at once
+        _kwargs :
+                selection of the data (see iter_profiles), the IQ samples are not aggregated
+
+        Returns
+        -------
+    statistics : dict
+        see ubt_aggregate.result
+    """
+    aggregate = ubt_aggregate(_bin_size, _mask_saturation)
+    _kwargs["_iq"] = False
+    for record in iter_profiles(_raw_file, _batch_size, **_kwargs):
+        aggregate.update(record)
+    return aggregate.result()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: UTF_8 -*-
+
+# @copyright  this code is the property of Ubertone.
+# You may use this code for your personal, informational, non-commercial purpose.
+# You may not distribute, transmit, display, reproduce, publish, license, create derivative works from, transfer or sell any information, software, products or services based on this code.
+
+# décodage asynchrone (asyncio) d'un flux UDT005 (socket, pipe...) sans passer par un fichier
+
+import asyncio
+
+from .ubt_raw_decoder import ubt_raw_decoder
+from .ubt_raw_file import CHUNK_HEAD, HEADER_SIZE, parse_header
+from .ubt_raw_flag import *
+
+
+class ubt_byte_reader:
+    def __init__(self, _chunks):
+        """Function that initiates a reader giving the readexactly method of asyncio.StreamReader
+        on an iterator (or async iterator) of bytes.
+
+        Args:
+            _chunks: iterator or async iterator of bytes-like objects
+
+        Returns:
+            None
+        """
+        if hasattr(_chunks, "__aiter__"):
+            self.chunks = _chunks.__aiter__()
+        else:
+            self.chunks = iter(_chunks)
+        self.buffer = bytearray()
+
+    async def __next_chunk__(self):
+        # None at the end of the iterator
+        if hasattr(self.chunks, "__anext__"):
+            try:
+                return await self.chunks.__anext__()
+            except StopAsyncIteration:
+                return None
+        return next(self.chunks, None)
+
+    async def readexactly(self, _size):
+        """Function that reads a given number of bytes.
+
+        Args:
+            _size (int): number of bytes
+
+        Returns:
+            bytes
+
+        Raises:
+            asyncio.IncompleteReadError at the end of the iterator
+        """
+        while len(self.buffer) < _size:
+            chunk = await self.__next_chunk__()
+            if chunk is None:
+                partial = bytes(self.buffer)
+                self.buffer.clear()
+                raise asyncio.IncompleteReadError(partial, _size)
+            self.buffer += chunk
+        data = bytes(self.buffer[:_size])
+        del self.buffer[:_size]
+        return data
+
+
+async def iter_stream(_stream, _batch_size=None, **_kwargs):
+    """
+        Async generator which decodes a UDT005 stream (header then flag/size/data chunks, as in a raw.udt file)
+        and yields the decoded profiles.
+        The stream is read only when the next profile is asked for, so that a slow consumer slows down the reading
+        (backpressure, e.g. through the TCP flow control for a socket).
+
+        Parameters
+        ----------
+        _stream : asyncio.StreamReader, or any object with an async readexactly method, or iterator or async iterator of bytes
+                the stream
+        _batch_size : int
+                None to decode and yield the profiles one by one (as soon as they are received),
+                or number of profiles decoded at once to yield one record per batch, configuration and receiving channel
+        _kwargs :
+                selection of the data (_time_begin, _time_end, _configs, _channels, _datatypes, _iq, _iq_complex, see ubt_raw_decoder)
+
+        Yields
+        ------
+    record : dict
+        see ubt_raw_decoder.split_records
+    """
+    reader = _stream if hasattr(_stream, "readexactly") else ubt_byte_reader(_stream)
+    decoder = ubt_raw_decoder(_batch_size or 1, **_kwargs)
+
+    try:
+        parse_header(await reader.readexactly(HEADER_SIZE))
+    except asyncio.IncompleteReadError:
+        print("End of stream")
+        return
+
+    while True:
+        try:
+            flag, size = CHUNK_HEAD.unpack(await reader.readexactly(CHUNK_HEAD.size))
+            data = await reader.readexactly(size) if size else b''
+        except asyncio.IncompleteReadError as error:
+            if error.partial:
+                print("incomplete chunk at the end of the stream (%d bytes)" % len(error.partial))
+            print("End of stream")
+            break
+        if flag not in PROFILE_FLAGS:
+            # profils en attente donnés avec les settings et configs en cours
+            for record in decoder.split_records(decoder.flush(), _batch_size is None):
+                yield record
+        for record in decoder.split_records(decoder.read_chunk(flag, size, data), _batch_size is None):
+            yield record
+    for record in decoder.split_records(decoder.flush(), _batch_size is None):
+        yield record
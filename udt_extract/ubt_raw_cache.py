@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: UTF_8 -*-
+
+# @copyright  this code is the property of Ubertone.
+# You may use this code for your personal, informational, non-commercial purpose.
+# You may not distribute, transmit, display, reproduce, publish, license, create derivative works from, transfer or sell any information, software, products or services based on this code.
+
+# cache disque des données extraites (colonnes .npy et manifest json), relu en mémoire partagée (mmap)
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+from .raw_extract import DEFAULT_MAX_SIZE, raw_extract
+from .ubt_raw_iq import ubt_iq
+
+# to be incremented each time the extracted data change, so that the cached data are extracted again
+EXTRACTOR_VERSION = 1
+
+# cache directory, can be given with the UDT_EXTRACT_CACHE environment variable
+DEFAULT_CACHE_DIR = os.environ.get("UDT_EXTRACT_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "udt_extract"))
+DEFAULT_MAX_CACHE_SIZE = 2000000000 # 2 GB
+
+MANIFEST = "manifest.json"
+
+# arguments of raw_extract which do not change the extracted data (how the file is read, measures), left out of the cache key
+# (_iq_lazy is kept when the size of the file is limited: the lazy IQ samples do not count in _max_size)
+NON_SEMANTIC_KWARGS = ("_stats", "_processes", "_max_memory", "_batch_size", "_index", "_iq_lazy")
+
+# parts of the file read for its signature
+SAMPLE_COUNT = 16
+SAMPLE_SIZE = 65536
+
+
+def file_signature(_raw_file):
+    """Function that gives a signature of a raw.udt file, from its size, its modification time and a hash of samples of its content
+    (the whole file is not read).
+
+    Args:
+        _raw_file (string): file path of raw.udt file
+
+    Returns:
+        signature (string)
+    """
+    stat = os.stat(_raw_file)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(("%d %d" % (stat.st_size, stat.st_mtime_ns)).encode())
+    with open(_raw_file, 'rb') as fd:
+        for offset in np.linspace(0, max(stat.st_size - SAMPLE_SIZE, 0), SAMPLE_COUNT).astype(np.int64).tolist():
+            fd.seek(offset)
+            digest.update(fd.read(SAMPLE_SIZE))
+    return digest.hexdigest()
+
+
+def cache_key(_raw_file, _kwargs):
+    """Function that gives the name of the cache entry of an extraction.
+    The arguments which do not change the extracted data (see NON_SEMANTIC_KWARGS) are not part of the key.
+
+    Args:
+        _raw_file (string): file path of raw.udt file
+        _kwargs (dict): arguments of raw_extract
+
+    Returns:
+        key (string)
+    """
+    kwargs = {key: value for key, value in _kwargs.items() if key not in NON_SEMANTIC_KWARGS}
+    if _kwargs.get("_max_memory") is not None:
+        # avec un budget mémoire, le fichier est extrait en entier et en colonnes (voir raw_extract)
+        kwargs["_max_size"] = None
+        kwargs["_columnar"] = True
+    if kwargs.get("_max_size", DEFAULT_MAX_SIZE) is not None and _kwargs.get("_iq_lazy"):
+        # la taille lue, et donc le nombre de profils extraits, dépend des IQ différés
+        kwargs["_iq_lazy"] = True
+    arguments = repr(sorted((key, repr(value)) for key, value in kwargs.items()))
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(("%s %d %s" % (file_signature(_raw_file), EXTRACTOR_VERSION, arguments)).encode())
+    return digest.hexdigest()
+
+
+def _encode(_value, _directory, _files, _saved):
+    # les tableaux sont enregistrés en .npy, le reste dans le manifest (les clés entières sont conservées)
+    if isinstance(_value, ubt_iq):
+        # les échantillons IQ différés sont lus pour être mis en cache
+        _value = _value.array()
+    if isinstance(_value, np.ndarray):
+        # un tableau partagé (axe de temps d'une configuration) n'est enregistré qu'une fois
+        if id(_value) not in _saved:
+            name = "%05d.npy" % len(_files)
+            np.save(os.path.join(_directory, name), _value, allow_pickle=False)
+            _files.append(name)
+            _saved[id(_value)] = name
+        return {"npy": _saved[id(_value)]}
+    if isinstance(_value, dict):
+        return {"dict": [[key, _encode(value, _directory, _files, _saved)] for key, value in _value.items()]}
+    if isinstance(_value, datetime):
+        return {"datetime": _value.isoformat()}
+    if isinstance(_value, np.generic):
+        return {"value": _value.item()}
+    return {"value": _value}
+
+
+def _decode(_value, _directory, _loaded):
+    if "npy" in _value:
+        if _value["npy"] not in _loaded:
+            _loaded[_value["npy"]] = np.load(os.path.join(_directory, _value["npy"]), mmap_mode='r')
+        return _loaded[_value["npy"]]
+    if "dict" in _value:
+        return {key: _decode(value, _directory, _loaded) for key, value in _value["dict"]}
+    if "datetime" in _value:
+        return datetime.fromisoformat(_value["datetime"])
+    return _value["value"]
+
+
+def save_entry(_result, _directory):
+    """Function that writes the result of raw_extract (in columnar mode) in a cache entry.
+    The entry is written in a temporary directory renamed at the end, so that an entry is never seen incomplete.
+
+    Args:
+        _result (tuple): result of raw_extract
+        _directory (string): directory of the cache entry
+
+    Returns:
+        None
+    """
+    parent = os.path.dirname(_directory)
+    os.makedirs(parent, exist_ok=True)
+    temporary = tempfile.mkdtemp(dir=parent, prefix=".tmp")
+    try:
+        files = []
+        manifest = {"version": EXTRACTOR_VERSION, "result": [_encode(value, temporary, files, {}) for value in _result]}
+        manifest["size"] = sum(os.path.getsize(os.path.join(temporary, name)) for name in files)
+        with open(os.path.join(temporary, MANIFEST), 'w') as fd:
+            json.dump(manifest, fd)
+        try:
+            os.rename(temporary, _directory)
+        except OSError:
+            # entrée écrite en même temps par un autre process
+            shutil.rmtree(temporary, ignore_errors=True)
+    except:
+        shutil.rmtree(temporary, ignore_errors=True)
+        raise
+
+
+def load_entry(_directory):
+    """Function that reads a cache entry, the arrays are memory-mapped (read-only, shared between processes).
+
+    Args:
+        _directory (string): directory of the cache entry
+
+    Returns:
+        the tuple given by raw_extract, or None if there is no valid entry
+    """
+    path = os.path.join(_directory, MANIFEST)
+    try:
+        with open(path) as fd:
+            manifest = json.load(fd)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != EXTRACTOR_VERSION:
+        return None
+    # date du dernier accès, pour l'éviction LRU
+    os.utime(path)
+    loaded = {}
+    return tuple(_decode(value, _directory, loaded) for value in manifest["result"])
+
+
+def evict(_cache_dir=DEFAULT_CACHE_DIR, _max_cache_size=DEFAULT_MAX_CACHE_SIZE):
+    """Function that removes the least recently used entries of the cache until its size is below a limit.
+
+    Args:
+        _cache_dir (string): cache directory
+        _max_cache_size (int): maximum size of the cache (in bytes)
+
+    Returns:
+        None
+    """
+    entries = []
+    for name in os.listdir(_cache_dir):
+        path = os.path.join(_cache_dir, name, MANIFEST)
+        try:
+            with open(path) as fd:
+                size = json.load(fd)["size"]
+            entries.append((os.path.getmtime(path), size, os.path.join(_cache_dir, name)))
+        except (OSError, ValueError, KeyError):
+            continue
+    total_size = sum(entry[1] for entry in entries)
+    for _, size, directory in sorted(entries):
+        if total_size <= _max_cache_size:
+            break
+        shutil.rmtree(directory, ignore_errors=True)
+        total_size -= size
+
+
+def clear_cache(_cache_dir=DEFAULT_CACHE_DIR):
+    """Function that removes all the entries of the cache.
+
+    Args:
+        _cache_dir (string): cache directory
+
+    Returns:
+        None
+    """
+    evict(_cache_dir, 0)
+
+
+def cached_extract(_raw_file, _cache_dir=DEFAULT_CACHE_DIR, _max_cache_size=DEFAULT_MAX_CACHE_SIZE, **_kwargs):
+    """
+        This method gives the result of raw_extract in columnar mode, from the cache when the file was already extracted
+        with the same arguments (and the same extractor version), otherwise the file is extracted and the result is cached.
+
+        Parameters
+        ----------
+        _raw_file : string
+                path to .udt file
+        _cache_dir : string
+                cache directory
+        _max_cache_size : int
+                maximum size of the cache (in bytes), the least recently used entries are removed beyond
+        _kwargs :
+                arguments of raw_extract (_columnar is always True)
+
+        Returns
+        -------
+    the tuple given by raw_extract, with read-only memory-mapped arrays when read from the cache
+    """
+    _kwargs["_columnar"] = True
+    directory = os.path.join(_cache_dir, cache_key(_raw_file, _kwargs))
+    result = load_entry(directory)
+    if result is not None:
+        print("%s read from cache %s" % (_raw_file, directory))
+        return result
+
+    result = raw_extract(_raw_file, **_kwargs)
+    save_entry(result, directory)
+    evict(_cache_dir, _max_cache_size)
+    return result
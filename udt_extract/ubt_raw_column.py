@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: UTF_8 -*-
+
+# @copyright  this code is the property of Ubertone.
+# You may use this code for your personal, informational, non-commercial purpose.
+# You may not distribute, transmit, display, reproduce, publish, license, create derivative works from, transfer or sell any information, software, products or services based on this code.
+
+# stockage en colonnes contiguës des données extraites (une ligne par profil)
+
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+
+class ubt_memory_budget:
+    def __init__(self, _max_memory, _directory=None):
+        """Function that initiates a memory budget shared by columns:
+        the arrays are allocated in memory as long as the budget allows it, then in memory-mapped temporary files
+        (spill to disk), so that the size of the extracted data is not limited by the memory.
+
+        Args:
+            _max_memory (int): memory allowed for the arrays of the columns (in bytes)
+            _directory (string): directory of the temporary files, None for the default temporary directory
+
+        Returns:
+            None
+        """
+        self.max_memory = _max_memory
+        self.directory = _directory
+        # memory used by the arrays allocated in memory
+        self.used = 0
+
+    def allocate(self, _shape, _dtype):
+        """Function that allocates an array, in memory or in a temporary file.
+
+        Args:
+            _shape (tuple): shape of the array
+            _dtype (numpy dtype): type of the array
+
+        Returns:
+            numpy array (np.memmap for a temporary file)
+        """
+        nbytes = int(np.prod(_shape)) * np.dtype(_dtype).itemsize
+        if nbytes == 0 or self.used + nbytes <= self.max_memory:
+            self.used += nbytes
+            return np.empty(_shape, dtype=_dtype)
+        # le fichier temporaire est supprimé (sans nom) : il disparaît avec le dernier tableau qui l'utilise
+        with tempfile.TemporaryFile(dir=self.directory) as fd:
+            return np.memmap(fd, dtype=_dtype, mode='w+', shape=_shape)
+
+    def release(self, _array):
+        """Function that gives back to the budget the memory of an array which is not used any more.
+
+        Args:
+            _array (numpy array): array given by allocate
+
+        Returns:
+            None
+        """
+        if not isinstance(_array, np.memmap):
+            self.used -= _array.nbytes
+
+
+class ubt_column:
+    def __init__(self, _capacity=0, _budget=None, _dtype=None, _line_shape=()):
+        """Function that initiates a column: a contiguous array with one line per profile, which grows as lines are added.
+        The array is allocated at the first added line, with _capacity lines (or more if needed),
+        then its size is doubled each time it is full.
+        The column can be used as the lists of the "time" and "data" keys (append, extend, len).
+        Lines given as datetime are stored as datetime64[us], lines given as dicts (IQ) are stored in one column per key.
+
+        Args:
+            _capacity (int): number of lines to allocate (e.g. number of profiles in the file)
+            _budget (ubt_memory_budget): memory budget used for the allocations, None to allocate in memory
+            _dtype (numpy dtype): type of the lines, given by array() when no line was added (float64 if None)
+            _line_shape (tuple): shape of one line, given by array() when no line was added
+
+        Returns:
+            None
+        """
+        self.capacity = _capacity
+        self.budget = _budget
+        self.dtype = np.dtype(np.float64 if _dtype is None else _dtype)
+        self.line_shape = tuple(_line_shape)
+        self.size = 0
+        self.buffer = None
+        # sub-columns when the lines are dicts
+        self.fields = None
+
+    def __len__(self):
+        return self.size
+
+    def reserve(self, _capacity):
+        """Function that makes sure that the column can hold a given number of lines without reallocation.
+
+        Args:
+            _capacity (int): number of lines
+
+        Returns:
+            None
+        """
+        if _capacity > self.capacity:
+            self.capacity = _capacity
+            if self.buffer is not None:
+                self.__grow__(_capacity)
+        if self.fields is not None:
+            for column in self.fields.values():
+                column.reserve(_capacity)
+
+    def __allocate__(self, _shape, _dtype):
+        if self.budget is None:
+            return np.empty(_shape, dtype=_dtype)
+        return self.budget.allocate(_shape, _dtype)
+
+    def __grow__(self, _capacity):
+        buffer = self.__allocate__((_capacity,) + self.buffer.shape[1:], self.buffer.dtype)
+        buffer[:self.size] = self.buffer[:self.size]
+        if self.budget is not None:
+            self.budget.release(self.buffer)
+        self.buffer = buffer
+
+    def append(self, _value):
+        """Function that adds one line at the end of the column.
+
+        Args:
+            _value: the line (scalar, vector, datetime or dict of vectors)
+
+        Returns:
+            None
+        """
+        self.extend([_value])
+
+    def extend(self, _values):
+        """Function that adds lines at the end of the column.
+
+        Args:
+            _values: array (first dimension along the lines), list of lines, or dict of arrays for dict lines
+
+        Returns:
+            None
+        """
+        if isinstance(_values, dict):
+            # lines given by batch: dict of arrays (first dimension along the lines)
+            if self.fields is None:
+                self.fields = {key: ubt_column(self.capacity, self.budget) for key in _values.keys()}
+            for key, column in self.fields.items():
+                column.extend(_values[key])
+            self.size += len(next(iter(_values.values())))
+            return
+
+        if not len(_values):
+            return
+
+        if isinstance(_values[0], dict):
+            if self.fields is None:
+                self.fields = {key: ubt_column(self.capacity, self.budget) for key in _values[0].keys()}
+            for key, column in self.fields.items():
+                column.extend(np.asarray([value[key] for value in _values]))
+            self.size += len(_values)
+            return
+
+        if isinstance(_values, np.ndarray):
+            values = _values
+        elif isinstance(_values[0], datetime):
+            values = np.array(_values, dtype="datetime64[us]")
+        else:
+            values = np.asarray(_values)
+
+        if self.buffer is None:
+            self.buffer = self.__allocate__((max(self.capacity, len(values)),) + values.shape[1:], values.dtype)
+        elif self.size + len(values) > len(self.buffer):
+            self.__grow__(max(2 * len(self.buffer), self.size + len(values)))
+        self.buffer[self.size:self.size + len(values)] = values
+        self.size += len(values)
+
+    def array(self):
+        """Function that gives the content of the column, without the unused lines.
+        The unused allocated lines are released (the used lines are copied in a new array, or trimmed for a memory-mapped array):
+        the arrays already given are left unchanged.
+
+        Returns:
+            array with one line per added line (or dict of arrays for dict lines)
+        """
+        if self.fields is not None:
+            return {key: column.array() for key, column in self.fields.items()}
+        if self.buffer is None:
+            return np.empty((0,) + self.line_shape, dtype=self.dtype)
+        if len(self.buffer) != self.size:
+            if isinstance(self.buffer, np.memmap):
+                self.buffer = self.buffer[:self.size]
+            else:
+                buffer = self.buffer[:self.size].copy()
+                if self.budget is not None:
+                    self.budget.used -= self.buffer.nbytes - buffer.nbytes
+                self.buffer = buffer
+        return self.buffer
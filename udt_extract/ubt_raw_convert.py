@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: UTF_8 -*-
+
+# @copyright  this code is the property of Ubertone.
+# You may use this code for your personal, informational, non-commercial purpose.
+# You may not distribute, transmit, display, reproduce, publish, license, create derivative works from, transfer or sell any information, software, products or services based on this code.
+
+# conversion différée des profils extraits en codes bruts (_dtype="raw")
+
+import numpy as np
+
+from .ubt_raw_data import DATATYPES_AVG, DATATYPES_INST, RAW_SCALE, RAW_SCALE_FIELDS
+
+
+def raw_hardware(_datatypes):
+    """Function that gives the hardware object converting profiles, from their datatypes
+    (averaged profiles for the apf04 board, instantaneous profiles for the apf06 board, as in ubt_raw_data.set_config).
+
+    Args:
+        _datatypes (iterable of string): datatypes of the profiles
+
+    Returns:
+        apf04_hardware or apf06_hardware
+    """
+    if any(datatype in DATATYPES_AVG for datatype in _datatypes):
+        from .apf04_hardware import apf04_hardware
+        return apf04_hardware()
+    from .apf06_hardware import apf06_hardware
+    return apf06_hardware()
+
+
+def convert_raw_vectors(_vectors, _raw_scale, _param_us, _dtype=np.float64):
+    """Function that converts profiles extracted with _dtype="raw", e.g. the vectors of a record of iter_profiles.
+
+    Args:
+        _vectors (dict): int16 codes of the profiles keyed by datatype, 1D arrays for one profile or 2D arrays (one line per profile)
+        _raw_scale (array): raw scale of the profiles (see RAW_SCALE_FIELDS), shape (5) for one profile or (n_profiles, 5)
+        _param_us (dict): param_us dict of the configuration and channel
+        _dtype: precision of the converted profiles (np.float64 or np.float32)
+
+    Returns:
+        dict of the converted vectors keyed by datatype (the saturation is given unchanged)
+    """
+    datatypes = DATATYPES_AVG if any(datatype in DATATYPES_AVG for datatype in _vectors) else DATATYPES_INST
+    vectors_dict = {datatypes[datatype]: np.asarray(vector) for datatype, vector in _vectors.items() if datatype in datatypes}
+
+    raw_scale = np.asarray(_raw_scale, dtype=np.int64)
+    if raw_scale.shape[-1] != len(RAW_SCALE_FIELDS):
+        raise Exception('raw scale', "%d values expected by profile (%s)" % (len(RAW_SCALE_FIELDS), ", ".join(RAW_SCALE_FIELDS)))
+    if raw_scale.ndim == 2 and len(raw_scale) == 0:
+        # aucun profil
+        return {datatype: np.asarray(vector).astype(bool if datatypes[datatype] == "sat" else _dtype)
+                for datatype, vector in _vectors.items() if datatype in datatypes}
+    sound_speed, gain_ca0, gain_ca1, blind_ca0, blind_ca1 = np.moveaxis(raw_scale, -1, 0)
+
+    # la zone aveugle est la même pour tous les profils d'une configuration
+    raw_hardware(_vectors).conversion_profile(vectors_dict, sound_speed, _param_us["n_cell"], _param_us["n_avg"], _param_us["f0"] / _param_us["prf"],
+                                              gain_ca0, gain_ca1, blind_ca0.flat[0], blind_ca1.flat[0], np.dtype(_dtype))
+    return {datatype: vectors_dict[datatypes[datatype]] for datatype in _vectors if datatype in datatypes}
+
+
+def convert_raw(_datatypes, _param_us, _dtype=np.float64):
+    """Function that converts the profiles of a configuration and a channel extracted with _dtype="raw".
+
+    Args:
+        _datatypes (dict): "time"/"data" dicts keyed by datatype of the configuration and channel
+            (data_us_dicts[config][channel] given by raw_extract), with the RAW_SCALE datatype
+        _param_us (dict): param_us dict of the configuration and channel
+        _dtype: precision of the converted profiles (np.float64 or np.float32)
+
+    Returns:
+        dict of "time"/"data" dicts keyed by datatype, as given by raw_extract without _dtype="raw"
+        (arrays in columnar mode, lists of arrays otherwise), the other datatypes are given unchanged
+    """
+    if RAW_SCALE not in _datatypes:
+        raise Exception('raw scale', "no %s datatype, the profiles were not extracted with _dtype=\"raw\"" % RAW_SCALE)
+    raw_scale = _datatypes[RAW_SCALE]["data"]
+    profiles = [datatype for datatype in _datatypes if datatype in DATATYPES_AVG or datatype in DATATYPES_INST]
+
+    converted = {}
+    if len(raw_scale):
+        converted = convert_raw_vectors({datatype: np.asarray(_datatypes[datatype]["data"]) for datatype in profiles}, raw_scale, _param_us, _dtype)
+
+    datatypes = {}
+    for datatype, entry in _datatypes.items():
+        if datatype == RAW_SCALE:
+            continue
+        if datatype in converted:
+            # même forme que les données extraites (tableau ou liste de profils)
+            data = converted[datatype] if isinstance(entry["data"], np.ndarray) else list(converted[datatype])
+            datatypes[datatype] = {"time": entry["time"], "data": data}
+        else:
+            datatypes[datatype] = entry
+    return datatypes
@@ -6,25 +6,66 @@
 # @author Stéphane Fischer
 
 #from ctypes import sizeof
-from struct import calcsize, unpack
+from struct import calcsize, unpack, unpack_from
 from string import ascii_letters
 import numpy as np
 from numpy import asarray as ar
 
-from peacock_uvp.apf_timestamp import decode_timestamp
-
 from .convert_type import translate_key
-from .date_parser import date_parse
+from .date_parser import decode_timestamps, decode_timestamp_values
+from .ubt_raw_column import ubt_column, ubt_memory_budget
 from .ubt_raw_config import paramus_rawdict2ormdict
+from .ubt_raw_flag import *
+from .ubt_raw_iq import iq_to_complex, ubt_iq
+from .ubt_raw_plan import CELL_FIELDS_AVG, CELL_FIELDS_INST, PROFILE_HEAD, PROFILE_NOISE, PROFILE_SCALARS, ubt_decode_plan
+from .ubt_raw_stats import get_stats
+
+# datatypes of the profiles and corresponding converted vectors
+DATATYPES_AVG = {"echo_avg_profile": "amplitude", "saturation_avg_profile": "sat", "velocity_avg_profile": "velocity",
+                 "snr_doppler_avg_profile": "snr", "velocity_std_profile": "std"}
+DATATYPES_INST = {"echo_profile": "amplitude", "saturation_profile": "sat", "velocity_profile": "velocity",
+                  "snr_doppler_profile": "snr"}
+
+# _dtype of the raw mode: the profiles are given as int16 codes, with the raw scale of each profile
+RAW = "raw"
+# datatype of the raw scale, codes needed to convert a profile (see ubt_raw_convert)
+RAW_SCALE = "raw_scale"
+RAW_SCALE_FIELDS = ("sound_speed", "gain_ca0", "gain_ca1", "blind_ca0", "blind_ca1")
+
+def iq_rows (_iq):
+    """Function that splits batched IQ samples in one item per profile.
+
+    Args:
+        _iq: IQ dict of (n_profiles, n_p, n_vol) arrays, complex array (n_profiles, n_p, n_vol) or lazy handle (see ubt_raw_iq)
+
+    Returns:
+        list of IQ dicts of (n_p, n_vol) arrays, of complex arrays (n_p, n_vol) or of handles on one profile
+        (the int16 arrays are copied, the decoded chunks being read-only)
+    """
+    if isinstance(_iq, ubt_iq):
+        return [_iq[rank:rank+1] for rank in range(len(_iq))]
+    if isinstance(_iq, dict):
+        return [{"i": i.copy(), "q": q.copy()} for i, q in zip(_iq["i"], _iq["q"])]
+    return list(_iq)
 
 class ubt_raw_data () :
-    def __init__ (self, _const):
+    def __init__ (self, _const, _columnar=False, _iq_complex=False, _iq_source=None, _max_memory=None, _stats=None, _dtype=np.float64):
         """Function that initiates z ubt_raw_data object which contains the data read in a raw.udt file.
 
         Args:
             param_us_dicts (dict): dicts of the param_us for each config and each receiving channel
             blind_ca0 (float): intercept of limitation of gain in blind zone
             blind_ca1 (float): slope of limitation of gain in blind zone
+            _columnar (bool): store the data in contiguous columns (see ubt_column) instead of lists,
+                finalize() then gives one array per datatype, with a datetime64 time vector
+            _iq_complex (bool): give the IQ samples as complex64 arrays (I + jQ) instead of dicts of "i" and "q" int16 arrays
+            _iq_source (string): file path of the raw.udt file to give the IQ samples as lazy handles (see ubt_raw_iq),
+                the positions of the profiles in the file are then needed, None to decode the IQ samples
+            _max_memory (int): memory budget (in bytes) of the columns (columnar mode), beyond which the columns
+                are allocated in memory-mapped temporary files (see ubt_memory_budget), None for no limit
+            _stats (ubt_stats): time spent in each decode stage (see ubt_raw_stats), None to disable the measures
+            _dtype: precision of the converted profiles (np.float64 or np.float32), or RAW to keep the int16 codes
+                of the profiles, with their raw scale (see RAW_SCALE_FIELDS and ubt_raw_convert)
 
         Returns:
             None
@@ -45,10 +86,251 @@ class ubt_raw_data () :
         elif self.board == "apf06" :
             from .apf06_hardware import apf06_hardware
             self.hardware = apf06_hardware()
+        self.stats = get_stats(_stats)
+        self.hardware.stats = self.stats
 
         self.current_config = None
         self.current_channel = None
 
+        self.columnar = _columnar
+        self.iq_complex = _iq_complex
+        self.iq_source = _iq_source
+        self.budget = None if _max_memory is None else ubt_memory_budget(_max_memory)
+        # précision des profils convertis, None pour garder les codes (mode RAW)
+        if isinstance(_dtype, str) and _dtype == RAW:
+            self.dtype = None
+        else:
+            self.dtype = np.dtype(_dtype)
+            if self.dtype not in (np.float32, np.float64):
+                raise Exception('dtype', "float32, float64 or \"%s\" expected, not %s" % (RAW, _dtype))
+        # nombre de profils attendus par config (pour dimensionner les colonnes)
+        self.profile_counts = {}
+
+        # sélection des données à extraire (None : tout)
+        self.configs = None
+        self.channels = None
+        self.datatypes = None
+        self.iq = True
+        # datatypes des scalaires (voir translated_key)
+        self.translated_keys = {}
+
+        # plans de décodage par configuration (voir set_config)
+        self.plans = {}
+        # axes de temps partagés par les datatypes, par (config, flux) (voir time_axis)
+        self.time_axes = {}
+        # list of blind zone gain parameters :
+        self.blind_ca0 = []
+        self.blind_ca1 = []
+
+    def select (self, _configs=None, _channels=None, _datatypes=None, _iq=True):
+        """Function that restricts the data to extract, to be called before set_config.
+        The profiles of the other configurations are not expected (see ubt_raw_decoder), the other channels and datatypes are neither converted nor stored.
+
+        Args:
+            _configs (list of int): configuration numbers, None for all configurations
+            _channels (list of int): receiving channels, None for all channels
+            _datatypes (list of string): datatypes (e.g. "velocity_avg_profile", "temperature", "iq"), None for all datatypes
+            _iq (bool): extract the IQ samples
+
+        Returns:
+            None
+        """
+        self.configs = None if _configs is None else set(_configs)
+        self.channels = None if _channels is None else set(_channels)
+        self.datatypes = None if _datatypes is None else set(_datatypes)
+        self.iq = _iq and self.is_selected("iq")
+        self.translated_keys = {}
+
+    def is_selected (self, _datatype):
+        """Function that tells if a datatype is in the selection.
+
+        Args:
+            _datatype (string): datatype
+
+        Returns:
+            bool
+        """
+        return self.datatypes is None or _datatype in self.datatypes
+
+    def selected_datatypes (self, _inst=False):
+        """Function that gives the selected datatypes of the profiles.
+
+        Args:
+            _inst (bool): instantaneous profiles
+
+        Returns:
+            dict of the names of the converted vectors keyed by datatype (see DATATYPES_AVG and DATATYPES_INST)
+        """
+        datatypes = DATATYPES_INST if _inst else DATATYPES_AVG
+        return {datatype: key for datatype, key in datatypes.items() if self.is_selected(datatype)}
+
+    def selected_fields (self, _inst=False):
+        """Function that gives the coded values of the cells needed for the selected datatypes.
+
+        Args:
+            _inst (bool): instantaneous profiles
+
+        Returns:
+            set of names of the cell fields (see CELL_FIELDS_AVG and CELL_FIELDS_INST)
+        """
+        # la saturation est donnée par le signe de l'amplitude
+        return {"amplitude" if key == "sat" else key for key in self.selected_datatypes(_inst).values()}
+
+    def translated_key (self, _key, _us=True):
+        """Function that gives the datatype of a scalar, translated once for each key.
+
+        Args:
+            _key (string): name of the scalar (e.g. "temp", "noise_g_max")
+            _us (bool): US scalar, which can also be a variable US parameter (e.g. "a0_param")
+
+        Returns:
+            datatype (string), or None if the scalar is not translated or not selected
+        """
+        try:
+            return self.translated_keys[(_key, _us)]
+        except KeyError:
+            pass
+        translated_key = translate_key(_key)
+        # gestion des scalaires qui sont des paramètres us variables (auto)
+        if translated_key == None and _us:
+            translated_key = translate_key(_key, _type="param_var")
+            if translated_key:
+                translated_key = translated_key+"_param"
+        if translated_key and not self.is_selected(translated_key):
+            translated_key = None
+        self.translated_keys[(_key, _us)] = translated_key
+        return translated_key
+
+    def new_column (self, _config=None, _dtype=None, _line_shape=()):
+        """Function that creates a list, or a column sized with the expected number of profiles (columnar mode).
+
+        Args:
+            _config (int): configuration number of the US data, None for non US data
+            _dtype (numpy dtype): type of the lines of the column, kept when no profile is stored (float64 if None)
+            _line_shape (tuple): shape of one line of the column (e.g. (n_cell,) for a profile)
+
+        Returns:
+            list or ubt_column
+        """
+        if not self.columnar:
+            return []
+        if _config is None:
+            capacity = sum(self.profile_counts.values())
+        else:
+            capacity = self.profile_counts.get(_config, 0)
+        return ubt_column(capacity, self.budget, _dtype, _line_shape)
+
+    def time_axis (self, _config=None, _stream="profile"):
+        """Function that gives the time axis shared by all the datatypes of a configuration and a record stream,
+        created at the first call: the timestamps of a profile are stored once, whatever the number of datatypes and channels.
+
+        Args:
+            _config (int): configuration number of the US data, None for non US data
+            _stream (string): "profile" for the profiles and the scalars, "iq" for the IQ samples
+
+        Returns:
+            list (or column) of the timestamps
+        """
+        axis = self.time_axes.get((_config, _stream))
+        if axis is None:
+            axis = self.time_axes[(_config, _stream)] = self.new_column(_config, "datetime64[us]")
+        return axis
+
+    def new_entry (self, _config=None, _stream="profile", _dtype=None, _line_shape=()):
+        """Function that creates the "time"/"data" dict of one datatype.
+        The "time" is the time axis of the configuration (see time_axis): it is the same object for all the datatypes
+        and channels of a configuration.
+
+        Args:
+            _config (int): configuration number of the US data, None for non US data
+            _stream (string): record stream of the time axis (see time_axis)
+            _dtype, _line_shape: type and shape of one line of the data (see new_column)
+
+        Returns:
+            dict with keys "time" and "data" (lists, or columns sized with the expected number of profiles)
+        """
+        return {"time": self.time_axis(_config, _stream), "data": self.new_column(_config, _dtype, _line_shape)}
+
+    def new_iq_entry (self, _config, _channel):
+        """Function that creates the "time"/"data" dict of the IQ samples of a channel.
+
+        Args:
+            _config (int): configuration number
+            _channel (int): receiving channel
+
+        Returns:
+            dict with keys "time" and "data" (see new_entry), "data" is a lazy handle with _iq_source
+        """
+        entry = self.new_entry(_config, "iq")
+        if self.iq_source is not None:
+            plan = self.plans[_config]
+            entry["data"] = ubt_iq(self.iq_source, (plan.n_p, plan.n_vol, plan.nb_rx), plan.channels.index(_channel), self.iq_complex)
+        return entry
+
+    def loaded_size (self, _flag, _size, _data):
+        """Function that gives the size of the data of a chunk which are loaded, the IQ samples of the lazy handles being left in the file.
+
+        Args:
+            _flag (int): identification flag for data in the chunk
+            _size (int): size of the data in the chunk
+            _data (bytes-like object): data in the chunk
+
+        Returns:
+            size (int)
+        """
+        if _flag != PROFILE_INST_IQ_TAG or self.iq_source is None:
+            return _size
+        config = int(unpack_from('h', _data)[0] & 0x0000000F) + 1
+        if config not in self.param_us_dicts:
+            return _size
+        return self.profile_dtype(config, _size, True, True).fields["iq"][1]
+
+    def reserve (self, _profile_counts):
+        """Function that gives the number of profiles of each configuration, known in advance (e.g. from the chunk index),
+        so that the columns are allocated once at their final size.
+
+        Args:
+            _profile_counts (dict): number of profiles keyed by configuration number
+
+        Returns:
+            None
+        """
+        self.profile_counts = dict(_profile_counts)
+        if not self.columnar:
+            return
+        for config, channels in self.data_us_dicts.items():
+            for datatypes in channels.values():
+                for entry in datatypes.values():
+                    entry["data"].reserve(self.profile_counts.get(config, 0))
+        for entry in self.data_dicts.values():
+            entry["data"].reserve(sum(self.profile_counts.values()))
+        for (config, _), axis in self.time_axes.items():
+            axis.reserve(sum(self.profile_counts.values()) if config is None else self.profile_counts.get(config, 0))
+
+    def finalize (self):
+        """Function that replaces the columns by their arrays, once all the profiles are read (columnar mode only).
+
+        Returns:
+            None
+        """
+        if not self.columnar:
+            return
+        with self.stats.stage("finalize"):
+            self.__finalize_columns__()
+
+    def __finalize_columns__ (self):
+        # les axes de temps partagés restent partagés
+        for key, axis in self.time_axes.items():
+            if isinstance(axis, ubt_column):
+                self.time_axes[key] = axis.array()
+        entries = [entry for channels in self.data_us_dicts.values() for datatypes in channels.values() for entry in datatypes.values()]
+        entries += list(self.data_dicts.values())
+        for entry in entries:
+            if isinstance(entry["data"], ubt_column):
+                entry["data"] = entry["data"].array()
+            if isinstance(entry["time"], ubt_column):
+                entry["time"] = entry["time"].array()
+
     def set_config (self, _settings):
 
         param_us_dicts = paramus_rawdict2ormdict(_settings)
@@ -57,29 +339,90 @@ class ubt_raw_data () :
         # list of blind zone gain parameters :
         self.blind_ca0 = []
         self.blind_ca1 = []
+        self.plans = {}
 
         for config in self.param_us_dicts.keys():
+            if self.configs is not None and config not in self.configs:
+                continue
             self.data_us_dicts[config] = {}
+            # les données de la configuration repartent de zéro, ainsi que leurs axes de temps
+            self.time_axes.pop((config, "profile"), None)
+            self.time_axes.pop((config, "iq"), None)
 
             for channel in self.param_us_dicts[config].keys():
+                if self.channels is not None and channel not in self.channels:
+                    continue
                 self.data_us_dicts[config][channel] = {}
-                if self.board == "apf06" : # test pas idéal, mais fonctionnel dans l'état actuel
-                    for datatype in ["echo_profile", "saturation_profile", "velocity_profile", "snr_doppler_profile"]:
-                        self.data_us_dicts[config][channel][datatype] = {"time": [], "data": []}
-                else :
-                    for datatype in ["echo_avg_profile", "saturation_avg_profile", "velocity_avg_profile", "snr_doppler_avg_profile", "velocity_std_profile"]:
-                        self.data_us_dicts[config][channel][datatype] = {"time":[], "data":[]}
-
+                # type des profils, gardé même si aucun profil n'est lu
+                profile_shape = (self.param_us_dicts[config][channel]["n_cell"],)
+                profile_dtype = np.int16 if self.dtype is None else self.dtype
+                # test pas idéal, mais fonctionnel dans l'état actuel
+                for datatype, key in self.selected_datatypes(self.board == "apf06").items():
+                    dtype = bool if key == "sat" else profile_dtype
+                    self.data_us_dicts[config][channel][datatype] = self.new_entry(config, "profile", dtype, profile_shape)
+                if self.dtype is None:
+                    self.data_us_dicts[config][channel][RAW_SCALE] = self.new_entry(config, "profile", np.int16, (len(RAW_SCALE_FIELDS),))
+
+            # ce qui ne change pas d'un profil à l'autre est calculé une fois
+            self.plans[config] = ubt_decode_plan(config, self.param_us_dicts[config], list(self.data_us_dicts[config].keys()),
+                                                 self.selected_datatypes(False), self.selected_datatypes(True))
 
     def set_confighw (self, _size, _data):
         blind_ca0, blind_ca1 = unpack('%dh'%2, _data[_size-2*calcsize('h'):_size])
-        
+        self.set_blind_zone(blind_ca0, blind_ca1)
+
+    def set_blind_zone (self, _blind_ca0, _blind_ca1):
+        """Function that gives the blind zone gain parameters of the next configuration (config chunks are in the configuration order).
+
+        Args:
+            _blind_ca0, _blind_ca1 (int): intercept and slope of limitation of gain in blind zone
+
+        Returns:
+            None
+        """
         # les config HW (toujours écrits dans l'ordre dans le raw)
         # we use a list with config id (0..N-1) as index
-        self.blind_ca0.append(blind_ca0)
-        self.blind_ca1.append(blind_ca1)
+        self.blind_ca0.append(_blind_ca0)
+        self.blind_ca1.append(_blind_ca1)
+        plan = self.plans.get(len(self.blind_ca0))
+        if plan is not None:
+            plan.blind_ca0 = _blind_ca0
+            plan.blind_ca1 = _blind_ca1
+
+    def convert_vectors (self, _vectors_dict, _plan, _sound_speed, _gain_ca0, _gain_ca1):
+        """Function that converts the vectors of the selected receivers with the precision of _dtype,
+        or keeps their codes in RAW mode (only the saturation is given by the sign of the amplitude).
+
+        Args:
+            _vectors_dict (dict): vectors (n_rx, n_vol) or (n_rx, n_profiles, n_vol) keyed by cell field, converted in place
+            _plan (ubt_decode_plan): decode plan of the configuration
+            _sound_speed, _gain_ca0, _gain_ca1 (int or arrays of int): codes of the profiles
 
-    def read_line (self, size, data, _inst=False, _iq=False) :
+        Returns:
+            None
+        """
+        if self.dtype is None:
+            if "amplitude" in _vectors_dict:
+                _vectors_dict["sat"] = _vectors_dict["amplitude"] < 0
+            return
+        self.hardware.conversion_profile(_vectors_dict, _sound_speed, _plan.n_vol, _plan.n_avg, _plan.c_prf, _gain_ca0, _gain_ca1, _plan.blind_ca0, _plan.blind_ca1, self.dtype)
+
+    def raw_scale (self, _plan, _sound_speed, _gain_ca0, _gain_ca1):
+        """Function that gives the raw scale of profiles, the codes needed to convert them later (see ubt_raw_convert).
+
+        Args:
+            _plan (ubt_decode_plan): decode plan of the configuration
+            _sound_speed, _gain_ca0, _gain_ca1 (int or arrays of int): codes of the profiles
+
+        Returns:
+            int16 array of the values of RAW_SCALE_FIELDS, (5) or (n_profiles, 5) for a batch
+        """
+        # les paramètres de zone aveugle ne sont donnés que par les configs HW (non utilisés sur APF06)
+        blind_ca0 = 0 if _plan.blind_ca0 is None else _plan.blind_ca0
+        blind_ca1 = 0 if _plan.blind_ca1 is None else _plan.blind_ca1
+        return np.stack(np.broadcast_arrays(_sound_speed, _gain_ca0, _gain_ca1, blind_ca0, blind_ca1), axis=-1).astype(np.int16)
+
+    def read_line (self, size, data, _inst=False, _iq=False, _offset=None) :
         """Utilise une frame pour récupérer un profil voulu (pour fichiers UDT005)
         une ligne de profil dans raw UDT005 contient: (ref&0x000007FF)<<4 or int(config_key) puis le raw profile
         le raw profile contient un header puis le profil codé
@@ -87,202 +430,357 @@ class ubt_raw_data () :
         Nous rangeons les données us dans un dict data_us_dicts hiérarchiquement par config, par channel récepteur, par datatype.
         Les données non us sont rangées dans un dict data_dicts par datatype.
         Chaque donnée a ses valeurs listées à la clé "data" et ses timestamps correspondants listés à la clé "time".
-        Il y a donc forte potentielle duplication de la donnée "time", mais cela permet une plus grande liberté dans l'utilisation des données ensuite
-        et couvre le cas où on aurait des données non systématiquement enregristrées (désinchronisées) lors d'un record.
-        Exemple: pour des données d'APF02, on a des données de profils instantanés, mais le gain auto n'est re-calculé qu'à chaque bloc.
+        La liste "time" est partagée par toutes les données d'une configuration (voir time_axis) : chaque timestamp n'est rangé qu'une fois
+        et les données des différents channels sont alignées par construction.
 
         Args:
             _size (int) : la taille du bloc
             _data : le bloc de données binaire
+            _offset (int) : la position du bloc dans le fichier (pour les handles IQ, voir _iq_source)
 
         Returns:
             timestamp
         """
 
-        if _inst :
-            data_per_cell = 3
-        else :
-            data_per_cell = 4
     ##################################################
     #	header reading: timestamp and config reference
     ##################################################
-        head_size = calcsize('hhhh')
-        ref = unpack('h', data[0:2])
+        ref, *packed_time = PROFILE_HEAD.unpack_from(data)
         # ref_config : la référence des settings (numéro unique)
         # print("ref %s" % (ref >> 4))
         # self.current_config : le numéro de la configuration utilisée (1 à 3)
-        self.current_config = int(ref[0] & 0x0000000F) + 1
+        self.current_config = int(ref & 0x0000000F) + 1
+        # plan de décodage de la configuration, calculé à la lecture des settings
+        plan = self.plans.get(self.current_config)
+        if plan is None:
+            raise Exception('chunk', "unexpected number of configurations (%d)" % self.current_config)
+        layout = plan.layout(_inst)
         # get the first channel :
         # TODO fonctionner avec la liste entière, comme dans translator_udt001234 qui fonctionne pour la 2C
-        self.current_channel = list(self.param_us_dicts[self.current_config].keys())[0]
-        #print (self.param_us_dicts[self.current_config].keys())
+        self.current_channel = plan.first_channel
 
-        # print("num config %s" % self.current_config)
-        if self.current_config not in self.data_us_dicts.keys():
-            raise Exception('chunk', "unexpected number of configurations (%d)" % self.current_config)
-
-        #print(convert_packed_timestamp(nsec_pF, nsec_pf, msec))
-        #print(convert_packed_timestamp(nsec_pF, nsec_pf, msec).strftime("%Y-%m-%dT%H:%M:%S.%f"))
-        dt_timestamp, _ = decode_timestamp(data[2:head_size])
-        time = date_parse(dt_timestamp.strftime("%Y-%m-%dT%H:%M:%S.%f"))
-        #print("time", type(time))
-        #print("time", time)
-
-        # A few acoustic parameters which are needed for the following calculations
-        n_vol = self.param_us_dicts[self.current_config][self.current_channel]["n_cell"]
-        c_prf = self.param_us_dicts[self.current_config][self.current_channel]["f0"] / \
-                self.param_us_dicts[self.current_config][self.current_channel]["prf"]
-        n_avg = self.param_us_dicts[self.current_config][self.current_channel]["n_avg"]
-        r_dvol = self.param_us_dicts[self.current_config][self.current_channel]['r_dcell']
-        r_vol1 = self.param_us_dicts[self.current_config][self.current_channel]['r_cell1']
-        n_p    = self.param_us_dicts[self.current_config][self.current_channel]["n_p"]
-        nb_rx = len(self.param_us_dicts[self.current_config])
-
-        #print ("n_vol = %d ; nb_rx = %d"%(n_vol, nb_rx))
+        with self.stats.stage("timestamps"):
+            time = decode_timestamp_values(*packed_time)
 
     ###################
     #	scalars reading
     ###################
-        scalars_size = calcsize('hhhhhh')
-        scalars_us_dict = {}
-        scalars_dict = {}
-        scalars_dict['pitch'], scalars_dict['roll'], scalars_dict['temp'], sound_speed, scalars_us_dict['gain_ca0'], scalars_us_dict['gain_ca1'] = unpack('hhhhhh', data[head_size:head_size+scalars_size])
-
-
-        for _ in range(nb_rx):
+        with self.stats.stage("unpack", size):
+            scalars_us_dict = {}
+            scalars_dict = {}
+            scalars_dict['pitch'], scalars_dict['roll'], scalars_dict['temp'], sound_speed, scalars_us_dict['gain_ca0'], scalars_us_dict['gain_ca1'] = PROFILE_SCALARS.unpack_from(data, plan.scalars_offset)
             # TODO attention il faudra traiter individuellement le bruit de chaque ligne
-            scalars_us_dict['noise_g_max'], scalars_us_dict['noise_g_mid'] = unpack("hh", data[head_size+scalars_size:head_size+scalars_size+calcsize('hh')])
-            scalars_size += calcsize('hh')
-
-        profile_size = data_per_cell*n_vol*nb_rx*calcsize('h')
+            scalars_us_dict['noise_g_max'], scalars_us_dict['noise_g_mid'] = PROFILE_NOISE.unpack_from(data, plan.noise_offset)
 
-        if _iq:
-            pass # TODO tmp
-            #if (size - (head_size+scalars_size+profile_size) != (n_p*n_vol*nb_rx*2+2)*calcsize('h')):
-            #    raise Exception('iq line size', "expected %d iq data size, but iq data contains %d" % (
-            #        (n_p*n_vol*nb_rx*2+2)*calcsize('h'), (size - (head_size+scalars_size+profile_size))))
-        else:
-            if (size - (head_size+scalars_size)) / (data_per_cell * 2) != n_vol * nb_rx:
+            if not _iq and size != layout["size"]:
                 raise Exception('volume number', "expected %d volumes, but profile data contains %d" % (
-                    n_vol, ((size - (head_size + scalars_size)) / (data_per_cell * 2 * nb_rx))))
-
+                    plan.n_vol, ((size - plan.cells_offset) / (layout["data_per_cell"] * 2 * plan.nb_rx))))
 
     ###################
     #	vectors reading
     ###################
+            # view on the data (no copy), the conversion creates the arrays of the converted values
+            unpacked_data = np.frombuffer(data, dtype=np.int16, count=layout["count"], offset=plan.cells_offset)
+
+        # [offset + i*data_per_cell*nb_tr_rx + meas_data.current_receiver*data_per_cell + velocity_rank ]);
+        cells = unpacked_data.reshape(plan.n_vol, plan.nb_rx, layout["data_per_cell"])
+        # un vecteur (n_rx, n_vol) par donnée, pour tous les récepteurs extraits
+        vectors_dict = {field: np.ascontiguousarray(cells[:, plan.selected_ids, rank].T) for field, rank in layout["fields"]}
+
+    ##################################
+    #	conversion des valeurs codées:
+    ##################################
+        # Note: il faut convertir les scalaires après pour avoir les gains tels que pour la conversion du profil d'echo
+        # tous les récepteurs sont convertis en une fois
+        if plan.selected_channels:
+            with self.stats.stage("conversion", layout["data_per_cell"]*plan.n_vol*2*len(plan.selected_channels)):
+                self.convert_vectors(vectors_dict, plan, sound_speed, scalars_us_dict['gain_ca0'], scalars_us_dict['gain_ca1'])
+            if self.dtype is None:
+                raw_scale = self.raw_scale(plan, sound_speed, scalars_us_dict['gain_ca0'], scalars_us_dict['gain_ca1'])
+
+    ###################################################################################################
+    # rangement dans la liste de dictionnaires de données US (ici tous les profils sont des données US)
+    ###################################################################################################
+        with self.stats.stage("store"):
+            for receiver, (_, channel) in enumerate(plan.selected_channels):
+                self.current_channel = channel
+                entries = self.data_us_dicts[plan.config][channel]
+                for datatype, key in layout["datatypes"].items():
+                    entries[datatype]["data"].append(vectors_dict[key][receiver])
+                if self.dtype is None:
+                    entries[RAW_SCALE]["data"].append(raw_scale)
+
+
+        if _iq and self.iq:
+            with self.stats.stage("iq", size - layout["size"]):
+                # vue (sans copie) sur les échantillons IQ, après le iq_hash
+                iq_offset = plan.iq_offset(_inst)
+                iq_profile = np.frombuffer(data, dtype=np.int16, count=plan.n_p*plan.n_vol*plan.nb_rx*2, offset=iq_offset).reshape(plan.n_p, plan.n_vol, plan.nb_rx, 2)
+
+                for channel_id, channel in plan.selected_channels:
+                    if self.iq_source is not None:
+                        # seule la position des échantillons IQ est gardée
+                        iq_us_dict = ubt_iq(self.iq_source, (plan.n_p, plan.n_vol, plan.nb_rx), channel_id, self.iq_complex, [_offset+iq_offset])
+                    elif self.iq_complex:
+                        iq_us_dict = iq_to_complex(iq_profile[:, :, channel_id])
+                    elif self.columnar:
+                        # vues en lecture seule sur le chunk, copiées dans les colonnes
+                        iq_us_dict = {"i": iq_profile[:, :, channel_id, 0], "q": iq_profile[:, :, channel_id, 1]}
+                    else:
+                        # copies : les tableaux donnés en mode liste sont modifiables
+                        iq_us_dict = {"i": iq_profile[:, :, channel_id, 0].copy(), "q": iq_profile[:, :, channel_id, 1].copy()}
+
+                    if "iq" not in self.data_us_dicts[plan.config][channel].keys():
+                        self.data_us_dicts[plan.config][channel]["iq"] = self.new_iq_entry(plan.config, channel)
+
+                    self.data_us_dicts[plan.config][channel]["iq"]["data"].append(iq_us_dict)
+                if (plan.config, "iq") in self.time_axes:
+                    self.time_axes[(plan.config, "iq")].append(time)
+
+        with self.stats.stage("scalars"):
+            self.hardware.conversion_us_scalar(scalars_us_dict, plan.n_avg, plan.r_dvol, plan.r_vol1)
+            self.conversion_scalar(scalars_dict)
+        # traduction des noms des types de données US:
+        with self.stats.stage("translation"):
+            for key, value in scalars_us_dict.items():
+                # gestion des scalaires qui sont des paramètres us variables (auto)
+                translated_key = self.translated_key(key)
+                if translated_key:
+                    # note : commun à tous les channels en multichannel
+                    for entries in self.data_us_dicts[plan.config].values():
+                        if translated_key not in entries:
+                            entries[translated_key] = self.new_entry(plan.config)
+                        entries[translated_key]["data"].append(value)
+            if (plan.config, "profile") in self.time_axes:
+                self.time_axes[(plan.config, "profile")].append(time)
+
+            # traduction des noms des types de données non US:
+            for key, value in scalars_dict.items():
+                translated_key = self.translated_key(key, False)
+                if translated_key:
+                    if translated_key not in self.data_dicts.keys():
+                        self.data_dicts[translated_key] = self.new_entry()
+                    self.data_dicts[translated_key]["data"].append(value)
+            if (None, "profile") in self.time_axes:
+                self.time_axes[(None, "profile")].append(time)
 
-        vectors_dict = {}
-
-        offset = head_size+scalars_size
-        unpacked_data = ar(unpack('%dh'%(data_per_cell*n_vol*nb_rx), data[offset:offset + data_per_cell*n_vol*nb_rx*calcsize('h')]))
-
-        channels = sorted(self.param_us_dicts[self.current_config].keys())
-        for channel_id in range(len(channels)):
-            #print ("processing %d"%channel_id)
-            self.current_channel = channels[channel_id]
-            # [offset + i*data_per_cell*nb_tr_rx + meas_data.current_receiver*data_per_cell + velocity_rank ]);
-            
-            if _inst :
-                vectors_dict['amplitude'] = unpacked_data[0+3*channel_id::3*nb_rx]
-                vectors_dict['velocity'] = unpacked_data[1+3*channel_id::3*nb_rx]
-                vectors_dict['snr'] = unpacked_data[2+3*channel_id::3*nb_rx]
-            else :
-                #print(unpacked_data)
-                # TODO on pourrait utiliser directement les nom destinés à l'ORM (ça pourrait simplifier la boucle sur les datatype)
-                vectors_dict['velocity'] = unpacked_data[0+4*channel_id::4*nb_rx]
-                vectors_dict['std'] = unpacked_data[1+4*channel_id::4*nb_rx]
-                vectors_dict['amplitude'] = unpacked_data[2+4*channel_id::4*nb_rx]
-                vectors_dict['snr'] = unpacked_data[3+4*channel_id::4*nb_rx]
-
-            # print(vectors_dict)
-
-        ##################################
-        #	conversion des valeurs codées:
-        ##################################
-            
-                # Note: il faut convertir les scalaires après pour avoir les gains tels que pour la conversion du profil d'echo
-            self.hardware.conversion_profile(vectors_dict, sound_speed, n_vol, n_avg, c_prf, scalars_us_dict['gain_ca0'], scalars_us_dict['gain_ca1'], self.blind_ca0[self.current_config-1], self.blind_ca1[self.current_config-1])
-           # elif self.board == "apf06" :
-           #     self.conversion_profile_apf06(vectors_dict, sound_speed, n_vol, c_prf, scalars_us_dict['gain_ca0'], scalars_us_dict['gain_ca1'])
-
-        ###################################################################################################
-        # rangement dans la liste de dictionnaires de données US (ici tous les profils sont des données US)
-        ###################################################################################################
-            if _inst :
-                for datatype in ["echo_profile", "saturation_profile", "velocity_profile", "snr_doppler_profile"]:
-                    self.data_us_dicts[self.current_config][self.current_channel][datatype]["time"].append(time)
-
-                self.data_us_dicts[self.current_config][self.current_channel]["echo_profile"]["data"].append(vectors_dict['amplitude'])
-                self.data_us_dicts[self.current_config][self.current_channel]["saturation_profile"]["data"].append(vectors_dict['sat'])
-                self.data_us_dicts[self.current_config][self.current_channel]["velocity_profile"]["data"].append(vectors_dict['velocity'])
-                self.data_us_dicts[self.current_config][self.current_channel]["snr_doppler_profile"]["data"].append(vectors_dict['snr'])
-            else:
-                for datatype in ["echo_avg_profile", "saturation_avg_profile", "velocity_avg_profile", "snr_doppler_avg_profile",
-                                "velocity_std_profile"]:
-                    self.data_us_dicts[self.current_config][self.current_channel][datatype]["time"].append(time)
-
-                self.data_us_dicts[self.current_config][self.current_channel]["echo_avg_profile"]["data"].append(vectors_dict['amplitude'])
-                self.data_us_dicts[self.current_config][self.current_channel]["saturation_avg_profile"]["data"].append(vectors_dict['sat'])
-                self.data_us_dicts[self.current_config][self.current_channel]["velocity_avg_profile"]["data"].append(vectors_dict['velocity'])
-                self.data_us_dicts[self.current_config][self.current_channel]["snr_doppler_avg_profile"]["data"].append(vectors_dict['snr'])
-                self.data_us_dicts[self.current_config][self.current_channel]["velocity_std_profile"]["data"].append(vectors_dict['std'])
+        return time
 
 
-        if _iq:
-            offset += data_per_cell*n_vol*nb_rx*calcsize('h')
+    def profile_dtype (self, _config, _size, _inst=False, _iq=False):
+        """Function that gives the structured dtype of a profile chunk of a configuration (see ubt_decode_plan.profile_dtype).
 
-            iq_profile = ar(unpack('%dh'%(n_p*n_vol*nb_rx*2 + 2), data[offset:offset+(n_p*n_vol*nb_rx*2+2)*calcsize('h')]))
+        Args:
+            _config (int): configuration number
+            _size (int): size of the profile chunk
+            _inst (bool): instantaneous profile (3 values per cell instead of 4)
+            _iq (bool): profile followed by the IQ samples
 
-            channels = sorted(self.param_us_dicts[self.current_config].keys())
-            for channel_id in range(len(channels)):
+        Returns:
+            numpy dtype with fields ref, timestamp, pitch, roll, temp, sound_speed, gain_ca0, gain_ca1, noise, cells (and iq_hash, iq)
+        """
+        return self.plans[_config].profile_dtype(_size, _inst, _iq)
 
-                iq_us_dict = {"i":[],"q":[]}
-                for ech in range(n_p):
-                    # on commence après le iq_hash --> 1+
-                    iq_us_dict["i"].append(iq_profile[1+2*channel_id + ech*n_vol*nb_rx*2:1+2*channel_id + (ech+1)*n_vol*nb_rx*2][::2*nb_rx])
-                    iq_us_dict["q"].append(iq_profile[2+2*channel_id + ech*n_vol*nb_rx*2:2+2*channel_id + (ech+1)*n_vol*nb_rx*2][::2*nb_rx])
+    def decode_profiles (self, _config, _flag, _block, _offsets=None):
+        """Function that decodes and converts a batch of profiles of one configuration, all at once.
 
-                iq_us_dict["i"] = ar(iq_us_dict["i"])
-                iq_us_dict["q"] = ar(iq_us_dict["q"])
+        Args:
+            _config (int): configuration number
+            _flag (int): flag of the profile chunks (PROFILE_TAG, PROFILE_INST_TAG or PROFILE_INST_IQ_TAG)
+            _block (numpy structured array): the profile chunks, with the dtype given by profile_dtype
+            _offsets (array of int): positions of the profile chunks data in the file (needed with _iq_source)
 
-                if "iq" not in self.data_us_dicts[self.current_config][channel_id+1].keys():
-                    self.data_us_dicts[self.current_config][channel_id+1]["iq"] = {"time": [], "data": []}
+        Returns:
+            dict with keys
+                "config", "flag",
+                "time": datetime64[us] array of the timestamps of the profiles,
+                "vectors": dict by channel of dict by datatype of 2D arrays (one line per profile),
+                "scalars_us": dict by datatype of the US scalars arrays (common to all channels),
+                "scalars": dict by datatype of the non US scalars arrays,
+                "iq": dict by channel of IQ dicts of (n_profiles, n_p, n_vol) arrays, or complex64 arrays with _iq_complex,
+                    or lazy handles with _iq_source (only for PROFILE_INST_IQ_TAG),
+                "raw_scale": int16 array (n_profiles, 5) of the raw scales in RAW mode (see RAW_SCALE_FIELDS), None otherwise
+        """
+        _inst = _flag == PROFILE_INST_TAG or _flag == PROFILE_INST_IQ_TAG
+        plan = self.plans[_config]
+        layout = plan.layout(_inst)
+
+        with self.stats.stage("timestamps"):
+            times = decode_timestamps(_block["timestamp"])
+
+        # les scalaires sont convertis en flottants (non US) ou en entiers (US) comme dans read_line
+        sound_speed = _block["sound_speed"].astype(np.int64)
+        scalars_us_dict = {
+            "gain_ca0": _block["gain_ca0"].astype(np.int64),
+            "gain_ca1": _block["gain_ca1"].astype(np.int64),
+            # comme dans read_line, seul le bruit du dernier récepteur est gardé
+            "noise_g_max": _block["noise"][:, -1, 0].astype(np.int64),
+            "noise_g_mid": _block["noise"][:, -1, 1].astype(np.int64),
+        }
+        raw_scale = None
+        if self.dtype is None:
+            raw_scale = self.raw_scale(plan, _block["sound_speed"], _block["gain_ca0"], _block["gain_ca1"])
+        scalars_dict = {key: _block[key].astype(np.float64) for key in ["pitch", "roll", "temp"]}
+
+        # seuls les channels et les datatypes sélectionnés sont convertis, tous les récepteurs en une fois :
+        # un vecteur (n_rx, n_profiles, n_vol) par donnée
+        vectors = {}
+        if plan.selected_channels:
+            cells = _block["cells"]
+            vectors_dict = {field: np.ascontiguousarray(cells[:, :, plan.selected_ids, rank].transpose(2, 0, 1)) for field, rank in layout["fields"]}
+            with self.stats.stage("conversion", cells.nbytes * len(plan.selected_channels) // plan.nb_rx):
+                self.convert_vectors(vectors_dict, plan, sound_speed, scalars_us_dict['gain_ca0'], scalars_us_dict['gain_ca1'])
+            for receiver, (_, channel) in enumerate(plan.selected_channels):
+                vectors[channel] = {datatype: vectors_dict[key][receiver] for datatype, key in layout["datatypes"].items()}
+
+        iq = {}
+        if _flag == PROFILE_INST_IQ_TAG and self.iq:
+            with self.stats.stage("iq", _block["iq"].nbytes):
+                for channel_id, channel in plan.selected_channels:
+                    # un seul tableau (n_profiles, n_p, n_vol) par channel
+                    if self.iq_source is not None:
+                        if _offsets is None:
+                            raise Exception('iq', "positions of the profiles in the file are needed for lazy IQ samples")
+                        iq[channel] = ubt_iq(self.iq_source, _block.dtype["iq"].shape[:3], channel_id, self.iq_complex,
+                                             np.asarray(_offsets) + _block.dtype.fields["iq"][1])
+                    elif self.iq_complex:
+                        iq[channel] = iq_to_complex(_block["iq"][:, :, :, channel_id])
+                    else:
+                        iq[channel] = {"i": _block["iq"][:, :, :, channel_id, 0], "q": _block["iq"][:, :, :, channel_id, 1]}
+
+        with self.stats.stage("scalars"):
+            self.hardware.conversion_us_scalar(scalars_us_dict, plan.n_avg, plan.r_dvol, plan.r_vol1)
+            self.conversion_scalar(scalars_dict)
+
+        with self.stats.stage("translation"):
+            scalars_us = {}
+            for key, value in scalars_us_dict.items():
+                translated_key = self.translated_key(key)
+                if translated_key:
+                    scalars_us[translated_key] = np.broadcast_to(value, (len(_block),))
 
-                self.data_us_dicts[self.current_config][channel_id+1]["iq"]["time"].append(time)
-                self.data_us_dicts[self.current_config][channel_id+1]["iq"]["data"].append(iq_us_dict)
-                
-        # get the first channel again:
-        #self.current_channel = list(self.param_us_dicts[self.current_config].keys())[0]
-        
-        self.hardware.conversion_us_scalar(scalars_us_dict, n_avg, r_dvol, r_vol1)
-        # traduction des noms des types de données US:
-        
-        for key, value in scalars_us_dict.items():
-            translated_key = translate_key(key)
-            # gestion des scalaires qui sont des paramètres us variables (auto)
-            if translated_key == None:
-                translated_key = translate_key(key, _type="param_var")
+            scalars = {}
+            for key, value in scalars_dict.items():
+                translated_key = self.translated_key(key, False)
                 if translated_key:
-                    translated_key = translated_key+"_param"
-            if translated_key:
+                    scalars[translated_key] = value
+
+        return {"config": _config, "flag": _flag, "time": times, "vectors": vectors,
+                "scalars_us": scalars_us, "scalars": scalars, "iq": iq, "raw_scale": raw_scale}
+
+    def decode_chunks (self, _chunks, _offsets=None):
+        """Function that decodes a batch of profile chunks, without storing the data.
+        The chunks are grouped by configuration and flag, each group is stacked in one structured array
+        and decoded with a few vectorized operations (see decode_profiles).
+
+        Args:
+            _chunks (list): list of (flag, size, data) of profile chunks, in the file order
+            _offsets (list of int): positions of the data of the chunks in the file (needed with _iq_source)
+
+        Returns:
+            list of the records given by decode_profiles (one per group), with the key "positions"
+            giving the positions of the profiles of the record in _chunks
+        """
+        groups = {}
+        for position, (flag, size, data) in enumerate(_chunks):
+            config = int(unpack_from('h', data)[0] & 0x0000000F) + 1
+            if config not in self.data_us_dicts.keys():
+                raise Exception('chunk', "unexpected number of configurations (%d)" % config)
+            groups.setdefault((config, flag, size), ([], []))
+            groups[(config, flag, size)][0].append(position)
+            groups[(config, flag, size)][1].append(data)
+
+        records = []
+        for (config, flag, size), (positions, datas) in groups.items():
+            offsets = None if _offsets is None else np.asarray(_offsets)[positions]
+            _inst = flag == PROFILE_INST_TAG or flag == PROFILE_INST_IQ_TAG
+            _iq = flag == PROFILE_INST_IQ_TAG
+            with self.stats.stage("unpack", size*len(datas)):
+                block = np.frombuffer(b"".join(datas), dtype=self.profile_dtype(config, size, _inst, _iq))
+            record = self.decode_profiles(config, flag, block, offsets)
+            record["positions"] = np.asarray(positions)
+            records.append(record)
+        return records
+
+    def store_profiles (self, _records):
+        """Function that stores decoded profiles (see decode_chunks) as read_line does, in the order of the chunks.
+
+        Args:
+            _records (list): records of one batch of chunks, given by decode_chunks
+
+        Returns:
+            datetime64[us] array of the timestamps of the profiles, in the order of the chunks
+        """
+        with self.stats.stage("store"):
+            return self.__store_profiles__(_records)
+
+    def __store_profiles__ (self, _records):
+        times = np.empty(sum(len(record["positions"]) for record in _records), dtype="datetime64[us]")
+        # pour chaque liste de destination (données et axes de temps) : liste de (positions, valeurs) à ranger
+        pending = {}
+
+        def add(target, positions, values):
+            pending.setdefault(id(target), (target, []))[1].append((positions, values))
+
+        for record in _records:
+            config = record["config"]
+            self.current_config = config
+
+            positions = record["positions"]
+            times[positions] = record["time"]
+            # en mode liste, les timestamps sont rangés en datetime
+            record_times = record["time"] if self.columnar else record["time"].tolist()
+            for channel, vectors in record["vectors"].items():
+                self.current_channel = channel
+                for datatype, vector in vectors.items():
+                    add(self.data_us_dicts[config][channel][datatype]["data"], positions, vector)
+                if record.get("raw_scale") is not None:
+                    add(self.data_us_dicts[config][channel][RAW_SCALE]["data"], positions, record["raw_scale"])
+            for channel, iq_values in record["iq"].items():
+                if "iq" not in self.data_us_dicts[config][channel].keys():
+                    self.data_us_dicts[config][channel]["iq"] = self.new_iq_entry(config, channel)
+                # en mode liste, un dict IQ par profil (les handles sont gardés tels quels)
+                keep = self.columnar or isinstance(iq_values, ubt_iq)
+                add(self.data_us_dicts[config][channel]["iq"]["data"], positions, iq_values if keep else iq_rows(iq_values))
+            if (config, "iq") in self.time_axes and record["iq"]:
+                add(self.time_axes[(config, "iq")], positions, record_times)
+            for translated_key, value in record["scalars_us"].items():
                 # note : commun à tous les channels en multichannel
-                for channel in list(self.param_us_dicts[self.current_config].keys()):
-                    if translated_key not in self.data_us_dicts[self.current_config][channel].keys():
-                        self.data_us_dicts[self.current_config][channel][translated_key] = {"time":[], "data":[]}
-                    self.data_us_dicts[self.current_config][channel][translated_key]["data"].append(value)
-                    self.data_us_dicts[self.current_config][channel][translated_key]["time"].append(time)
-
-        self.conversion_scalar(scalars_dict)
-        # traduction des noms des types de données non US:
-        for key, value in scalars_dict.items():
-            translated_key = translate_key(key)
-            if translated_key:
+                for channel in list(self.data_us_dicts[config].keys()):
+                    if translated_key not in self.data_us_dicts[config][channel].keys():
+                        self.data_us_dicts[config][channel][translated_key] = self.new_entry(config)
+                    add(self.data_us_dicts[config][channel][translated_key]["data"], positions, value if self.columnar else value.tolist())
+            if (config, "profile") in self.time_axes:
+                add(self.time_axes[(config, "profile")], positions, record_times)
+            for translated_key, value in record["scalars"].items():
                 if translated_key not in self.data_dicts.keys():
-                    self.data_dicts[translated_key] = {"time":[], "data":[]}
-                self.data_dicts[translated_key]["data"].append(value)
-                self.data_dicts[translated_key]["time"].append(time)
+                    self.data_dicts[translated_key] = self.new_entry()
+                add(self.data_dicts[translated_key]["data"], positions, value if self.columnar else value.tolist())
+            if (None, "profile") in self.time_axes:
+                add(self.time_axes[(None, "profile")], positions, record_times)
+
+        for target, parts in pending.values():
+            if len(parts) == 1:
+                target.extend(parts[0][1])
+            else:
+                # plusieurs groupes pour la même liste : on range dans l'ordre des chunks
+                order = np.argsort(np.concatenate([part[0] for part in parts]), kind="stable")
+                values = [value for part in parts for value in (iq_rows(part[1]) if isinstance(part[1], (dict, ubt_iq)) else part[1])]
+                target.extend([values[i] for i in order])
 
-        return time
+        return times
+
+    def read_profiles (self, _chunks, _offsets=None):
+        """Function that decodes a batch of profile chunks and stores the data as read_line does.
+
+        Args:
+            _chunks (list): list of (flag, size, data) of profile chunks, in the file order
+            _offsets (list of int): positions of the data of the chunks in the file (needed with _iq_source)
+
+        Returns:
+            datetime64[us] array of the timestamps of the profiles, in the order of the chunks
+        """
+        return self.store_profiles(self.decode_chunks(_chunks, _offsets))
 
 
     def conversion_scalar(self, scalars_dict):
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: UTF_8 -*-
+
+# @copyright  this code is the property of Ubertone.
+# You may use this code for your personal, informational, non-commercial purpose.
+# You may not distribute, transmit, display, reproduce, publish, license, create derivative works from, transfer or sell any information, software, products or services based on this code.
+
+# décodage des chunks d'un raw UDT005 dans l'ordre du fichier (const, settings, configs HW, profils)
+
+import json
+from struct import unpack_from
+
+import numpy as np
+
+from .date_parser import decode_timestamps
+from .ubt_raw_data import ubt_raw_data
+from .ubt_raw_flag import *
+from .ubt_raw_stats import get_stats
+
+DEFAULT_BATCH_SIZE = 1000 # profiles decoded at once
+
+
+def load_json_chunk(_data):
+    """Function that reads the json dict of a const or settings chunk.
+
+    Args:
+        _data (bytes-like object): data in the chunk
+
+    Returns:
+        dict
+    """
+    try:
+        return json.loads(bytes(_data).decode("utf-8"))
+    except:
+        return json.loads(
+            bytes(_data).decode("utf-8")
+            .replace("'", '"')
+            .replace("True", "true")
+            .replace("False", "false")
+        )
+
+
+class ubt_raw_decoder:
+    def __init__(self, _batch_size=DEFAULT_BATCH_SIZE, _columnar=False, _profile_counts=None,
+                 _time_begin=None, _time_end=None, _configs=None, _channels=None, _datatypes=None, _iq=True, _iq_complex=False, _iq_source=None, _max_memory=None, _stats=None, _dtype=np.float64):
+        """Function that initiates a ubt_raw_decoder object which decodes the chunks of a raw.udt file given one after the other.
+        The const, settings and config chunks set up the ubt_raw_data object,
+        the profile chunks are kept and decoded by batches (see ubt_raw_data.decode_chunks).
+
+        Args:
+            _batch_size (int): number of profile chunks decoded at once
+            _columnar (bool): columnar storage of the data (see ubt_raw_data)
+            _profile_counts (dict): number of profiles expected for each configuration (see ubt_raw_data.reserve)
+            _time_begin, _time_end (datetime): limits (included) of the time range of the profiles, None for no limit
+            _configs (list of int): configuration numbers of the profiles, None for all configurations
+            _channels, _datatypes, _iq: selection of the data to convert and store (see ubt_raw_data.select)
+            _iq_complex (bool): IQ samples given as complex64 arrays (see ubt_raw_data)
+            _iq_source (string): file path of the raw.udt file for lazy IQ samples (see ubt_raw_data),
+                the positions of the chunks are then given to read_chunk
+            _max_memory (int): memory budget of the columns, beyond which they are spilled to temporary files (see ubt_raw_data)
+            _stats (ubt_stats): time spent in each decode stage (see ubt_raw_stats), None to disable the measures
+            _dtype: precision of the converted profiles, or "raw" to keep the int16 codes (see ubt_raw_data)
+
+        Returns:
+            None
+        """
+        self.batch_size = _batch_size
+        self.columnar = _columnar
+        self.iq_complex = _iq_complex
+        self.iq_source = _iq_source
+        self.max_memory = _max_memory
+        self.dtype = _dtype
+        self.stats = get_stats(_stats)
+        self.profile_counts = _profile_counts or {}
+
+        # les profils hors sélection sont écartés avant décodage (voir accept)
+        self.time_begin = None if _time_begin is None else np.datetime64(_time_begin, "us")
+        self.time_end = None if _time_end is None else np.datetime64(_time_end, "us")
+        self.configs = None if _configs is None else set(_configs)
+        self.selection = {"_configs": _configs, "_channels": _channels, "_datatypes": _datatypes, "_iq": _iq}
+
+        self.const_dict = None
+        self.settings_dict = None
+        self.ubt_data = None
+        # profile chunks waiting to be decoded, and positions of their data in the file
+        self.profile_chunks = []
+        self.profile_offsets = []
+
+    def read_chunk(self, _flag, _size, _data, _offset=None):
+        """Function that takes the next chunk of the file.
+        The profiles waiting to be decoded depend on the current const, settings and configs: before a const, settings
+        or config chunk, they must be decoded with flush() and their records stored (or split, see split_records),
+        then the chunk is given to read_chunk.
+
+        Args:
+            _flag (int): identification flag for data in the chunk
+            _size (int): size of the data in the chunk
+            _data (bytes-like object): data in the chunk
+            _offset (int): position of the data in the file (needed for lazy IQ samples)
+
+        Returns:
+            list of the records of the profiles decoded at this step (see ubt_raw_data.decode_chunks), often empty
+        """
+        if _flag in PROFILE_FLAGS:
+            if not self.accept(_data):
+                return []
+            return self.queue_profile(_flag, _size, _data, _offset)
+
+        # les profils déjà lus dépendent des settings et configs en cours : ils sont rangés avant (voir flush)
+        if self.profile_chunks:
+            raise Exception('decoder', "%d profile chunks are waiting, flush() and store them before the chunk %d" % (len(self.profile_chunks), _flag))
+
+        # Pour raw UDT005 (ie. UB-Lab P, UB-SediFlow, UB-Lab 3C) on peut
+        # rencontrer 4 flags: const, settings json, configs (HW), profils
+        if _flag == CONST_TAG:
+            self.const_dict = load_json_chunk(_data)
+            print("const: %s" % self.const_dict)
+
+            self.ubt_data = ubt_raw_data( self.const_dict, self.columnar, self.iq_complex, self.iq_source, self.max_memory, self.stats, self.dtype )
+            self.ubt_data.select(**self.selection)
+            self.ubt_data.reserve(self.profile_counts)
+
+        if _flag == SETTINGS_JSON_TAG:
+            self.settings_dict = load_json_chunk(_data)
+            print("settings: %s" % self.settings_dict)
+
+            self.ubt_data.set_config(self.settings_dict)
+
+        if _flag == CONFIG_TAG:
+            # what is needed from here and which is not in param_us_dict is only blind_ca0 and blind_ca1
+            # note: this is not useful on APF06, but could be used for double check
+            self.ubt_data.set_confighw(_size, _data)
+
+        return []
+
+    def queue_profile(self, _flag, _size, _data, _offset=None):
+        """Function that takes a profile chunk already accepted (see accept), to be decoded with the next batch.
+
+        Args:
+            _flag (int): identification flag of the profile chunk
+            _size (int): size of the data in the chunk
+            _data (bytes-like object): data in the chunk
+            _offset (int): position of the data in the file (needed for lazy IQ samples)
+
+        Returns:
+            list of the records of the profiles decoded when the batch is full (see flush), often empty
+        """
+        self.profile_chunks.append((_flag, _size, _data))
+        self.profile_offsets.append(_offset)
+        if len(self.profile_chunks) >= self.batch_size:
+            return self.flush()
+        return []
+
+    def accept(self, _data):
+        """Function that tells if a profile chunk is in the selection (configuration and time range).
+        Only the config reference and the timestamp in the header of the profile are read.
+
+        Args:
+            _data (bytes-like object): data in the profile chunk
+
+        Returns:
+            bool
+        """
+        if self.configs is not None:
+            config = int(unpack_from('h', _data)[0] & 0x0000000F) + 1
+            if config not in self.configs:
+                return False
+        if self.time_begin is not None or self.time_end is not None:
+            time = decode_timestamps(np.frombuffer(_data, dtype=np.int16, count=3, offset=2))
+            if self.time_begin is not None and time < self.time_begin:
+                return False
+            if self.time_end is not None and time > self.time_end:
+                return False
+        return True
+
+    def flush(self):
+        """Function that decodes the profile chunks waiting to be decoded.
+
+        Returns:
+            list of the records of the decoded profiles
+        """
+        if not self.profile_chunks:
+            return []
+        records = self.ubt_data.decode_chunks(self.profile_chunks, self.profile_offsets if self.iq_source else None)
+        self.profile_chunks = []
+        self.profile_offsets = []
+        return records
+
+    def split_records(self, _records, _per_profile=False):
+        """Generator which splits the records of a batch by channel (and by profile).
+
+        Args:
+            _records (list): records of one batch of chunks, given by read_chunk or flush
+            _per_profile (bool): one record per profile (in the order of the chunks) instead of one per batch
+
+        Yields:
+            dict with keys
+                "config", "channel", "flag",
+                "param_us": param_us dict of the config and channel,
+                "time": timestamp (datetime) or datetime64 array of the timestamps for a batch,
+                "vectors": dict by datatype of the vectors (2D arrays for a batch),
+                "scalars": dict by datatype of the US and non US scalars (arrays for a batch),
+                "iq": IQ dict of (n_p, n_vol) arrays, or of (n_profiles, n_p, n_vol) arrays for a batch
+                    (complex array with _iq_complex), only for PROFILE_INST_IQ_TAG,
+                "raw_scale": raw scale of the profile (5) or of the batch (n_profiles, 5), only with _dtype="raw" (see ubt_raw_convert)
+        """
+        if not _per_profile:
+            for record in _records:
+                for channel, vectors in record["vectors"].items():
+                    line = {"config": record["config"], "channel": channel, "flag": record["flag"],
+                            "param_us": self.ubt_data.param_us_dicts[record["config"]][channel],
+                            "time": record["time"], "vectors": vectors,
+                            "scalars": dict(record["scalars_us"], **record["scalars"])}
+                    if channel in record["iq"]:
+                        line["iq"] = record["iq"][channel]
+                    if record.get("raw_scale") is not None:
+                        line["raw_scale"] = record["raw_scale"]
+                    yield line
+            return
+
+        profiles = sorted((position, record_id, rank) for record_id, record in enumerate(_records)
+                          for rank, position in enumerate(record["positions"].tolist()))
+        for _, record_id, rank in profiles:
+            record = _records[record_id]
+            time = record["time"][rank].item()
+            scalars = {key: value[rank].item() for key, value in record["scalars_us"].items()}
+            scalars.update({key: value[rank].item() for key, value in record["scalars"].items()})
+            for channel, vectors in record["vectors"].items():
+                line = {"config": record["config"], "channel": channel, "flag": record["flag"],
+                        "param_us": self.ubt_data.param_us_dicts[record["config"]][channel],
+                        "time": time, "vectors": {datatype: vector[rank] for datatype, vector in vectors.items()},
+                        "scalars": scalars}
+                if channel in record["iq"]:
+                    iq = record["iq"][channel]
+                    line["iq"] = {key: value[rank] for key, value in iq.items()} if isinstance(iq, dict) else iq[rank]
+                if record.get("raw_scale") is not None:
+                    line["raw_scale"] = record["raw_scale"][rank]
+                yield line
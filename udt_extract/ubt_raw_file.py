@@ -8,12 +8,42 @@
 
 # lecture du fichier de données de données brutes
 
-from struct import calcsize, unpack
+import mmap
+import os
+from struct import Struct, calcsize, unpack
+
+# size of the file header (version, board, webui2 version)
+HEADER_SIZE = 42
+
+# chunk header : flag and size of the data
+CHUNK_HEAD = Struct('hH')
+
+def parse_header(_header):
+	"""Function that reads the header of a raw.udt file (UDT005 only).
+
+	Args:
+	    _header (bytes-like object): the HEADER_SIZE first bytes of the file
+
+	Returns:
+		version (string), board (string), webui2 (string)
+	"""
+	header = bytes(_header).decode("utf-8").split(" ")
+	version=header[0]
+	print("raw header : ", version)
+	assert (version == "UDT005")
+	board = header[1]
+	print("board : ", board)
+	header = header[2].split("/")
+	webui2 = header[0]
+	print("webui2 : ", webui2)
+	print("header extension : ", header[1:])
+	return version, board, webui2
 
 class ubt_raw_file:
 	def __init__(self, _filename):
 		"""Function that initiates a ubt_raw_file object which allows to read a raw.udt file chunk by chunk.
 		Works only for raw.udt files from webui2 (UB-Lab P).
+		The file is memory-mapped: the chunks data are given as memoryviews on the file, without copy.
 
 		Args:
 		    _filename (string): file path of raw.udt file
@@ -22,18 +52,12 @@ class ubt_raw_file:
 			None
 		"""
 		self.fd=open(_filename,'rb') # 1er argument : fichier raw
+		self.mm=mmap.mmap(self.fd.fileno(), 0, access=mmap.ACCESS_READ)
+		self.view=memoryview(self.mm)
+		self.position=0
 		self.total_size=0
 
-		header = self.fd.read(42).decode("utf-8").split(" ")
-		self.version=header[0]
-		print("raw header : ", self.version)
-		assert (self.version == "UDT005")
-		self.board = header[1]
-		print("board : ", self.board)
-		header = header[2].split("/")
-		self.webui2 = header[0]
-		print("webui2 : ", self.webui2)
-		print("header extension : ", header[1:])
+		self.version, self.board, self.webui2 = parse_header(self.__read_file__(HEADER_SIZE))
 
 	def __read_file__ (self, _size):
 		"""Function that reads a certain sized chunk of the file.
@@ -42,42 +66,101 @@ class ubt_raw_file:
 		    _size (int): size of chunk to read
 
 		Returns:
-			_data (bytes object): read chunk
+			_data (memoryview): read chunk
 		"""
-		# print "_size in read file %d"%_size
-		_data=self.fd.read(_size)
-		# print "_data in read file %s"%_data
-		if _data == '':
+		if self.position+_size > len(self.view):
 			print("%d byte read in the file"%(self.total_size))
 			raise EOFError
-		else:
-			if _size!=len(_data):
-				raise EOFError
-			self.total_size+=_size
-			#print("total size in read file %d"%self.total_size)
-			return _data
+		_data=self.view[self.position:self.position+_size]
+		self.position+=_size
+		self.total_size+=_size
+		return _data
 
 	def read_chunk(self) :
 		"""Function that reads a certain sized chunk of the file.
 
-		Args:
-		    _size (int): size of chunk to read
-
 		Returns:
 			flag (int): identification flag for data in the chunk
 			size (int): size of the data in the chunk
-			data (bytes object): data in the chunk
+			data (memoryview): data in the chunk
 		"""
-		flag = unpack('h', self.__read_file__(calcsize('h')))[0]
-		size = unpack('H', self.__read_file__(calcsize('H')))[0]
+		if self.position+CHUNK_HEAD.size > len(self.view):
+			raise EOFError
+		flag, size = CHUNK_HEAD.unpack_from(self.mm, self.position)
+		self.position+=CHUNK_HEAD.size
+		self.total_size+=CHUNK_HEAD.size
 		#print ("flag in read chunk %d"%flag)
 		#print ("size in read chunk %d"%size)
 		if size:
 			data=self.__read_file__(size)
 		else :
 			print("chunck vide")
-			data = ''
+			data = b''
 
 		# crc = unpack('h', self.__read_file__(calcsize('h')))[0]
 		return flag, size, data
 
+	def read_chunk_at(self, _offset) :
+		"""Function that reads the chunk starting at a given position in the file (see ubt_raw_index).
+
+		Args:
+		    _offset (int): position of the chunk in the file
+
+		Returns:
+			flag (int): identification flag for data in the chunk
+			size (int): size of the data in the chunk
+			data (memoryview): data in the chunk
+		"""
+		self.position=_offset
+		return self.read_chunk()
+
+	def chunk_available(self):
+		"""Function that tells if a complete chunk follows the current position
+		(the last chunk of a file being written can be incomplete).
+
+		Returns:
+			bool
+		"""
+		if self.position+CHUNK_HEAD.size > len(self.view):
+			return False
+		flag, size = CHUNK_HEAD.unpack_from(self.mm, self.position)
+		return self.position+CHUNK_HEAD.size+size <= len(self.view)
+
+	def remap(self):
+		"""Function that maps the file again, to read the data appended since it was mapped (file being written).
+		The previous mapping is released once the last memoryview on it is deleted.
+
+		Returns:
+			True if the file has grown
+		"""
+		size = os.fstat(self.fd.fileno()).st_size
+		if size < len(self.mm):
+			raise Exception('file', "file truncated (%d bytes instead of %d)" % (size, len(self.mm)))
+		if size == len(self.mm):
+			return False
+		self.mm=mmap.mmap(self.fd.fileno(), 0, access=mmap.ACCESS_READ)
+		self.view=memoryview(self.mm)
+		return True
+
+	def release(self):
+		"""Function that tells the system that the part of the file already read is not needed any more,
+		so that its pages can be dropped from memory (when supported by the system).
+
+		Returns:
+			None
+		"""
+		if hasattr(mmap, "MADV_DONTNEED"):
+			end = self.position - self.position % mmap.PAGESIZE
+			if end > 0:
+				self.mm.madvise(mmap.MADV_DONTNEED, 0, end)
+
+	def close(self):
+		"""Function that closes the file.
+		The mapping itself is released once the last memoryview on it is deleted.
+
+		Returns:
+			None
+		"""
+		self.view=None
+		self.mm=None
+		self.fd.close()
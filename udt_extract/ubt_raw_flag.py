@@ -8,3 +8,6 @@ PROFILE_INST_IQ_TAG = 102
 CONFIG_TAG = 200
 SETTINGS_JSON_TAG = 201
 CONST_TAG = 300
+
+# flags of the profile chunks
+PROFILE_FLAGS = (PROFILE_TAG, PROFILE_INST_TAG, PROFILE_INST_IQ_TAG)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: UTF_8 -*-
+
+# @copyright  this code is the property of Ubertone.
+# You may use this code for your personal, informational, non-commercial purpose.
+# You may not distribute, transmit, display, reproduce, publish, license, create derivative works from, transfer or sell any information, software, products or services based on this code.
+
+# tables de gain des profils, calculées une fois par jeu de codes (communes aux cartes APF04 et APF06)
+
+from functools import lru_cache
+
+import numpy as np
+
+# number of gain tables kept in memory
+GAIN_CACHE_SIZE = 128
+
+
+@lru_cache(maxsize=GAIN_CACHE_SIZE)
+def _cached_gain(calc_gain, n_vol, gain_ca0, gain_ca1, blind_ca0, blind_ca1):
+    """Function that gives the (read-only) gain table of a set of gain codes, computed once while it stays in the cache.
+
+    Args:
+        calc_gain (function): gain function of the hardware, calc_gain(n_vol, gain_ca0, gain_ca1, blind_ca0, blind_ca1)
+        n_vol (int): number of cells
+        gain_ca0, gain_ca1 (int): gain intercept and slope codes
+        blind_ca0, blind_ca1 (int): intercept and slope of limitation of gain in blind zone
+
+    Returns:
+        array of gains (n_vol)
+    """
+    tab_gain = np.array(calc_gain(n_vol, gain_ca0, gain_ca1, blind_ca0, blind_ca1), dtype=np.float64)
+    tab_gain.flags.writeable = False
+    return tab_gain
+
+
+def gain_table(calc_gain, n_vol, gain_ca0, gain_ca1, blind_ca0=None, blind_ca1=None):
+    """Function that gives the gain applied in each cell, for one profile or for a batch of profiles.
+    For a batch, the table is computed once for each distinct couple of gain codes.
+
+    Args:
+        calc_gain (function): gain function of the hardware, calc_gain(n_vol, gain_ca0, gain_ca1, blind_ca0, blind_ca1)
+        n_vol (int): number of cells
+        gain_ca0, gain_ca1 (int or arrays of int): gain intercept and slope codes (one value per profile for a batch)
+        blind_ca0, blind_ca1 (int): intercept and slope of limitation of gain in blind zone,
+            None to limit the gain with its own codes
+
+    Returns:
+        array of gains, shape (n_vol) or (n_profiles, n_vol)
+    """
+    def table(ca0, ca1):
+        if blind_ca0 is None:
+            return _cached_gain(calc_gain, int(n_vol), int(ca0), int(ca1), int(ca0), int(ca1))
+        return _cached_gain(calc_gain, int(n_vol), int(ca0), int(ca1), int(blind_ca0), int(blind_ca1))
+
+    if np.ndim(gain_ca0) == 0:
+        return table(gain_ca0, gain_ca1)
+    codes, inverse = np.unique(np.stack((gain_ca0, gain_ca1), axis=-1), axis=0, return_inverse=True)
+    tables = np.stack([table(ca0, ca1) for ca0, ca1 in codes])
+    return tables[inverse.reshape(-1)]
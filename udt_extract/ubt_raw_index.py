@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: UTF_8 -*-
+
+# @copyright  this code is the property of Ubertone.
+# You may use this code for your personal, informational, non-commercial purpose.
+# You may not distribute, transmit, display, reproduce, publish, license, create derivative works from, transfer or sell any information, software, products or services based on this code.
+
+# index des chunks d'un fichier raw.udt (UDT005) pour un accès direct par profil ou par date
+
+import mmap
+import os
+from struct import Struct
+
+import numpy as np
+
+from .date_parser import decode_timestamps
+from .ubt_raw_file import CHUNK_HEAD, HEADER_SIZE
+from .ubt_raw_flag import *
+
+# extension of the sidecar file saved next to the raw.udt file
+INDEX_EXTENSION = ".idx.npy"
+
+# one line per chunk:
+#   offset: position of the chunk (flag) in the file
+#   flag, size: chunk identification flag and size of the data in the chunk
+#   config: configuration number (1 to N) for profile chunks, 0 otherwise
+#   time: timestamp of the profile, NaT for the other chunks
+INDEX_DTYPE = np.dtype([
+    ("offset", "<i8"),
+    ("flag", "<i2"),
+    ("size", "<u2"),
+    ("config", "u1"),
+    ("time", "<M8[us]"),
+])
+
+
+def index_path(_raw_file):
+    """Function that gives the path of the index sidecar file of a raw.udt file.
+
+    Args:
+        _raw_file (string): file path of raw.udt file
+
+    Returns:
+        path of the sidecar file (string)
+    """
+    return _raw_file + INDEX_EXTENSION
+
+
+def build_index(_raw_file):
+    """Function that scans the flag/size headers of a raw.udt file and builds its chunk index.
+    Only the headers (and the config reference and timestamp of the profiles) are read, the data are skipped.
+    An incomplete chunk at the end of the file is left out of the index.
+
+    Args:
+        _raw_file (string): file path of raw.udt file
+
+    Returns:
+        index (numpy structured array of INDEX_DTYPE): one line per chunk, in the file order
+    """
+    profile_head = Struct('hhhh')
+    # timestamps of the chunks, decoded at the end (null for the chunks which are not profiles)
+    no_timestamp = (0, 0, 0)
+
+    offsets = []
+    flags = []
+    sizes = []
+    configs = []
+    times = []
+    with open(_raw_file, 'rb') as fd, mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        file_size = len(mm)
+        offset = HEADER_SIZE
+        while offset + CHUNK_HEAD.size <= file_size:
+            flag, size = CHUNK_HEAD.unpack_from(mm, offset)
+            if offset + CHUNK_HEAD.size + size > file_size:
+                break
+            config = 0
+            timestamp = no_timestamp
+            if flag in PROFILE_FLAGS:
+                ref, *timestamp = profile_head.unpack_from(mm, offset + CHUNK_HEAD.size)
+                config = int(ref & 0x0000000F) + 1
+            offsets.append(offset)
+            flags.append(flag)
+            sizes.append(size)
+            configs.append(config)
+            times.append(timestamp)
+            offset += CHUNK_HEAD.size + size
+
+    index = np.empty(len(offsets), dtype=INDEX_DTYPE)
+    index["offset"] = offsets
+    index["flag"] = flags
+    index["size"] = sizes
+    index["config"] = configs
+    index["time"] = decode_timestamps(np.array(times, dtype=np.int16).reshape(-1, 3))
+    index["time"][index["config"] == 0] = np.datetime64("NaT")
+    return index
+
+
+def save_index(_index, _raw_file):
+    """Function that saves the chunk index next to the raw.udt file.
+
+    Args:
+        _index (numpy structured array): chunk index
+        _raw_file (string): file path of raw.udt file
+
+    Returns:
+        None
+    """
+    with open(index_path(_raw_file), 'wb') as fd:
+        np.save(fd, _index)
+
+
+def load_index(_raw_file):
+    """Function that loads the chunk index sidecar of a raw.udt file.
+    The sidecar is ignored if it is older than the raw.udt file or if it does not cover the whole file.
+
+    Args:
+        _raw_file (string): file path of raw.udt file
+
+    Returns:
+        index (numpy structured array of INDEX_DTYPE) or None if there is no valid sidecar
+    """
+    path = index_path(_raw_file)
+    if not os.path.isfile(path) or os.path.getmtime(path) < os.path.getmtime(_raw_file):
+        return None
+    index = np.load(path)
+    if index.dtype != INDEX_DTYPE:
+        return None
+    end = index["offset"][-1] + CHUNK_HEAD.size + index["size"][-1] if len(index) else HEADER_SIZE
+    if end != os.path.getsize(_raw_file):
+        return None
+    return index
+
+
+def get_index(_raw_file, _sidecar=False):
+    """Function that gives the chunk index of a raw.udt file, built if needed.
+
+    Args:
+        _raw_file (string): file path of raw.udt file
+        _sidecar (bool): load the index from the sidecar file if valid, and save it when it is (re)built
+
+    Returns:
+        index (numpy structured array of INDEX_DTYPE)
+    """
+    if _sidecar:
+        index = load_index(_raw_file)
+        if index is not None:
+            return index
+    index = build_index(_raw_file)
+    if _sidecar:
+        save_index(index, _raw_file)
+    return index
+
+
+def select_chunks(_index, _time_begin=None, _time_end=None, _profiles=None, _configs=None):
+    """Function that selects the chunks to read for a time range, a range of profiles and/or configurations.
+    The const, settings and config chunks are always kept, so that the selection can be decoded as a whole file.
+
+    Args:
+        _index (numpy structured array): chunk index
+        _time_begin, _time_end (datetime): limits (included) of the time range, None for no limit
+        _profiles (slice or list of int): profile numbers (in the file order, starting at 0), None for all profiles
+        _configs (list of int): configuration numbers, None for all configurations
+
+    Returns:
+        sub index (numpy structured array of INDEX_DTYPE), in the file order
+    """
+    is_profile = np.isin(_index["flag"], PROFILE_FLAGS)
+    selected = ~is_profile
+
+    profile_selected = np.ones(np.count_nonzero(is_profile), dtype=bool)
+    if _profiles is not None:
+        profile_selected[:] = False
+        profile_selected[_profiles] = True
+    profile_times = _index["time"][is_profile]
+    if _time_begin is not None:
+        profile_selected &= profile_times >= np.datetime64(_time_begin, "us")
+    if _time_end is not None:
+        profile_selected &= profile_times <= np.datetime64(_time_end, "us")
+    if _configs is not None:
+        profile_selected &= np.isin(_index["config"][is_profile], list(_configs))
+    selected[is_profile] = profile_selected
+
+    return _index[selected]
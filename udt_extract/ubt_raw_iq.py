@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: UTF_8 -*-
+
+# @copyright  this code is the property of Ubertone.
+# You may use this code for your personal, informational, non-commercial purpose.
+# You may not distribute, transmit, display, reproduce, publish, license, create derivative works from, transfer or sell any information, software, products or services based on this code.
+
+# accès différé aux échantillons IQ : seules leurs positions dans le fichier raw.udt sont gardées
+
+import mmap
+
+import numpy as np
+
+
+def iq_to_complex(_iq):
+    """Function that gives the IQ samples as complex values.
+
+    Args:
+        _iq (array of int16): IQ samples, the last dimension being (I, Q)
+
+    Returns:
+        complex64 array of I + jQ (shape of _iq without its last dimension)
+    """
+    return _iq.astype(np.float32).view(np.complex64)[..., 0]
+
+
+class ubt_iq:
+    def __init__(self, _source, _shape, _channel, _complex=False, _offsets=None, _cells=(0, None)):
+        """Function that initiates a lazy handle on the IQ samples of a series of profiles of one receiving channel.
+        Only the positions of the IQ blocks in the file are kept, the samples are read from the memory-mapped file when accessed.
+        The handle can be used as the list of the "data" key: len, indexing (one profile is then decoded) and iteration.
+        The file stays mapped until close() is called (or the end of a with block).
+
+        Args:
+            _source (string): file path of raw.udt file
+            _shape (tuple): (n_p, n_vol, nb_rx) of the IQ blocks
+            _channel (int): index of the receiving channel in the IQ blocks (0 to nb_rx-1)
+            _complex (bool): give the samples as complex64 arrays instead of dicts of "i" and "q" int16 arrays
+            _offsets (array of int): position in the file of the IQ samples of each profile
+            _cells (tuple): range (begin, end) of the cells given
+
+        Returns:
+            None
+        """
+        self.source = _source
+        self.shape = tuple(_shape)
+        self.channel = _channel
+        self.complex = _complex
+        self.offset_parts = [np.empty(0, dtype=np.int64) if _offsets is None else np.asarray(_offsets, dtype=np.int64)]
+        self.count = len(self.offset_parts[0])
+        self.cells = _cells
+        self.mapping = None
+
+    @property
+    def offsets(self):
+        # les positions ajoutées par extend sont concaténées une fois, au premier accès
+        if len(self.offset_parts) > 1:
+            self.offset_parts = [np.concatenate(self.offset_parts)]
+        return self.offset_parts[0]
+
+    def __len__(self):
+        return self.count
+
+    def __getstate__(self):
+        # le fichier est de nouveau ouvert au premier accès (après pickle)
+        state = dict(self.__dict__)
+        state["mapping"] = None
+        return state
+
+    def __copy_with__(self, _offsets, _cells):
+        handle = ubt_iq(self.source, self.shape, self.channel, self.complex, _offsets, _cells)
+        handle.mapping = self.mapping
+        return handle
+
+    def extend(self, _handles):
+        """Function that adds the profiles of other handles (same file, configuration and channel) at the end.
+
+        Args:
+            _handles (ubt_iq or list of ubt_iq): handles
+
+        Returns:
+            None
+        """
+        if isinstance(_handles, ubt_iq):
+            _handles = [_handles]
+        for handle in _handles:
+            self.offset_parts.append(handle.offsets)
+            self.count += len(handle)
+
+    def append(self, _handle):
+        self.extend([_handle])
+
+    def select_cells(self, _begin, _end=None):
+        """Function that gives a handle restricted to a range of cells (nothing is read).
+
+        Args:
+            _begin, _end (int): range of the cells, relative to the cells of this handle
+
+        Returns:
+            ubt_iq
+        """
+        begin, end = self.cells
+        n_cells = (self.shape[1] if end is None else end) - begin
+        cells = range(n_cells)[slice(_begin, _end)]
+        return self.__copy_with__(self.offsets, (begin + cells.start, begin + cells.stop))
+
+    def __getitem__(self, _key):
+        """Profile access: an int gives the decoded IQ samples of one profile,
+        a slice (or list of profile numbers) gives a handle on these profiles (nothing is read).
+        """
+        if isinstance(_key, (int, np.integer)):
+            return self.read(self.offsets[_key])
+        return self.__copy_with__(self.offsets[_key], self.cells)
+
+    def __iter__(self):
+        for offset in self.offsets.tolist():
+            yield self.read(offset)
+
+    def samples(self, _offset):
+        """Function that gives a view on the samples of the profile whose IQ block is at a given position.
+
+        Args:
+            _offset (int): position of the IQ block in the file
+
+        Returns:
+            int16 array view (n_p, n_cells, 2)
+        """
+        if self.mapping is None or self.mapping.closed:
+            with open(self.source, 'rb') as fd:
+                self.mapping = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        n_p, n_vol, nb_rx = self.shape
+        block = np.frombuffer(self.mapping, dtype=np.int16, count=n_p*n_vol*nb_rx*2, offset=_offset).reshape(n_p, n_vol, nb_rx, 2)
+        return block[:, self.cells[0]:self.cells[1], self.channel]
+
+    def read(self, _offset):
+        """Function that decodes the samples of the profile whose IQ block is at a given position.
+
+        Args:
+            _offset (int): position of the IQ block in the file
+
+        Returns:
+            complex64 array (n_p, n_cells) or IQ dict of int16 arrays (n_p, n_cells)
+        """
+        samples = self.samples(_offset)
+        if self.complex:
+            return iq_to_complex(samples)
+        return {"i": samples[..., 0].copy(), "q": samples[..., 1].copy()}
+
+    def array(self):
+        """Function that decodes the samples of all the profiles of the handle.
+
+        Returns:
+            complex64 array (n_profiles, n_p, n_cells) or IQ dict of int16 arrays (n_profiles, n_p, n_cells)
+        """
+        samples = np.stack([self.samples(offset) for offset in self.offsets.tolist()]) if len(self) else \
+            np.empty((0, self.shape[0], len(range(self.shape[1])[self.cells[0]:self.cells[1]]), 2), dtype=np.int16)
+        if self.complex:
+            return iq_to_complex(samples)
+        return {"i": samples[..., 0], "q": samples[..., 1]}
+
+    def close(self):
+        """Function that unmaps the file, it is mapped again at the next access.
+        The views given by samples() must not be referenced any more.
+
+        Returns:
+            None
+        """
+        if self.mapping is not None:
+            try:
+                self.mapping.close()
+            except BufferError:
+                raise Exception('iq', "samples of %s are still referenced, release them before close()" % self.source)
+            self.mapping = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        self.close()
+        return False
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: UTF_8 -*-
+
+# @copyright  this code is the property of Ubertone.
+# You may use this code for your personal, informational, non-commercial purpose.
+# You may not distribute, transmit, display, reproduce, publish, license, create derivative works from, transfer or sell any information, software, products or services based on this code.
+
+# plan de décodage des profils d'une configuration, calculé une fois à la lecture des settings
+
+from struct import Struct
+
+import numpy as np
+
+# config reference and timestamp (3 int16) at the beginning of a profile
+PROFILE_HEAD = Struct('hhhh')
+# scalars following the header: pitch, roll, temp, sound_speed, gain_ca0, gain_ca1
+PROFILE_SCALARS = Struct('hhhhhh')
+# noise of a receiver: noise_g_max, noise_g_mid
+PROFILE_NOISE = Struct('hh')
+
+# order of the coded values of each cell in a profile (averaged or instantaneous)
+CELL_FIELDS_AVG = ("velocity", "std", "amplitude", "snr")
+CELL_FIELDS_INST = ("amplitude", "velocity", "snr")
+
+
+class ubt_decode_plan:
+    def __init__(self, _config, _param_us_dict, _selected_channels, _datatypes_avg, _datatypes_inst):
+        """Function that initiates the decode plan of the profiles of a configuration: the values which are the same
+        for all its profiles (parameters, positions of the values in the chunk, structured dtypes) are computed once.
+
+        Args:
+            _config (int): configuration number
+            _param_us_dict (dict): param_us dicts of the configuration, keyed by receiving channel
+            _selected_channels (list of int): receiving channels extracted
+            _datatypes_avg, _datatypes_inst (dict): selected datatypes of the averaged and instantaneous profiles,
+                with the names of the converted vectors (see ubt_raw_data.selected_datatypes)
+
+        Returns:
+            None
+        """
+        self.config = _config
+        # ordre des récepteurs dans les profils
+        self.channels = sorted(_param_us_dict.keys())
+        self.nb_rx = len(self.channels)
+        # (rang dans le profil, channel) des récepteurs extraits
+        self.selected_channels = [(channel_id, channel) for channel_id, channel in enumerate(self.channels)
+                                  if channel in _selected_channels]
+        self.first_channel = list(_param_us_dict.keys())[0]
+        # index des récepteurs extraits dans les cellules (tous les récepteurs : pas de copie)
+        if len(self.selected_channels) == self.nb_rx:
+            self.selected_ids = slice(None)
+        else:
+            self.selected_ids = [channel_id for channel_id, _ in self.selected_channels]
+
+        param_us = _param_us_dict[self.channels[0]]
+        self.n_vol = param_us["n_cell"]
+        self.n_p = param_us["n_p"]
+        self.n_avg = param_us["n_avg"]
+        self.c_prf = param_us["f0"] / param_us["prf"]
+        self.r_dvol = param_us["r_dcell"]
+        self.r_vol1 = param_us["r_cell1"]
+
+        # blind zone gain parameters, given by the config chunk (see ubt_raw_data.set_confighw)
+        self.blind_ca0 = None
+        self.blind_ca1 = None
+
+        # positions dans le chunk (octets)
+        self.scalars_offset = PROFILE_HEAD.size
+        # comme dans read_line, seul le bruit du dernier récepteur est gardé
+        self.noise_offset = PROFILE_HEAD.size + PROFILE_SCALARS.size + PROFILE_NOISE.size * (self.nb_rx - 1)
+        self.cells_offset = PROFILE_HEAD.size + PROFILE_SCALARS.size + PROFILE_NOISE.size * self.nb_rx
+
+        self.layouts = {False: self.__layout__(CELL_FIELDS_AVG, _datatypes_avg),
+                        True: self.__layout__(CELL_FIELDS_INST, _datatypes_inst)}
+        # dtypes structurés par (taille du chunk, inst, iq)
+        self.dtypes = {}
+
+    def __layout__(self, _cell_fields, _datatypes):
+        data_per_cell = len(_cell_fields)
+        # la saturation est donnée par le signe de l'amplitude
+        fields = {"amplitude" if key == "sat" else key for key in _datatypes.values()}
+        count = data_per_cell * self.n_vol * self.nb_rx
+        return {
+            "cell_fields": _cell_fields,
+            "data_per_cell": data_per_cell,
+            "datatypes": _datatypes,
+            # (nom, rang dans la cellule) des valeurs à convertir
+            "fields": [(field, rank) for rank, field in enumerate(_cell_fields) if field in fields],
+            # nombre de valeurs codées des cellules, et taille d'un chunk sans IQ
+            "count": count,
+            "size": self.cells_offset + 2 * count,
+        }
+
+    def layout(self, _inst):
+        """Function that gives the layout of the cells of the averaged or instantaneous profiles.
+
+        Args:
+            _inst (bool): instantaneous profiles
+
+        Returns:
+            dict with keys "cell_fields", "data_per_cell", "datatypes", "fields" (selected cell fields with their rank),
+            "count" (number of coded values), "size" (size of a chunk without IQ samples)
+        """
+        return self.layouts[_inst]
+
+    def iq_offset(self, _inst=True):
+        """Function that gives the position of the IQ samples (after the iq_hash) in a chunk.
+
+        Args:
+            _inst (bool): instantaneous profiles
+
+        Returns:
+            offset (int)
+        """
+        return self.layouts[_inst]["size"] + 2
+
+    def profile_dtype(self, _size, _inst=False, _iq=False):
+        """Function that gives the structured dtype of a profile chunk of the configuration (computed once for each chunk size).
+
+        Args:
+            _size (int): size of the profile chunk
+            _inst (bool): instantaneous profile (3 values per cell instead of 4)
+            _iq (bool): profile followed by the IQ samples
+
+        Returns:
+            numpy dtype with fields ref, timestamp, pitch, roll, temp, sound_speed, gain_ca0, gain_ca1, noise, cells (and iq_hash, iq)
+        """
+        key = (_size, _inst, _iq)
+        dtype = self.dtypes.get(key)
+        if dtype is not None:
+            return dtype
+
+        layout = self.layouts[_inst]
+        fields = [("ref", "h"), ("timestamp", "h", (3,)),
+                  ("pitch", "h"), ("roll", "h"), ("temp", "h"), ("sound_speed", "h"), ("gain_ca0", "h"), ("gain_ca1", "h"),
+                  ("noise", "h", (self.nb_rx, 2)),
+                  ("cells", "h", (self.n_vol, self.nb_rx, layout["data_per_cell"]))]
+        if _iq:
+            # le bloc IQ commence par le iq_hash
+            fields += [("iq_hash", "h"), ("iq", "h", (self.n_p, self.n_vol, self.nb_rx, 2))]
+        dtype = np.dtype(fields)
+
+        if (_iq and _size < dtype.itemsize) or (not _iq and _size != dtype.itemsize):
+            raise Exception('volume number', "expected %d bytes for %d volumes, but profile data contains %d bytes" % (
+                dtype.itemsize, self.n_vol, _size))
+        # the remaining bytes (end of the IQ block) are skipped
+        dtype = np.dtype({"names": dtype.names, "formats": [dtype.fields[name][0] for name in dtype.names],
+                          "offsets": [dtype.fields[name][1] for name in dtype.names], "itemsize": _size})
+        self.dtypes[key] = dtype
+        return dtype
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: UTF_8 -*-
+
+# @copyright  this code is the property of Ubertone.
+# You may use this code for your personal, informational, non-commercial purpose.
+# You may not distribute, transmit, display, reproduce, publish, license, create derivative works from, transfer or sell any information, software, products or services based on this code.
+
+# décodage en parallèle des profils d'un même fichier raw.udt, par morceaux contigus (shards)
+
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.util import Finalize
+from struct import unpack
+
+import numpy as np
+
+from .convert_type import get_translation_index
+from .ubt_raw_data import ubt_raw_data
+from .ubt_raw_decoder import load_json_chunk
+from .ubt_raw_file import CHUNK_HEAD, ubt_raw_file
+from .ubt_raw_flag import *
+from .ubt_raw_stats import ubt_stats
+
+# number of shards per worker process, for a balanced load
+SHARDS_PER_PROCESS = 4
+
+
+def init_worker(_verbose=False):
+    """Function run once in each worker process (see decode_shards and batch_extract): the modules and the translation tables
+    are loaded before the first task, and reused for all the tasks of this process.
+
+    Args:
+        _verbose (bool): keep the messages printed in the process
+
+    Returns:
+        None
+    """
+    from . import apf04_hardware, apf06_hardware
+    get_translation_index()
+    if not _verbose:
+        stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+        # sortie rétablie (et fichier fermé) à la fin du process
+        Finalize(None, _restore_stdout, args=(stdout,), exitpriority=0)
+
+
+def _restore_stdout(_stdout):
+    devnull, sys.stdout = sys.stdout, _stdout
+    devnull.close()
+
+
+def plan_shards(_raw_file, _chunks, _processes):
+    """Function that splits the chunks of a file in segments, in the file order:
+    each const, settings or config chunk is a segment, and the profile chunks between them are split in contiguous shards.
+    The state given by the const, settings and config chunks read before each shard is joined to the shard,
+    so that it can be decoded on its own.
+
+    Args:
+        _raw_file (string): file path of raw.udt file
+        _chunks (numpy structured array): chunk index of the chunks to read (see ubt_raw_index)
+        _processes (int): number of worker processes
+
+    Returns:
+        list of ("chunk", offset) or ("shard", offsets, state) where state is a dict with keys
+        "const", "settings", "blind_ca0", "blind_ca1"
+    """
+    is_profile = np.isin(_chunks["flag"], PROFILE_FLAGS)
+    shard_size = max(1, -(-int(np.count_nonzero(is_profile)) // (_processes * SHARDS_PER_PROCESS)))
+
+    segments = []
+    state = {"const": None, "settings": None, "blind_ca0": [], "blind_ca1": []}
+    fileraw = ubt_raw_file(_raw_file)
+    try:
+        # limites des séries de profils consécutifs
+        bounds = np.flatnonzero(np.diff(np.concatenate(([0], is_profile.view(np.int8), [0]))))
+        starts, ends = bounds[::2], bounds[1::2]
+        position = 0
+        for start, end in zip(starts.tolist() + [len(_chunks)], ends.tolist() + [len(_chunks)]):
+            # chunks de métadonnées avant la série de profils (même traitement que ubt_raw_decoder.read_chunk)
+            for offset in _chunks["offset"][position:start].tolist():
+                flag, size, data = fileraw.read_chunk_at(offset)
+                if flag == CONST_TAG:
+                    state = {"const": load_json_chunk(data), "settings": None, "blind_ca0": [], "blind_ca1": []}
+                elif flag == SETTINGS_JSON_TAG:
+                    state = dict(state, settings=load_json_chunk(data), blind_ca0=[], blind_ca1=[])
+                elif flag == CONFIG_TAG:
+                    blind_ca0, blind_ca1 = unpack('2h', data[size-4:size])
+                    state = dict(state, blind_ca0=state["blind_ca0"] + [blind_ca0], blind_ca1=state["blind_ca1"] + [blind_ca1])
+                segments.append(("chunk", offset))
+            offsets = _chunks["offset"][start:end]
+            for shard_start in range(0, len(offsets), shard_size):
+                segments.append(("shard", offsets[shard_start:shard_start + shard_size], state))
+            position = end
+    finally:
+        fileraw.close()
+    return segments
+
+
+def decode_shard(_raw_file, _offsets, _state, _selection, _iq_complex, _iq_source, _batch_size, _dtype=np.float64, _stats=False):
+    """Function that decodes a shard of profile chunks in a worker process.
+
+    Args:
+        _raw_file (string): file path of raw.udt file
+        _offsets (array of int): positions of the profile chunks in the file
+        _state (dict): const, settings and blind zone parameters (see plan_shards)
+        _selection (dict): selection of the data (see ubt_raw_data.select)
+        _iq_complex (bool): IQ samples given as complex64 arrays (see ubt_raw_data)
+        _iq_source (string): file path for lazy IQ samples (see ubt_raw_data), None to decode them
+        _batch_size (int): number of profile chunks decoded at once
+        _dtype: precision of the converted profiles, or "raw" (see ubt_raw_data)
+        _stats (bool): measure the time spent in each decode stage (see ubt_raw_stats)
+
+    Returns:
+        list of the records of each batch (see ubt_raw_data.decode_chunks),
+        and the report of the measures (None without _stats)
+    """
+    stats = ubt_stats() if _stats else None
+    ubt_data = ubt_raw_data(_state["const"], _iq_complex=_iq_complex, _iq_source=_iq_source, _stats=stats, _dtype=_dtype)
+    ubt_data.select(**_selection)
+    ubt_data.set_config(_state["settings"])
+    for blind_ca0, blind_ca1 in zip(_state["blind_ca0"], _state["blind_ca1"]):
+        ubt_data.set_blind_zone(blind_ca0, blind_ca1)
+
+    fileraw = ubt_raw_file(_raw_file)
+    try:
+        batches = []
+        for batch_start in range(0, len(_offsets), _batch_size):
+            offsets = _offsets[batch_start:batch_start + _batch_size]
+            with ubt_data.stats.stage("read"):
+                chunks = [fileraw.read_chunk_at(offset) for offset in offsets.tolist()]
+            for flag, size, _ in chunks:
+                ubt_data.stats.count_chunk(flag, size)
+            batches.append(ubt_data.decode_chunks(chunks, offsets + CHUNK_HEAD.size))
+            del chunks
+    finally:
+        fileraw.close()
+    return batches, None if stats is None else stats.report()
+
+
+def decode_shards(_raw_file, _chunks, _decoder, _processes, _batch_size):
+    """Generator which decodes the profile chunks of a file with a pool of processes.
+    The const, settings and config chunks are given to the decoder of the calling process, in the file order,
+    and the decoded shards are yielded in the file order, so that they can be stored as if they were decoded in sequence.
+
+    Args:
+        _raw_file (string): file path of raw.udt file
+        _chunks (numpy structured array): chunk index of the chunks to read (see ubt_raw_index)
+        _decoder (ubt_raw_decoder): decoder of the calling process (gives the selection of the data)
+        _processes (int): number of worker processes
+        _batch_size (int): number of profile chunks decoded at once in a worker
+
+    Yields:
+        list of records of a batch of profiles (see ubt_raw_data.decode_chunks)
+    """
+    segments = plan_shards(_raw_file, _chunks, _processes)
+    fileraw = ubt_raw_file(_raw_file)
+    executor = ProcessPoolExecutor(_processes, initializer=init_worker)
+    try:
+        futures = [executor.submit(decode_shard, _raw_file, segment[1], segment[2], _decoder.selection, _decoder.iq_complex, _decoder.iq_source, _batch_size,
+                                   _decoder.dtype, _decoder.stats.enabled)
+                   if segment[0] == "shard" else None for segment in segments]
+        for segment, future in zip(segments, futures):
+            if future is None:
+                flag, size, data = fileraw.read_chunk_at(segment[1])
+                _decoder.stats.count_chunk(flag, size)
+                yield _decoder.read_chunk(flag, size, data)
+            else:
+                with _decoder.stats.stage("parallel"):
+                    batches, report = future.result()
+                if report is not None:
+                    # mesures faites dans le process de décodage
+                    _decoder.stats.merge(report)
+                yield from batches
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        fileraw.close()
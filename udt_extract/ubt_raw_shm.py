@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: UTF_8 -*-
+
+# @copyright  this code is the property of Ubertone.
+# You may use this code for your personal, informational, non-commercial purpose.
+# You may not distribute, transmit, display, reproduce, publish, license, create derivative works from, transfer or sell any information, software, products or services based on this code.
+
+# échange des données extraites entre process par mémoire partagée (sans copie à la lecture)
+
+import os
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from .raw_extract import raw_extract
+from .ubt_raw_iq import ubt_iq
+
+# alignment of the arrays in the shared memory segment (bytes)
+ALIGNMENT = 64
+
+# names of the segments created by this process (or its parent when forked) and removed at its end if they are not unlinked
+_tracked_names = set()
+
+
+def _layout(_value, _arrays):
+    # les tableaux sont rangés dans le segment, le reste est gardé dans le descripteur (comme dans ubt_raw_cache)
+    if isinstance(_value, ubt_iq):
+        # les échantillons IQ différés sont lus pour être partagés
+        _value = _value.array()
+    if isinstance(_value, np.ndarray):
+        if _value.dtype.hasobject:
+            raise Exception('shared memory', "arrays of python objects can not be shared, extract the file in columnar mode")
+        # un tableau partagé (axe de temps d'une configuration) n'est rangé qu'une fois
+        if id(_value) not in _arrays:
+            _arrays[id(_value)] = (len(_arrays), _value)
+        return {"array": _arrays[id(_value)][0]}
+    if isinstance(_value, dict):
+        return {"dict": [[key, _layout(value, _arrays)] for key, value in _value.items()]}
+    if isinstance(_value, tuple):
+        return {"tuple": [_layout(value, _arrays) for value in _value]}
+    return {"value": _value}
+
+
+def _views(_value, _buffer, _arrays, _views_made):
+    if "array" in _value:
+        # une seule vue par tableau, les axes de temps restent partagés
+        if _value["array"] not in _views_made:
+            offset, dtype, shape = _arrays[_value["array"]]
+            count = int(np.prod(shape))
+            if count == 0:
+                view = np.empty(shape, dtype=dtype)
+            else:
+                # les vues gardent le buffer : le segment ne peut pas être fermé tant qu'elles sont utilisées
+                view = np.frombuffer(_buffer, dtype=dtype, count=count, offset=offset).reshape(shape)
+            view.flags.writeable = False
+            _views_made[_value["array"]] = view
+        return _views_made[_value["array"]]
+    if "dict" in _value:
+        return {key: _views(value, _buffer, _arrays, _views_made) for key, value in _value["dict"]}
+    if "tuple" in _value:
+        return tuple(_views(value, _buffer, _arrays, _views_made) for value in _value["tuple"])
+    return _value["value"]
+
+
+def _tracker_name(_segment):
+    # le resource_tracker suit les segments POSIX sous leur nom système, préfixé par "/"
+    return "/" + _segment.name
+
+
+def _untrack(_segment):
+    # le segment n'est plus supprimé à la fin de ce process (un autre process en a la charge)
+    if os.name == "posix":
+        resource_tracker.unregister(_tracker_name(_segment), "shared_memory")
+
+
+class ubt_shared_result:
+    def __init__(self, _descriptor, _segment):
+        """Function that initiates a ubt_shared_result object, a result of raw_extract whose arrays are in a shared memory segment.
+        Use share_result or attach_result to create it.
+
+        Args:
+            _descriptor (dict): descriptor of the segment (see share_result)
+            _segment (SharedMemory): shared memory segment
+
+        Returns:
+            None
+        """
+        self.descriptor = _descriptor
+        self.segment = _segment
+        self.closed = False
+        # tuple of raw_extract, with read-only views on the segment
+        self.result = _views(_descriptor["layout"], _segment.buf, _descriptor["arrays"], {})
+
+    def close(self):
+        """Function that releases the views of this process on the segment, the segment itself is kept until unlink is called.
+        The arrays of the result must not be referenced any more.
+
+        Returns:
+            None
+        """
+        self.result = None
+        if self.closed:
+            return
+        try:
+            self.segment.close()
+        except BufferError:
+            raise Exception('shared memory', "arrays of the result are still referenced, release them before close()")
+        self.closed = True
+
+    def unlink(self):
+        """Function that removes the segment: it is freed once all the processes attached to it are closed.
+        To be called once, by the process which is the last to use the data (or by the process which created it).
+
+        Returns:
+            None
+        """
+        # unlink retire le segment du suivi des process, il peut ne pas y être (voir attach_result)
+        if os.name == "posix":
+            resource_tracker.register(_tracker_name(self.segment), "shared_memory")
+        self.segment.unlink()
+        _tracked_names.discard(self.segment.name)
+
+    def __del__(self):
+        # les vues sont libérées avant le segment
+        self.result = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        self.close()
+        return False
+
+
+def share_result(_result, _track=True):
+    """Function that copies the arrays of a result of raw_extract (in columnar mode) in a shared memory segment.
+    The other values (parameters, settings, dates) are kept in the descriptor.
+
+    Args:
+        _result (tuple): result of raw_extract, with _columnar=True (lists of profiles are kept in the descriptor)
+        _track (bool): the segment is removed at the end of this process if it was not unlinked,
+            False to hand it over to another process which then calls unlink
+
+    Returns:
+        ubt_shared_result, its picklable descriptor can be given to attach_result in other processes
+    """
+    arrays = {}
+    layout = _layout(tuple(_result), arrays)
+
+    # position des tableaux dans le segment, alignés
+    positions = []
+    size = 0
+    for _, array in sorted(arrays.values(), key=lambda item: item[0]):
+        size = -(-size // ALIGNMENT) * ALIGNMENT
+        positions.append((size, array.dtype, array.shape))
+        size += array.nbytes
+
+    segment = SharedMemory(create=True, size=max(size, 1))
+    try:
+        for (offset, dtype, shape), (_, array) in zip(positions, sorted(arrays.values(), key=lambda item: item[0])):
+            np.ndarray(shape, dtype=dtype, buffer=segment.buf, offset=offset)[...] = array
+    except:
+        segment.close()
+        segment.unlink()
+        raise
+    if _track:
+        _tracked_names.add(segment.name)
+    else:
+        _untrack(segment)
+
+    descriptor = {"name": segment.name, "size": size, "arrays": positions, "layout": layout}
+    return ubt_shared_result(descriptor, segment)
+
+
+def attach_result(_descriptor):
+    """Function that attaches to the shared memory segment of a result shared by share_result (in this process or another one).
+
+    Args:
+        _descriptor (dict): descriptor given by share_result (ubt_shared_result.descriptor)
+
+    Returns:
+        ubt_shared_result, whose result gives the arrays as read-only views on the segment (no copy)
+    """
+    segment = SharedMemory(name=_descriptor["name"])
+    # le segment reste sous la responsabilité du process qui l'a créé (ou de celui qui appelle unlink) :
+    # le suivi ajouté à l'ouverture n'est retiré que dans les autres process
+    if segment.name not in _tracked_names:
+        _untrack(segment)
+    return ubt_shared_result(_descriptor, segment)
+
+
+def extract_shared(_raw_file, **_kwargs):
+    """
+        This method extracts a raw.udt file in columnar mode and gives the result in a shared memory segment,
+        e.g. in a worker process: only the small descriptor is sent back, and the other processes attach to the segment.
+        The segment is handed over: it must be removed by the process using the data (see ubt_shared_result.unlink).
+
+        Parameters
+        ----------
+        _raw_file : string
+                path to .udt file
+        _kwargs :
+                arguments of raw_extract (_columnar is always True)
+
+        Returns
+        -------
+    descriptor : dict
+        picklable descriptor of the segment, to give to attach_result
+    """
+    _kwargs["_columnar"] = True
+    shared = share_result(raw_extract(_raw_file, **_kwargs), _track=False)
+    shared.close()
+    return shared.descriptor
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: UTF_8 -*-
+
+# @copyright  this code is the property of Ubertone.
+# You may use this code for your personal, informational, non-commercial purpose.
+# You may not distribute, transmit, display, reproduce, publish, license, create derivative works from, transfer or sell any information, software, products or services based on this code.
+
+# mesure du temps passé dans chaque étape de l'extraction (désactivée par défaut)
+
+from contextlib import nullcontext
+from time import perf_counter
+
+# stages of the extraction:
+#   read: reading of the chunks in the file, unpack: unpacking of the profile chunks (header, scalars, cells),
+#   timestamps: decoding of the timestamps, conversion: conversion of the profiles (including gain),
+#   gain: computation of the gain tables, iq: IQ samples, scalars: conversion of the scalars,
+#   translation: translation of the datatype names (and storage of the scalars in read_line),
+#   store: storage of the profiles, parallel: wait for the worker processes, finalize: end of the columns
+STAGES = ("read", "unpack", "timestamps", "conversion", "gain", "iq", "scalars", "translation", "store", "parallel", "finalize")
+
+
+class _stage:
+    __slots__ = ("stats", "name", "bytes", "start")
+
+    def __init__(self, _stats, _name, _bytes):
+        self.stats = _stats
+        self.name = _name
+        self.bytes = _bytes
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *_exc):
+        self.stats.add(self.name, perf_counter() - self.start, self.bytes)
+        return False
+
+
+class ubt_stats:
+    def __init__(self, _callback=None):
+        """Function that initiates a ubt_stats object which collects the time spent in each stage of the extraction
+        (see STAGES), the number of calls and of bytes processed by stage, and the number of chunks and bytes by flag.
+        The stages may be nested (gain in conversion, parallel includes the other stages of the calling process).
+
+        Args:
+            _callback (function): function called with the report (see report) at the end of the extraction,
+                e.g. to export it to a metrics system
+
+        Returns:
+            None
+        """
+        self.callback = _callback
+        self.enabled = True
+        # par étape : [durée (s), nombre d'appels, octets]
+        self.stages = {}
+        # par flag : [nombre de chunks, octets]
+        self.flags = {}
+        self.start = perf_counter()
+        self.total = None
+
+    def stage(self, _name, _bytes=0):
+        """Function that gives a context manager timing a stage.
+
+        Args:
+            _name (string): name of the stage
+            _bytes (int): number of bytes processed
+
+        Returns:
+            context manager
+        """
+        return _stage(self, _name, _bytes)
+
+    def add(self, _name, _duration, _bytes=0, _calls=1):
+        """Function that adds a measure to a stage.
+
+        Args:
+            _name (string): name of the stage
+            _duration (float): duration (s)
+            _bytes (int): number of bytes processed
+            _calls (int): number of calls
+
+        Returns:
+            None
+        """
+        stage = self.stages.get(_name)
+        if stage is None:
+            stage = self.stages[_name] = [0., 0, 0]
+        stage[0] += _duration
+        stage[1] += _calls
+        stage[2] += _bytes
+
+    def count_chunk(self, _flag, _size):
+        """Function that counts a chunk read.
+
+        Args:
+            _flag (int): flag of the chunk
+            _size (int): size of the data of the chunk
+
+        Returns:
+            None
+        """
+        flag = self.flags.get(_flag)
+        if flag is None:
+            flag = self.flags[_flag] = [0, 0]
+        flag[0] += 1
+        flag[1] += _size
+
+    def merge(self, _report):
+        """Function that adds the measures of a report (e.g. of a worker process, see ubt_raw_shard).
+
+        Args:
+            _report (dict): report given by report()
+
+        Returns:
+            None
+        """
+        for name, stage in _report["stages"].items():
+            self.add(name, stage["time"], stage["bytes"], stage["calls"])
+        for flag, count in _report["flags"].items():
+            current = self.flags.setdefault(flag, [0, 0])
+            current[0] += count["chunks"]
+            current[1] += count["bytes"]
+
+    def report(self):
+        """Function that gives the measures.
+
+        Returns:
+            dict with keys
+                "total": duration of the extraction (s), or time since the creation of the object if it is not ended,
+                "stages": dict by stage of dicts with keys "time" (s), "calls", "bytes",
+                "flags": dict by flag of dicts with keys "chunks", "bytes"
+        """
+        return {
+            "total": perf_counter() - self.start if self.total is None else self.total,
+            "stages": {name: {"time": stage[0], "calls": stage[1], "bytes": stage[2]} for name, stage in self.stages.items()},
+            "flags": {flag: {"chunks": count[0], "bytes": count[1]} for flag, count in self.flags.items()},
+        }
+
+    def end(self):
+        """Function that ends the measures and gives the report to the callback.
+
+        Returns:
+            report (dict), see report()
+        """
+        self.total = perf_counter() - self.start
+        report = self.report()
+        if self.callback is not None:
+            self.callback(report)
+        return report
+
+    def __str__(self):
+        report = self.report()
+        lines = ["total: %.3f s" % report["total"]]
+        for name, stage in sorted(report["stages"].items(), key=lambda item: -item[1]["time"]):
+            lines.append("%-12s %9.3f s %9d calls %12d bytes" % (name, stage["time"], stage["calls"], stage["bytes"]))
+        for flag, count in sorted(report["flags"].items()):
+            lines.append("flag %-7d %9d chunks %12d bytes" % (flag, count["chunks"], count["bytes"]))
+        return "\n".join(lines)
+
+
+class ubt_null_stats:
+    """Stats object doing nothing, used when the measures are disabled (the cost is an empty context manager by stage)."""
+    enabled = False
+    callback = None
+
+    _stage = nullcontext()
+
+    def stage(self, _name, _bytes=0):
+        return self._stage
+
+    def add(self, _name, _duration, _bytes=0, _calls=1):
+        pass
+
+    def count_chunk(self, _flag, _size):
+        pass
+
+    def merge(self, _report):
+        pass
+
+    def report(self):
+        return None
+
+    def end(self):
+        return None
+
+
+NULL_STATS = ubt_null_stats()
+
+
+def get_stats(_stats):
+    """Function that gives the stats object of an extraction.
+
+    Args:
+        _stats: None to disable the measures, a ubt_stats object to collect them,
+            or a function called with the report at the end of the extraction (see ubt_stats.report)
+
+    Returns:
+        ubt_stats or NULL_STATS
+    """
+    if _stats is None:
+        return NULL_STATS
+    if isinstance(_stats, (ubt_stats, ubt_null_stats)):
+        return _stats
+    if callable(_stats):
+        return ubt_stats(_stats)
+    raise Exception('stats', "unexpected stats argument %r" % (_stats,))
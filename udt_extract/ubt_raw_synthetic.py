@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: UTF_8 -*-
+
+# @copyright  this code is the property of Ubertone.
+# You may use this code for your personal, informational, non-commercial purpose.
+# You may not distribute, transmit, display, reproduce, publish, license, create derivative works from, transfer or sell any information, software, products or services based on this code.
+
+# génération de fichiers raw.udt (UDT005) synthétiques, pour les tests et les mesures de performance
+
+import json
+from datetime import datetime
+from struct import Struct
+
+import numpy as np
+
+from .date_parser import timestamp_epoch
+from .ubt_raw_file import CHUNK_HEAD, HEADER_SIZE
+from .ubt_raw_flag import *
+
+# maximum size of the data of a chunk (size written on 16 bits)
+MAX_CHUNK_SIZE = 0xFFFF
+
+# profile types: flag of the chunks and number of values by cell
+PROFILE_TYPES = {
+    "avg": (PROFILE_TAG, 4),
+    "inst": (PROFILE_INST_TAG, 3),
+    "iq": (PROFILE_INST_IQ_TAG, 3),
+}
+
+# ref, timestamp (high and low words of the seconds, milliseconds) and scalars (pitch, roll, temp, sound_speed, gain_ca0, gain_ca1)
+PROFILE_HEAD = Struct('hHHhhhhhhh')
+
+BOARDS = {
+    "apf04": {
+        "header": "UDT005 R0W/APF04 2.01.00/52/91",
+        "product_model": "UB-Lab P",
+        "apf_handler": "apf04_handler",
+        "board_version": "R0W/APF04",
+        "f0": 2000000.0,
+        # config chunk (17 int16), the last two are blind_ca0 and blind_ca1
+        "config": (17, 128, 2500, 14, 173, 46, 14, 205, 0, 0, -7335, 772, 0, 0, 10, 175, 2496),
+    },
+    "apf06": {
+        "header": "UDT005 PC/APF06 2.02.00/none/none",
+        "product_model": "UB-Lab 3C",
+        "apf_handler": "apf06_handler",
+        "board_version": "PC/APF06",
+        "f0": 1000000.0,
+        # config chunk (14 int16)
+        "config": (35, 128, 1665, 4, 200, 5, 3, 32767, 0, 32767, 0, 286, 4, -16039),
+    },
+}
+
+DEFAULT_START = datetime(2024, 1, 1)
+
+
+def synthetic_const(_board, _n_configs, _n_channels):
+    """Function that gives the const dict of a synthetic file.
+
+    Args:
+        _board (string): "apf04" or "apf06"
+        _n_configs (int): number of configurations
+        _n_channels (int): number of receiving channels (apf06)
+
+    Returns:
+        const (dict)
+    """
+    board = BOARDS[_board]
+    if _board == "apf04":
+        # one transducer (emitting and receiving) per configuration
+        route = {"tr%d" % (tr + 1): {"board_addr": 4, "channel": tr} for tr in range(_n_configs)}
+    else:
+        route = {"tr0": {"channel": 0, "receivers": ["tr%d" % (tr + 1) for tr in range(_n_channels)]}}
+    return {
+        "const_version": 1.2,
+        "product_model": board["product_model"],
+        "serial_num": "000000",
+        "product_id": "synthetic",
+        "apf_handler": board["apf_handler"],
+        "gain_blind_zone": {"a0_max": -5, "a1_max": 1200},
+        "sound_speed_constants": {"a0": 1402.385, "a1": 5.038813, "a2": -0.05799136, "a3": 0.0003287156,
+                                  "a4": -1.398845e-06, "a5": 2.78786e-09},
+        "software": {"webui_version": board["header"].split(" ")[2].split("/")[0], "webui_sha": "synthetic"},
+        "hardware": {
+            "board_version": board["board_version"],
+            "f_sys": 36000000.0,
+            "max_configs": max(3, _n_configs),
+            "n_boards": 1,
+            "route": route,
+            "n_profile": {"min": 1, "max": 65000, "default": 30},
+            "f0": {"min": 25000, "max": 6000000.0, "default": board["f0"]},
+            "r_em": {"min": 0, "max": 200, "default": 0.01},
+            "r_vol1": {"min": 0, "max": 10, "default": 0.01},
+            "r_dvol": {"min": 0.00073, "max": 2, "default": 0.01},
+            "prf": {"min": 1, "max": 10000, "default": 800},
+            "n_vol": {"min": 2, "max": 200, "default": 50},
+            "n_ech": {"min": 2, "max": 128, "default": 64},
+            "a0": {"min": 13.72, "max": 61.73, "default": 60},
+            "a1": {"min": 0, "max": 1000, "default": 0},
+            "v_min": {"min": -10, "max": 10, "default": 0},
+        },
+    }
+
+
+def synthetic_settings(_board, _n_configs, _n_channels, _n_cells, _n_p, _n_avg, _ref=666):
+    """Function that gives the settings dict of a synthetic file.
+
+    Args:
+        _board (string): "apf04" or "apf06"
+        _n_configs (int): number of configurations
+        _n_channels (int): number of receiving channels (apf06)
+        _n_cells (int): number of cells
+        _n_p (int): number of samples (n_ech)
+        _n_avg (int): number of averaged profiles (n_profile)
+        _ref (int): reference of the settings
+
+    Returns:
+        settings (dict)
+    """
+    configs = {}
+    for config in range(_n_configs):
+        params = {
+            "f0": BOARDS[_board]["f0"],
+            "prf": 800.0,
+            "r_vol1": 0.02,
+            "r_dvol": 0.005,
+            "n_vol": _n_cells,
+            "r_em": 0.005,
+            "n_ech": _n_p,
+            "method": "ppc_cont",
+            "phase_coding": True,
+            "static_echo_filter": False,
+            "gain_function": {"auto": True, "a0": 20.0, "a1": 0.0},
+            "n_profile": _n_avg,
+            "v_min": -0.1,
+        }
+        if _board == "apf04":
+            params["tr_out"] = "tr%d" % (config + 1)
+        else:
+            params["tr_out"] = "tr0"
+            params["tr_in"] = ["tr%d" % (tr + 1) for tr in range(_n_channels)]
+        configs["num%d" % (config + 1)] = params
+    return {
+        "configs": configs,
+        "global": {
+            "comments": "synthetic",
+            "configuration_order": sorted(configs),
+            "operator": "",
+            "ref": {"method": "auto", "value": _ref},
+            "sound_speed": {"source": "temperature", "temperature": 25.0, "value": 1496.7277076171874},
+            "trigger_mode": "none",
+        },
+    }
+
+
+def write_chunk(_fd, _flag, _data):
+    if len(_data) > MAX_CHUNK_SIZE:
+        raise Exception('chunk', "chunk of %d bytes (flag %d) larger than %d bytes, reduce the number of cells, channels or samples"
+                        % (len(_data), _flag, MAX_CHUNK_SIZE))
+    _fd.write(CHUNK_HEAD.pack(_flag, len(_data)))
+    _fd.write(_data)
+
+
+def write_synthetic(_raw_file, _board="apf04", _n_configs=1, _n_channels=None, _n_cells=50, _profile_type=None,
+                    _n_profiles=None, _size=None, _n_p=32, _n_avg=10, _interval=0.1, _start=DEFAULT_START, _seed=0):
+    """Function that writes a synthetic raw.udt file (UDT005), readable by raw_extract, with random cell values.
+    The profiles of the configurations are written in turn, one every _interval seconds.
+
+    Args:
+        _raw_file (string): file path of the raw.udt file written
+        _board (string): "apf04" (UB-Lab P, one transducer per configuration) or "apf06" (UB-Lab 3C, several receivers)
+        _n_configs (int): number of configurations
+        _n_channels (int): number of receiving channels of each configuration (apf06 only, 4 by default)
+        _n_cells (int): number of cells of the profiles
+        _profile_type (string): "avg" (averaged profiles, apf04), "inst" (instantaneous profiles, apf06)
+            or "iq" (instantaneous profiles with IQ samples, apf06), by default "avg" for apf04 and "inst" for apf06
+        _n_profiles (int): number of profiles written
+        _size (int): approximate size of the file (in bytes), instead of _n_profiles
+        _n_p (int): number of IQ samples by cell
+        _n_avg (int): number of averaged profiles (settings)
+        _interval (float): time between two profiles (in s)
+        _start (datetime): date of the first profile
+        _seed (int): seed of the random values
+
+    Returns:
+        number of profiles written
+    """
+    if _board not in BOARDS:
+        raise Exception('board', "unknown board %s (apf04 or apf06)" % _board)
+    if _profile_type is None:
+        _profile_type = "avg" if _board == "apf04" else "inst"
+    # ubt_raw_data gives the datatypes of the averaged profiles for the apf04 and of the instantaneous profiles for the apf06
+    if (_profile_type == "avg") != (_board == "apf04"):
+        raise Exception('profile type', "%s profiles are not decoded for the %s board" % (_profile_type, _board))
+    if _board == "apf04":
+        if _n_channels not in (None, 1):
+            raise Exception('channels', "one receiving channel per configuration for the apf04 board")
+        _n_channels = 1
+    elif _n_channels is None:
+        _n_channels = 4
+    if not 1 <= _n_configs <= 9:
+        raise Exception('configs', "1 to 9 configurations")
+    flag, data_per_cell = PROFILE_TYPES[_profile_type]
+
+    settings = synthetic_settings(_board, _n_configs, _n_channels, _n_cells, _n_p, _n_avg)
+    ref = settings["global"]["ref"]["value"] << 4
+
+    # taille des profils, pour le nombre de profils à écrire
+    scalars_size = PROFILE_HEAD.size + 4 * _n_channels
+    cells_count = data_per_cell * _n_cells * _n_channels
+    iq_count = _n_p * _n_cells * _n_channels * 2 + 2 if _profile_type == "iq" else 0
+    profile_size = CHUNK_HEAD.size + scalars_size + 2 * (cells_count + iq_count)
+    if _n_profiles is None:
+        if _size is None:
+            raise Exception('size', "give the number of profiles or the size of the file")
+        _n_profiles = max(1, int(_size - HEADER_SIZE) // profile_size)
+
+    rng = np.random.default_rng(_seed)
+    # secondes depuis l'origine des timestamps, en ms
+    start = (np.datetime64(_start, "ms") - timestamp_epoch().astype("datetime64[ms]")).astype(np.int64)
+    if start < 0:
+        raise Exception('start', "date before the origin of the timestamps (%s)" % timestamp_epoch())
+
+    with open(_raw_file, 'wb') as fd:
+        fd.write(BOARDS[_board]["header"].encode().ljust(HEADER_SIZE, b'\x00'))
+        write_chunk(fd, CONST_TAG, json.dumps(synthetic_const(_board, _n_configs, _n_channels)).encode())
+        write_chunk(fd, SETTINGS_JSON_TAG, json.dumps(settings).encode())
+        for _ in range(_n_configs):
+            config = BOARDS[_board]["config"]
+            write_chunk(fd, CONFIG_TAG, Struct('%dh' % len(config)).pack(*config))
+
+        # les valeurs aléatoires sont tirées par paquets de profils
+        batch = 256
+        for first in range(0, _n_profiles, batch):
+            count = min(batch, _n_profiles - first)
+            cells = rng.integers(0, 4096, (count, cells_count), dtype=np.int16)
+            noise = rng.integers(0, 100, (count, 2 * _n_channels), dtype=np.int16)
+            if iq_count:
+                iq = rng.integers(-2048, 2048, (count, iq_count), dtype=np.int16)
+            for rank in range(count):
+                profile = first + rank
+                milliseconds = start + int(round(profile * _interval * 1000))
+                seconds = milliseconds // 1000
+                data = PROFILE_HEAD.pack(ref | (profile % _n_configs),
+                                         seconds >> 16, seconds & 0xFFFF,
+                                         milliseconds % 1000,
+                                         0, 0, 200, 1497, 900, 40) + noise[rank].tobytes() + cells[rank].tobytes()
+                if iq_count:
+                    data += iq[rank].tobytes()
+                write_chunk(fd, flag, data)
+    print("%s: %d %s profiles written (%s, %d configs, %d channels, %d cells)"
+          % (_raw_file, _n_profiles, _profile_type, _board, _n_configs, _n_channels, _n_cells))
+    return _n_profiles
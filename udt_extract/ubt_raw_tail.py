@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: UTF_8 -*-
+
+# @copyright  this code is the property of Ubertone.
+# You may use this code for your personal, informational, non-commercial purpose.
+# You may not distribute, transmit, display, reproduce, publish, license, create derivative works from, transfer or sell any information, software, products or services based on this code.
+
+# lecture incrémentale d'un fichier raw.udt en cours d'écriture par l'instrument
+
+import os
+import time
+
+from .ubt_raw_decoder import ubt_raw_decoder, DEFAULT_BATCH_SIZE
+from .ubt_raw_file import HEADER_SIZE, ubt_raw_file
+from .ubt_raw_flag import *
+
+DEFAULT_POLL_INTERVAL = 1. # s
+
+
+class ubt_raw_tail:
+    def __init__(self, _raw_file, _per_profile=True, **_kwargs):
+        """Function that initiates a ubt_raw_tail object which reads a raw.udt file while it is being written.
+        Each poll decodes only the chunks appended since the previous one: the file reader (which stops at the end
+        of the last complete chunk) and the const/settings/config state (ubt_raw_decoder) are kept between the polls,
+        and an incomplete chunk at the end of the file is left for the next poll.
+
+        Args:
+            _raw_file (string): file path of raw.udt file
+            _per_profile (bool): one record per profile and channel, instead of one per batch (see ubt_raw_decoder.split_records)
+            _kwargs: selection of the data (_time_begin, _time_end, _configs, _channels, _datatypes, _iq, _iq_complex, see ubt_raw_decoder)
+
+        Returns:
+            None
+        """
+        self.raw_file = _raw_file
+        self.per_profile = _per_profile
+        self.decoder = ubt_raw_decoder(DEFAULT_BATCH_SIZE, **_kwargs)
+        # opened when the header is written
+        self.fileraw = None
+
+    def poll(self):
+        """Function that decodes the complete chunks appended to the file since the previous poll.
+
+        Returns:
+            list of the records of the new profiles (see ubt_raw_decoder.split_records), empty if there is no new profile
+        """
+        if self.fileraw is None:
+            if not os.path.isfile(self.raw_file) or os.path.getsize(self.raw_file) < HEADER_SIZE:
+                return []
+            self.fileraw = ubt_raw_file(self.raw_file)
+        elif not self.fileraw.remap():
+            return []
+
+        records = []
+        while self.fileraw.chunk_available():
+            flag, size, data = self.fileraw.read_chunk()
+            if flag not in PROFILE_FLAGS:
+                # profils en attente donnés avec les settings et configs en cours
+                records += self.decoder.split_records(self.decoder.flush(), self.per_profile)
+            records += self.decoder.split_records(self.decoder.read_chunk(flag, size, data, self.fileraw.position-size), self.per_profile)
+        records += self.decoder.split_records(self.decoder.flush(), self.per_profile)
+        # the decoded chunks are not needed any more
+        self.fileraw.release()
+        return records
+
+    def follow(self, _interval=DEFAULT_POLL_INTERVAL, _timeout=None, _wait=None):
+        """Generator which yields the new profiles as the file is written.
+
+        Args:
+            _interval (float): time between two polls (s) when there is no new data
+            _timeout (float): stop when there has been no new data for this time (s), None to follow the file without end
+            _wait (function): function called instead of sleeping between two polls, with the interval as argument
+                (e.g. to wake up on a file system notification), it can return before the interval
+
+        Yields:
+            records of the new profiles (see ubt_raw_decoder.split_records)
+        """
+        wait = _wait or time.sleep
+        last_data = time.monotonic()
+        while True:
+            records = self.poll()
+            if records:
+                last_data = time.monotonic()
+                yield from records
+                continue
+            if _timeout is not None and time.monotonic() - last_data > _timeout:
+                return
+            wait(_interval)
+
+    def close(self):
+        """Function that closes the file.
+
+        Returns:
+            None
+        """
+        if self.fileraw is not None:
+            self.fileraw.close()
+            self.fileraw = None